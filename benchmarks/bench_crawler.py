@@ -0,0 +1,199 @@
+# bench_crawler.py
+# Benchmark de extremo a extremo sin red: OnionScraper rastrea sitios sintéticos
+# servidos en local, clasifica con TextClassifier contra un servidor de chat
+# completions falso y guarda con DatabaseManager sobre una conexión sustituta.
+# Los servidores corren en otro proceso para no competir por la CPU medida.
+#
+#   python -m benchmarks.bench_crawler [--sites 2] [--pages 200] [--mode async] \
+#       [--llm-latency-ms 300] [--output resultado.json] [--compare base.json]
+#
+# El JSON incluye el commit, los parámetros, páginas/s, p50/p99 por etapa y la
+# memoria máxima, para comparar ejecuciones entre commits.
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import Config
+from scraping.db_pool import PooledDatabase
+from scraping.fetcher import Fetcher, CircuitPool, Circuit
+from scraping.metrics import metrics
+from scraping.onion_scraper import OnionScraper
+from scraping.text_classifier import TextClassifier, RateLimiter
+
+from benchmarks.standins import StandInPool, serve_standins
+
+STAGES = ('descarga', 'parseo', 'idioma', 'ner', 'clasificacion', 'escritura')
+
+
+def percentile(values, fraction):
+    # Percentil por rango más cercano sobre los valores ordenados
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def peak_rss_mb():
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def stage_report():
+    samples = metrics.raw_samples('indexador_etapa_segundos')
+    report = {}
+    for stage in STAGES:
+        values = samples.get((('etapa', stage),), [])
+        if not values:
+            continue
+        report[stage] = {
+            'llamadas': len(values),
+            'total_s': round(sum(values), 4),
+            'media_ms': round(sum(values) / len(values) * 1000, 3),
+            'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        }
+    return report
+
+
+def start_standins(args):
+    # 'spawn' para que el proceso de servidores no herede el estado del rastreador
+    context = multiprocessing.get_context('spawn')
+    parent, child = context.Pipe()
+    stop = context.Event()
+    process = context.Process(target=serve_standins, daemon=True, args=(
+        args.sites, args.pages, args.links, args.page_kb * 1024, args.graph, args.site_latency_ms / 1000,
+        args.llm_latency_ms / 1000, args.llm_jitter_ms / 1000, args.seed, child, stop))
+    process.start()
+    return process, parent, stop, parent.recv()
+
+
+def run(args):
+    Config.WRITE_BEHIND_ENABLED = args.write_behind
+    Config.NLP_PROCESSES = args.nlp_processes
+    Config.FRONTIER_BACKEND = 'memory'
+    Config.CRAWL_CONCURRENCY = args.concurrency
+    Config.CRAWL_PATTERN_BUDGET = max(Config.CRAWL_PATTERN_BUDGET, args.pages + 1)
+    metrics.keep_raw_samples()
+
+    process, channel, stop, ports = start_standins(args)
+    db_pool = StandInPool(latency=args.db_latency_ms / 1000)
+    # Límites del LLM muy altos: se mide el pipeline, no el cubo de fichas
+    classifier = TextClassifier(url=f"http://127.0.0.1:{ports['llm']}/v1/chat/completions",
+                                rate_limiter=RateLimiter(10 ** 6, 10 ** 9))
+    fetcher = Fetcher(CircuitPool([Circuit('directo', None)]))
+
+    progress = {}
+    rss_before = peak_rss_mb()
+    start_time = time.perf_counter()
+    for port in ports['sites']:
+        scraper = OnionScraper(f'http://127.0.0.1:{port}/', Config.PROXY_HOST, Config.PROXY_PORT,
+                               PooledDatabase(db_pool), classifier, max_depth=args.max_depth, mode=args.mode,
+                               fetcher=fetcher)
+        scraper.scrape()
+        for name, value in scraper.progress.items():
+            if isinstance(value, (int, float)):
+                progress[name] = progress.get(name, 0) + value
+    elapsed = time.perf_counter() - start_time
+
+    stop.set()
+    llm_stats = channel.recv()
+    process.join(timeout=5)
+
+    pages = progress.get('paginas_procesadas', 0)
+    return {
+        'commit': current_commit(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'parametros': vars(args),
+        'resultados': {
+            'paginas': pages,
+            'segundos': round(elapsed, 3),
+            'paginas_por_segundo': round(pages / elapsed, 3) if elapsed else None,
+            'etapas': stage_report(),
+            'memoria_maxima_mb': round(peak_rss_mb(), 1),
+            'memoria_inicial_mb': round(rss_before, 1),
+            'progreso': progress,
+            'peticiones_llm': llm_stats['llm_requests'],
+            'base_de_datos': dict(db_pool.stats),
+        }
+    }
+
+
+def print_summary(report, baseline=None):
+    results = report['resultados']
+    base = baseline['resultados'] if baseline else None
+    if baseline:
+        differing = [name for name, value in report['parametros'].items()
+                     if name not in ('output', 'compare') and baseline['parametros'].get(name) != value]
+        if differing:
+            print(f"Aviso: parámetros distintos de la ejecución base: {', '.join(differing)}", file=sys.stderr)
+
+    def delta(value, previous):
+        if previous in (None, 0) or value is None:
+            return ''
+        return f"  ({(value - previous) / previous * 100:+.1f}% vs {baseline['commit'] or 'base'})"
+
+    print(f"{results['paginas']} páginas en {results['segundos']:.2f} s: "
+          f"{results['paginas_por_segundo']:.2f} páginas/s"
+          f"{delta(results['paginas_por_segundo'], base and base['paginas_por_segundo'])}", file=sys.stderr)
+    print(f"{'etapa':<14}{'llamadas':>9}{'p50 ms':>10}{'p99 ms':>10}{'total s':>10}", file=sys.stderr)
+    for stage, values in results['etapas'].items():
+        previous = base['etapas'].get(stage, {}).get('p50_ms') if base else None
+        print(f"{stage:<14}{values['llamadas']:>9}{values['p50_ms']:>10.2f}{values['p99_ms']:>10.2f}"
+              f"{values['total_s']:>10.2f}{delta(values['p50_ms'], previous)}", file=sys.stderr)
+    print(f"Memoria máxima: {results['memoria_maxima_mb']:.1f} MiB; peticiones al LLM: {results['peticiones_llm']}; "
+          f"sentencias SQL: {results['base_de_datos']['sentencias']}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sites', type=int, default=2)
+    parser.add_argument('--pages', type=int, default=200, help='páginas por sitio')
+    parser.add_argument('--links', type=int, default=8, help='enlaces por página')
+    parser.add_argument('--page-kb', type=int, default=20, help='tamaño aproximado de cada página')
+    parser.add_argument('--graph', choices=('random', 'powerlaw'), default='random')
+    parser.add_argument('--max-depth', type=int, default=10)
+    parser.add_argument('--mode', choices=('serial', 'async'), default='async')
+    parser.add_argument('--concurrency', type=int, default=Config.CRAWL_CONCURRENCY)
+    parser.add_argument('--site-latency-ms', type=float, default=0, help='latencia de cada página (p. ej. la de Tor)')
+    parser.add_argument('--llm-latency-ms', type=float, default=300)
+    parser.add_argument('--llm-jitter-ms', type=float, default=50)
+    parser.add_argument('--db-latency-ms', type=float, default=0.5, help='coste de cada sentencia SQL')
+    parser.add_argument('--write-behind', action='store_true')
+    parser.add_argument('--nlp-processes', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='fichero JSON de resultados (por defecto, la salida estándar)')
+    parser.add_argument('--compare', help='JSON de una ejecución anterior con el que comparar')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    report = run(args)
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_summary(report, baseline)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
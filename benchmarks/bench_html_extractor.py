@@ -0,0 +1,112 @@
+# bench_html_extractor.py
+# Micro-benchmark de extracción de HTML sobre un corpus fijo (semilla constante).
+# Compara la ruta original (BeautifulSoup + find_all repetidos + enqueue_links) con
+# los extractores de una sola pasada.
+#
+#   python -m benchmarks.bench_html_extractor [--pages 200] [--repeat 3]
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urljoin
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bs4 import BeautifulSoup
+
+from scraping.html_extractor import SoupExtractor, SinglePassExtractor, extract_from_soup, etree
+
+BASE_URL = 'http://benchmarkexample.onion/'
+WORDS = ("mercado foro bitcoin acceso usuario producto envío contacto normas registro "
+         "servicio anuncio precio tienda soporte noticias privacidad cuenta").split()
+
+
+def build_corpus(pages, seed=42):
+    rng = random.Random(seed)
+
+    def sentence():
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 25)))
+
+    def block(depth):
+        if depth > 3 or rng.random() < 0.3:
+            return f"<p>{sentence()} <span>{sentence()}</span></p>"
+        children = ''.join(block(depth + 1) for _ in range(rng.randint(1, 4)))
+        return f"<div class=\"d{depth}\">{children}</div>"
+
+    corpus = []
+    for n in range(pages):
+        links = ''.join(f'<li><a href="/pagina/{rng.randint(0, 5000)}?p={rng.randint(0, 9)}">{rng.choice(WORDS)}</a></li>'
+                        for _ in range(rng.randint(20, 150)))
+        external = ''.join(f'<a href="http://otro{rng.randint(0, 50)}.onion/">externo</a>' for _ in range(rng.randint(0, 10)))
+        images = ''.join(f'<img src="/img/{rng.randint(0, 999)}.jpg">' for _ in range(rng.randint(0, 15)))
+        body = ''.join(block(0) for _ in range(rng.randint(5, 40)))
+        corpus.append(
+            f"<!DOCTYPE html><html><head><title>Página {n}</title>"
+            f"<meta name=\"description\" content=\"{sentence()}\"><meta name=\"keywords\" content=\"{sentence()}\">"
+            f"<link rel=\"stylesheet\" href=\"/css/{n}.css\"><script src=\"/js/{n}.js\"></script>"
+            f"<script>var x = '{sentence()}';</script><style>p {{ color: red; }}</style></head>"
+            f"<body><ul>{links}</ul>{body}{external}{images}</body></html>"
+        )
+    return corpus
+
+
+def legacy_path(url, html):
+    # Reproduce el camino previo: parseo con html.parser, extracción y un segundo
+    # recorrido de los enlaces en enqueue_links
+    soup = BeautifulSoup(html, 'html.parser')
+    result = extract_from_soup(url, soup, 'benchmarkexample.onion')
+    anchors = [urljoin(url, a['href']) for a in soup.find_all('a', href=True)]
+    return result, anchors
+
+
+def run(name, func, corpus, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for n, html in enumerate(corpus):
+            func(f'{BASE_URL}pagina/{n}', html)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    per_page = best / len(corpus) * 1000
+    print(f"{name:<32} {best:8.3f} s  {per_page:8.3f} ms/página")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.pages)
+    size = sum(len(html) for html in corpus)
+    print(f"Corpus: {len(corpus)} páginas, {size / 1024 / 1024:.1f} MiB")
+
+    candidates = [('original (bs4 html.parser x2)', legacy_path),
+                  ('soup html.parser', lambda url, html: SoupExtractor('html.parser').extract(url, html, 'benchmarkexample.onion')),
+                  ('una pasada html.parser', lambda url, html: SinglePassExtractor('html.parser').extract(url, html, 'benchmarkexample.onion'))]
+    if etree is not None:
+        candidates += [('soup lxml', lambda url, html: SoupExtractor('lxml').extract(url, html, 'benchmarkexample.onion')),
+                       ('una pasada lxml', lambda url, html: SinglePassExtractor('lxml').extract(url, html, 'benchmarkexample.onion'))]
+
+    baseline = None
+    timings = []
+    for name, func in candidates:
+        elapsed = run(name, func, corpus, args.repeat)
+        baseline = baseline or elapsed
+        timings.append((name, elapsed))
+    print()
+    for name, elapsed in timings:
+        print(f"{name:<32} x{baseline / elapsed:5.2f}")
+
+    # Comprobación de equivalencia en enlaces y tamaño del texto extraído
+    legacy, _ = legacy_path(BASE_URL + 'pagina/0', corpus[0])
+    fast = SinglePassExtractor('html.parser').extract(BASE_URL + 'pagina/0', corpus[0], 'benchmarkexample.onion')
+    assert legacy['enlaces'] == fast['enlaces'], "Los enlaces extraídos no coinciden"
+    print(f"\nTexto extraído de la página 0: original {len(legacy['texto'])} caracteres, "
+          f"una pasada {len(fast['texto'])} caracteres (sin duplicados por anidamiento)")
+
+
+if __name__ == '__main__':
+    main()
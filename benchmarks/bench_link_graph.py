@@ -0,0 +1,140 @@
+# bench_link_graph.py
+# Benchmark del grafo de enlaces sobre un grafo sintético (por defecto un millón de
+# aristas con grado de entrada de ley de potencias): carga página a página,
+# compactación a CSR, PageRank vectorizado y grado de entrada, más la memoria de los
+# arrays. Como referencia se mide una iteración de PageRank con listas de Python.
+#
+#   python -m benchmarks.bench_link_graph [--nodes 100000] [--edges 1000000] \
+#       [--updates 10000] [--output resultado.json]
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import Config
+from scraping.link_graph import LinkGraph
+
+from benchmarks.bench_crawler import current_commit, peak_rss_mb
+
+
+def synthetic_links(nodes, edges, seed):
+    # Grado de salida de Poisson y destinos con probabilidad ~ 1/rango (ley de potencias)
+    rng = np.random.default_rng(seed)
+    out_degree = rng.poisson(edges / nodes, nodes)
+    weights = 1.0 / np.arange(1, nodes + 1)
+    targets = rng.choice(nodes, size=int(out_degree.sum()), p=weights / weights.sum()).astype(np.int32)
+    return np.split(targets, np.cumsum(out_degree)[:-1])
+
+
+def python_pagerank_iteration(adjacency, rank, damping):
+    n = len(rank)
+    new_rank = [0.0] * n
+    dangling = 0.0
+    for source, targets in enumerate(adjacency):
+        if targets:
+            share = rank[source] / len(targets)
+            for target in targets:
+                new_rank[target] += share
+        else:
+            dangling += rank[source]
+    return [damping * (value + dangling / n) + (1 - damping) / n for value in new_rank]
+
+
+def timed(function, *args):
+    start_time = time.perf_counter()
+    value = function(*args)
+    return value, time.perf_counter() - start_time
+
+
+def run(args):
+    Config.LINK_GRAPH_COMPACT_EDGES = args.compact_edges
+    links = synthetic_links(args.nodes, args.edges, args.seed)
+    graph = LinkGraph()
+    for node in range(args.nodes):
+        graph.node_id(f'http://sitio{node % 50}.onion/pagina/{node}')
+
+    # Carga como la hace save_pages: una página cada vez, con destinos ya deduplicados
+    def load():
+        for source, targets in enumerate(links):
+            targets = np.unique(targets[targets != source])
+            with graph.lock:
+                graph.set_link_ids(source, targets)
+        graph.compact()
+    _, load_s = timed(load)
+
+    (indptr, indices, crawled, urls, _), snapshot_s = timed(graph.snapshot)
+    (rank, iterations), pagerank_s = timed(LinkGraph.pagerank, indptr, indices)
+    in_degree, in_degree_s = timed(LinkGraph.in_degree, indices, len(urls))
+
+    # Actualización incremental: se reescriben los enlaces de --updates páginas y se recalcula
+    rng = np.random.default_rng(args.seed + 1)
+    def update():
+        for source in rng.choice(args.nodes, size=args.updates, replace=False):
+            with graph.lock:
+                graph.set_link_ids(int(source), np.unique(rng.choice(args.nodes, size=len(links[source]))).astype(np.int32))
+        graph.compact()
+    _, update_s = timed(update)
+
+    adjacency = [targets.tolist() for targets in np.split(indices, indptr[1:-1])]
+    uniform = [1.0 / args.nodes] * args.nodes
+    _, python_iteration_s = timed(python_pagerank_iteration, adjacency, uniform, Config.LINK_GRAPH_DAMPING)
+
+    top = np.argsort(rank)[::-1][:5]
+    return {
+        'commit': current_commit(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'parametros': vars(args),
+        'resultados': {
+            'nodos': len(urls),
+            'aristas': int(len(indices)),
+            'carga_s': round(load_s, 3),
+            'instantanea_s': round(snapshot_s, 4),
+            'pagerank_s': round(pagerank_s, 3),
+            'pagerank_iteraciones': iterations,
+            'pagerank_ms_por_iteracion': round(pagerank_s / iterations * 1000, 2),
+            'grado_entrada_s': round(in_degree_s, 4),
+            'actualizacion_s': round(update_s, 3),
+            'python_ms_por_iteracion': round(python_iteration_s * 1000, 2),
+            'csr_mb': round((indptr.nbytes + indices.nbytes) / 2 ** 20, 2),
+            'memoria_maxima_mb': round(peak_rss_mb(), 1),
+            'mejores': [{'url': urls[node], 'pagerank': float(rank[node]), 'enlaces_entrantes': int(in_degree[node])}
+                        for node in top],
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--nodes', type=int, default=100000)
+    parser.add_argument('--edges', type=int, default=1000000)
+    parser.add_argument('--updates', type=int, default=10000, help='páginas reescritas tras la carga')
+    parser.add_argument('--compact-edges', type=int, default=Config.LINK_GRAPH_COMPACT_EDGES)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='fichero JSON de resultados (por defecto, la salida estándar)')
+    args = parser.parse_args()
+
+    report = run(args)
+    results = report['resultados']
+    print(f"{results['nodos']} nodos, {results['aristas']} aristas; carga {results['carga_s']:.2f} s, "
+          f"PageRank {results['pagerank_s']:.2f} s en {results['pagerank_iteraciones']} iteraciones "
+          f"({results['pagerank_ms_por_iteracion']:.1f} ms/iteración frente a "
+          f"{results['python_ms_por_iteracion']:.0f} ms con listas de Python); CSR {results['csr_mb']:.1f} MiB",
+          file=sys.stderr)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+# bench_storage.py
+# Compara el formato de almacenamiento anterior (uuid4 en CHAR(36), URL repetida en
+# cada tabla, texto en claro) con el compacto (migración 10): inserta las mismas
+# páginas sintéticas en dos bases de datos de prueba y mide páginas/s al escribir y
+# el espacio en disco de cada tabla. Necesita un servidor MySQL y un usuario con
+# permiso para crear bases de datos (las de la prueba se borran al empezar):
+#
+#   python -m benchmarks.bench_storage [--pages 20000] [--batch 50] [--text-kb 8] \
+#       [--database-prefix bench_almacenamiento] [--output resultado.json]
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import mysql.connector
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import Config
+from scraping.database_manager import DatabaseManager
+from scraping.migrations import run_migrations
+from scraping.storage_migration import table_sizes, COMPACT_TABLES
+from scraping.urls import normalize_host
+
+from benchmarks.bench_crawler import current_commit
+from benchmarks.standins import WORDS
+
+# Última versión del esquema con el formato anterior
+LEGACY_VERSION = 9
+
+
+def synthetic_pages(count, text_kb, links, link_pool, hosts, seed):
+    # Enlaces tomados de un conjunto limitado de URLs, como en un sitio real donde
+    # la navegación se repite en todas las páginas
+    rng = random.Random(seed)
+    pool = [f'http://{"x" * 40}{n % hosts}.onion/foro/tema/{n}' for n in range(link_pool)]
+    pages = []
+    for n in range(count):
+        words, size = [], 0
+        while size < text_kb * 1024:
+            word = rng.choice(WORDS)
+            words.append(word)
+            size += len(word) + 1
+        pages.append({
+            'url': f'http://{"x" * 40}{n % hosts}.onion/pagina/{n}', 'titulo': f'Página {n}', 'texto': ' '.join(words),
+            'enlaces': rng.sample(pool, links), 'imagenes': [f'/img/{rng.randint(0, 99)}.png' for _ in range(5)],
+            'scripts': [], 'estilos': [], 'metadatos': {'description': ' '.join(words[:20]), 'keywords': 'foro'},
+            'entidades': [(rng.choice(WORDS), 'MISC') for _ in range(5)], 'clasificacion': 'foro',
+            'resumen': ' '.join(words[:30]), 'es_ilicito': False, 'tiempo_scraping': 0.5, 'tiempo_conexion': 0.2,
+            'profundidad': 1,
+        })
+    return pages
+
+
+def legacy_save(connection, pages):
+    # Escritura con el formato anterior, tal como la hacía save_pages antes de la migración 10
+    datos, enlaces, imagenes, metadatos, entidades = [], [], [], [], []
+    for page in pages:
+        data_id = str(uuid.uuid4())
+        url = page['url']
+        datos.append((data_id, url, normalize_host(url), page['titulo'], page['texto'], page['clasificacion'], page['resumen'],
+                      page['es_ilicito'], page['tiempo_scraping'], page['tiempo_conexion'], page['profundidad']))
+        enlaces.extend((str(uuid.uuid4()), data_id, url, enlace) for enlace in page['enlaces'])
+        imagenes.extend((str(uuid.uuid4()), data_id, url, imagen) for imagen in page['imagenes'])
+        metadatos.extend((str(uuid.uuid4()), data_id, url, nombre, contenido) for nombre, contenido in page['metadatos'].items())
+        entidades.extend((str(uuid.uuid4()), data_id, url, entidad, tipo) for entidad, tipo in page['entidades'])
+    connection.start_transaction()
+    with connection.cursor() as cursor:
+        cursor.executemany("""
+            INSERT INTO datos_completos (id, url, host, titulo, texto, clasificacion_tematica, resumen, es_ilicito, tiempo_scraping, tiempo_conexion, profundidad)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, datos)
+        cursor.executemany("INSERT INTO enlaces (id, datos_completos_id, url, enlace) VALUES (%s, %s, %s, %s)", enlaces)
+        cursor.executemany("INSERT INTO imagenes (id, datos_completos_id, url, imagen) VALUES (%s, %s, %s, %s)", imagenes)
+        cursor.executemany("INSERT INTO metadatos (id, datos_completos_id, url, nombre, contenido) VALUES (%s, %s, %s, %s, %s)",
+                           metadatos)
+        cursor.executemany("INSERT INTO entidades (id, datos_completos_id, url, entidad, tipo) VALUES (%s, %s, %s, %s, %s)",
+                           entidades)
+    connection.commit()
+
+
+def fresh_database(name):
+    connection = mysql.connector.connect(host=Config.DB_HOST, user=Config.DB_USER, password=Config.DB_PASSWORD,
+                                         use_pure=Config.DB_USE_PURE)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS {name}")
+        cursor.execute(f"CREATE DATABASE {name} CHARACTER SET utf8mb4")
+    connection.database = name
+    return connection
+
+
+def measure(connection, pages, batch, save):
+    start_time = time.perf_counter()
+    for start in range(0, len(pages), batch):
+        save(pages[start:start + batch])
+    elapsed = time.perf_counter() - start_time
+    with connection.cursor() as cursor:
+        sizes = table_sizes(cursor, COMPACT_TABLES)
+    return {
+        'segundos': round(elapsed, 3),
+        'paginas_por_segundo': round(len(pages) / elapsed, 1),
+        'tablas': {table: {'filas': rows, 'datos_mb': round(data / 2 ** 20, 2), 'indices_mb': round(index / 2 ** 20, 2)}
+                   for table, (rows, data, index) in sizes.items()},
+        'total_mb': round(sum(data + index for _, data, index in sizes.values()) / 2 ** 20, 2),
+    }
+
+
+def run(args):
+    pages = synthetic_pages(args.pages, args.text_kb, args.links, args.link_pool, args.hosts, args.seed)
+
+    legacy = fresh_database(f'{args.database_prefix}_v1')
+    run_migrations(legacy, target=LEGACY_VERSION)
+    before = measure(legacy, pages, args.batch, lambda batch: legacy_save(legacy, batch))
+    legacy.close()
+
+    compact = fresh_database(f'{args.database_prefix}_v2')
+    run_migrations(compact)
+    manager = DatabaseManager(connection=compact)
+    after = measure(compact, pages, args.batch, manager.save_pages)
+    compact.close()
+
+    return {
+        'commit': current_commit(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'parametros': vars(args),
+        'resultados': {
+            'anterior': before,
+            'compacto': after,
+            'ahorro_disco': round(1 - after['total_mb'] / before['total_mb'], 3) if before['total_mb'] else None,
+            'mejora_escritura': round(after['paginas_por_segundo'] / before['paginas_por_segundo'], 2),
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=Config.WRITE_BUFFER_MAX_PAGES, help='páginas por transacción')
+    parser.add_argument('--text-kb', type=int, default=8, help='tamaño del texto de cada página')
+    parser.add_argument('--links', type=int, default=20, help='enlaces por página')
+    parser.add_argument('--link-pool', type=int, default=5000, help='URLs distintas a las que se enlaza')
+    parser.add_argument('--hosts', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-prefix', default='bench_almacenamiento')
+    parser.add_argument('--output', help='fichero JSON de resultados (por defecto, la salida estándar)')
+    args = parser.parse_args()
+
+    report = run(args)
+    results = report['resultados']
+    for name in ('anterior', 'compacto'):
+        print(f"{name:<10}{results[name]['paginas_por_segundo']:>10.1f} páginas/s{results[name]['total_mb']:>10.1f} MiB",
+              file=sys.stderr)
+    print(f"Escritura x{results['mejora_escritura']}, disco {results['ahorro_disco'] * 100:.1f}% menos", file=sys.stderr)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
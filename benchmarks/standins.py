@@ -0,0 +1,243 @@
+# standins.py
+# Sustitutos locales para los benchmarks de extremo a extremo: sitios sintéticos
+# servidos por HTTP, un servidor de chat completions con latencia configurable y
+# una conexión que imita a mysql-connector sin servidor de base de datos.
+import json
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from scraping.database_manager import DatabaseManager
+
+WORDS = ("mercado foro acceso usuario producto envío contacto normas registro servicio anuncio "
+         "precio tienda soporte noticias privacidad cuenta pedido vendedor comprador monedero cifrado "
+         "mensaje correo catálogo oferta reseña garantía reembolso").split()
+
+# Palabras que la preclasificación local asocia a temáticas ilícitas, para que una
+# parte de las páginas tenga una temática local clara
+THEME_WORDS = "droga cocaína pistola munición malware ransomware estafa falsificación".split()
+
+
+def page_path(n):
+    return '/' if n == 0 else f'/pagina/{n}'
+
+
+def build_site(site, pages, links_per_page, page_bytes, graph='random', theme_ratio=0.1, seed=42):
+    """Genera las páginas de un sitio: {ruta: html}. ``graph`` es 'random' (enlaces
+    uniformes) o 'powerlaw' (unas pocas páginas concentran la mayoría de enlaces)."""
+    rng = random.Random(f'{seed}-{site}')
+    weights = [1 / (n + 1) for n in range(pages)] if graph == 'powerlaw' else None
+
+    def paragraph(themed):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(20, 60))]
+        if themed:
+            words[rng.randrange(len(words))] = rng.choice(THEME_WORDS)
+        return ' '.join(words)
+
+    corpus = {}
+    for n in range(pages):
+        targets = rng.choices(range(pages), weights=weights, k=links_per_page)
+        # Variantes de URL que la canonicalización debe unificar
+        links = ''.join(f'<li><a href="{page_path(t)}{rng.choice(("", "/", "#top", "?sid=" + str(rng.randint(0, 99))))}">'
+                        f'{rng.choice(WORDS)}</a></li>' for t in targets)
+        themed = rng.random() < theme_ratio
+        head = (f"<!DOCTYPE html><html><head><title>Sitio {site} - página {n}</title>"
+                f"<meta name=\"description\" content=\"{paragraph(False)[:120]}\">"
+                f"<link rel=\"stylesheet\" href=\"/css/base.css\"><script src=\"/js/app.js\"></script></head>"
+                f"<body><nav><ul>{links}</ul></nav>")
+        body = []
+        size = len(head)
+        while size < page_bytes:
+            block = f"<div class=\"post\"><h2>{rng.choice(WORDS)}</h2><p>{paragraph(themed)}</p></div>"
+            body.append(block)
+            size += len(block)
+        corpus[page_path(n)] = (head + ''.join(body) + "</body></html>").encode('utf-8')
+    return corpus
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0].split('#', 1)[0]
+        if len(path) > 1:
+            path = path.rstrip('/')
+        body = self.server.corpus.get(path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+ILLICIT_REPLY = "El texto es ilícito: ofrece productos prohibidos. Resumen: {resumen}"
+LICIT_REPLY = "El texto es lícito. Resumen: {resumen}"
+BATCH_SECTION = re.compile(r'\[TEXTO (\d+)\]\n(.*?)(?=\n\n\[TEXTO \d+\]|\Z)', re.DOTALL)
+
+
+def fake_reply(texto):
+    # Respuesta determinista según el contenido, con la misma forma que la del modelo
+    template = ILLICIT_REPLY if any(word in texto for word in THEME_WORDS) else LICIT_REPLY
+    return template.format(resumen=texto[:80].strip())
+
+
+class ChatCompletionsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        datos = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        contenido = datos['messages'][0]['content']
+        server = self.server
+        time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+        with server.lock:
+            server.requests += 1
+        secciones = BATCH_SECTION.findall(contenido)
+        if secciones:
+            respuesta = json.dumps([{'id': int(numero), 'respuesta': fake_reply(texto)} for numero, texto in secciones],
+                                   ensure_ascii=False)
+        else:
+            respuesta = fake_reply(contenido)
+        body = json.dumps({'choices': [{'message': {'role': 'assistant', 'content': respuesta}}]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(handler, **attributes):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    for name, value in attributes.items():
+        setattr(server, name, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def serve_standins(sites, pages, links_per_page, page_bytes, graph, site_latency, llm_latency, llm_jitter,
+                   seed, ready, stop):
+    """Punto de entrada del proceso de servidores: así su CPU no compite con la del
+    rastreador medido. Envía por ``ready`` los puertos y espera a ``stop``."""
+    logging.getLogger().setLevel(logging.WARNING)
+    servers = [start_server(SiteHandler, corpus=build_site(site, pages, links_per_page, page_bytes, graph, seed=seed),
+                            latency=site_latency)
+               for site in range(sites)]
+    llm = start_server(ChatCompletionsHandler, latency=llm_latency, jitter=llm_jitter, lock=threading.Lock(), requests=0)
+    ready.send({'sites': [server.server_port for server in servers], 'llm': llm.server_port})
+    stop.wait()
+    ready.send({'llm_requests': llm.requests})
+
+
+class StandInCursor:
+    def __init__(self, connection, dictionary=False):
+        self.connection = connection
+        self.dictionary = dictionary
+        self.rowcount = 0
+        self.lastrowid = None
+        self.rows = []
+
+    def execute(self, statement, params=None):
+        self.connection.round_trip(1)
+        # Sin datos: las consultas devuelven vacío y las escrituras afectan a una fila,
+        # salvo la tabla urls, que se imita para que las páginas obtengan sus ids
+        self.rows = []
+        if statement.startswith("SELECT id, url_hash FROM urls"):
+            url_ids = self.connection.pool.url_ids
+            self.rows = [(url_ids[key], key) for key in params if key in url_ids]
+        self.rowcount = len(self.rows) if statement.lstrip().upper().startswith('SELECT') else 1
+
+    def executemany(self, statement, rows):
+        rows = list(rows)
+        self.connection.round_trip(len(rows))
+        self.rowcount = len(rows)
+        if statement.startswith("INSERT IGNORE INTO urls"):
+            with self.connection.pool.lock:
+                url_ids = self.connection.pool.url_ids
+                for key, url in rows:
+                    url_ids.setdefault(key, len(url_ids) + 1)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StandInConnection:
+    """Imita la parte de la conexión de mysql-connector que usa DatabaseManager.
+    Cada sentencia cuesta ``latency`` segundos, como una ida y vuelta al servidor."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def round_trip(self, rows):
+        if self.pool.latency:
+            time.sleep(self.pool.latency)
+        with self.pool.lock:
+            self.pool.stats['sentencias'] += 1
+            self.pool.stats['filas'] += rows
+
+    def cursor(self, dictionary=False, buffered=None):
+        return StandInCursor(self, dictionary)
+
+    def start_transaction(self):
+        pass
+
+    def commit(self):
+        self.round_trip(0)
+        with self.pool.lock:
+            self.pool.stats['commits'] += 1
+
+    def rollback(self):
+        pass
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        pass
+
+    def close(self):
+        pass
+
+
+class StandInPool:
+    """Mismo interfaz que ConnectionPool para usarse con PooledDatabase."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.stats = {'sentencias': 0, 'filas': 0, 'commits': 0}
+        self.url_ids = {}
+
+    @contextmanager
+    def connection(self):
+        yield StandInConnection(self)
+
+    @contextmanager
+    def manager(self):
+        with self.connection() as connection:
+            yield DatabaseManager(connection=connection)
@@ -10,3 +10,156 @@ class Config:
     DB_NAME = os.getenv('DB_NAME')
     PROXY_HOST = 'localhost'
     PROXY_PORT = 9050
+
+    # Motor de rastreo: 'serial' (bucle clásico) o 'async' (asyncio con N peticiones en vuelo)
+    CRAWL_MODE = os.getenv('CRAWL_MODE', 'serial')
+    CRAWL_CONCURRENCY = int(os.getenv('CRAWL_CONCURRENCY', 16))
+    CRAWL_PER_HOST_CONCURRENCY = int(os.getenv('CRAWL_PER_HOST_CONCURRENCY', 4))
+    CRAWL_ANALYSIS_WORKERS = int(os.getenv('CRAWL_ANALYSIS_WORKERS', 4))
+    REQUEST_TIMEOUT = int(os.getenv('REQUEST_TIMEOUT', 20))
+
+    # Cola de trabajos de rastreo en segundo plano
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+    JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', 100))
+    JOB_HISTORY_LIMIT = int(os.getenv('JOB_HISTORY_LIMIT', 200))
+    # Profundidad máxima que se acepta en un trabajo; los valores mayores se recortan
+    JOB_MAX_DEPTH = int(os.getenv('JOB_MAX_DEPTH', 10))
+
+    # Caché persistente de clasificaciones del LLM
+    CLASSIFICATION_CACHE_ENABLED = os.getenv('CLASSIFICATION_CACHE_ENABLED', '1') == '1'
+    CLASSIFICATION_CACHE_MEMORY_SIZE = int(os.getenv('CLASSIFICATION_CACHE_MEMORY_SIZE', 2048))
+    CLASSIFICATION_CACHE_TTL = int(os.getenv('CLASSIFICATION_CACHE_TTL', 30 * 24 * 3600))
+    CLASSIFICATION_CACHE_MAX_ENTRIES = int(os.getenv('CLASSIFICATION_CACHE_MAX_ENTRIES', 100000))
+
+    # Preclasificación local por palabras clave antes del LLM
+    # El veredicto de legalidad solo lo da el LLM (o su caché)
+    # 'shadow': la temática sale del resumen del LLM y se registra si la local habría coincidido
+    # 'tiered': una decisión local clara fija la temática y se omite el LLM; la legalidad
+    # queda sin evaluar salvo que esté en la caché (activar tras validar los umbrales)
+    # 'llm': comportamiento original, sin emparejador local
+    CLASSIFIER_TIER_MODE = os.getenv('CLASSIFIER_TIER_MODE', 'shadow')
+    TOPICS_FILE = os.getenv('TOPICS_FILE')
+    LOCAL_CLASSIFIER_MIN_HITS = int(os.getenv('LOCAL_CLASSIFIER_MIN_HITS', 3))
+    LOCAL_CLASSIFIER_MARGIN = float(os.getenv('LOCAL_CLASSIFIER_MARGIN', 2.0))
+
+    # Cliente del LLM: endpoint configurable (p. ej. un servidor local para pruebas),
+    # presupuesto de tokens, agrupación de páginas cortas y límites de ritmo
+    LLM_API_URL = os.getenv('LLM_API_URL', 'https://api.openai.com/v1/chat/completions')
+    LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-3.5-turbo')
+    LLM_TIMEOUT = int(os.getenv('LLM_TIMEOUT', 60))
+    LLM_MAX_INPUT_TOKENS = int(os.getenv('LLM_MAX_INPUT_TOKENS', 3000))
+    LLM_MAX_OUTPUT_TOKENS = int(os.getenv('LLM_MAX_OUTPUT_TOKENS', 500))
+    LLM_SHORT_PAGE_TOKENS = int(os.getenv('LLM_SHORT_PAGE_TOKENS', 500))
+    LLM_BATCH_MAX_PAGES = int(os.getenv('LLM_BATCH_MAX_PAGES', 8))
+    LLM_BATCH_TOKEN_BUDGET = int(os.getenv('LLM_BATCH_TOKEN_BUDGET', 3000))
+    LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', 4))
+    LLM_REQUESTS_PER_MINUTE = int(os.getenv('LLM_REQUESTS_PER_MINUTE', 60))
+    LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', 90000))
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 5))
+    LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', 1.0))
+
+    # Escritura en base de datos
+    DB_USE_PURE = os.getenv('DB_USE_PURE', '0') == '1'
+    WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', '0') == '1'
+    WRITE_BUFFER_MAX_PAGES = int(os.getenv('WRITE_BUFFER_MAX_PAGES', 50))
+    WRITE_BUFFER_FLUSH_INTERVAL = float(os.getenv('WRITE_BUFFER_FLUSH_INTERVAL', 5.0))
+    WRITE_BUFFER_MAX_PENDING = int(os.getenv('WRITE_BUFFER_MAX_PENDING', 500))
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10.0))
+
+    # Re-rastreo incremental de dominios conocidos (intervalos en segundos)
+    RECRAWL_SCHEDULER_ENABLED = os.getenv('RECRAWL_SCHEDULER_ENABLED', '0') == '1'
+    RECRAWL_POLL_INTERVAL = int(os.getenv('RECRAWL_POLL_INTERVAL', 300))
+    RECRAWL_DEFAULT_INTERVAL = int(os.getenv('RECRAWL_DEFAULT_INTERVAL', 24 * 3600))
+    RECRAWL_MIN_INTERVAL = int(os.getenv('RECRAWL_MIN_INTERVAL', 3600))
+    RECRAWL_MAX_INTERVAL = int(os.getenv('RECRAWL_MAX_INTERVAL', 30 * 24 * 3600))
+    RECRAWL_PRIORITY = int(os.getenv('RECRAWL_PRIORITY', -1))
+
+    # Extracción de HTML: 'fast' (una sola pasada) o 'soup' (ruta original con BeautifulSoup);
+    # HTML_PARSER: 'lxml' o 'html.parser' (por defecto lxml si está instalado)
+    HTML_EXTRACTOR = os.getenv('HTML_EXTRACTOR', 'fast')
+    HTML_PARSER = os.getenv('HTML_PARSER')
+
+    # Reconocimiento de entidades: modelos por idioma, troceado y procesos
+    NLP_MODELS = os.getenv('NLP_MODELS', 'en:en_core_web_sm,es:es_core_news_sm')
+    NLP_PROCESSES = int(os.getenv('NLP_PROCESSES', 2))
+    NLP_BATCH_SIZE = int(os.getenv('NLP_BATCH_SIZE', 16))
+    NLP_MAX_CHARS = int(os.getenv('NLP_MAX_CHARS', 100000))
+    NLP_CHUNK_CHARS = int(os.getenv('NLP_CHUNK_CHARS', 10000))
+    NLP_LANG_SAMPLE_CHARS = int(os.getenv('NLP_LANG_SAMPLE_CHARS', 2000))
+
+    # Búsqueda de texto completo: tamaño de página por defecto y máximo
+    SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 20))
+    SEARCH_MAX_PAGE_SIZE = int(os.getenv('SEARCH_MAX_PAGE_SIZE', 100))
+    SEARCH_MAX_OFFSET = int(os.getenv('SEARCH_MAX_OFFSET', 1000))
+
+    # Historial paginado: filas por página por defecto y máximo
+    HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 50))
+    HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', 200))
+
+    # Frontera de rastreo: 'memory' (original, se pierde al reiniciar), 'mysql' o 'sqlite'
+    # (persistente y reanudable; con mysql varios procesos o nodos comparten un rastreo)
+    FRONTIER_BACKEND = os.getenv('FRONTIER_BACKEND', 'memory')
+    FRONTIER_SQLITE_PATH = os.getenv('FRONTIER_SQLITE_PATH', 'frontier.db')
+    FRONTIER_LEASE_SECONDS = int(os.getenv('FRONTIER_LEASE_SECONDS', 300))
+    FRONTIER_LEASE_BATCH = int(os.getenv('FRONTIER_LEASE_BATCH', 32))
+    FRONTIER_MAX_ATTEMPTS = int(os.getenv('FRONTIER_MAX_ATTEMPTS', 3))
+    FRONTIER_POLL_INTERVAL = float(os.getenv('FRONTIER_POLL_INTERVAL', 2.0))
+    FRONTIER_BLOOM_CAPACITY = int(os.getenv('FRONTIER_BLOOM_CAPACITY', 1000000))
+    FRONTIER_BLOOM_ERROR_RATE = float(os.getenv('FRONTIER_BLOOM_ERROR_RATE', 0.0001))
+
+    # Canonicalización de URLs y detección de trampas de rastreo
+    URL_STRIP_PARAMS = os.getenv('URL_STRIP_PARAMS', 'sid,sessionid,session_id,phpsessid,jsessionid,aspsessionid,'
+                                                     'cfid,cftoken,utm_*,fbclid,gclid')
+    # Quitar la barra final cambia la base de los enlaces relativos en los servidores
+    # que no redirigen; desactivado salvo que se pida
+    URL_STRIP_TRAILING_SLASH = os.getenv('URL_STRIP_TRAILING_SLASH', '0') == '1'
+    CRAWL_MAX_URL_LENGTH = int(os.getenv('CRAWL_MAX_URL_LENGTH', 1000))
+    CRAWL_MAX_PATH_SEGMENTS = int(os.getenv('CRAWL_MAX_PATH_SEGMENTS', 15))
+    CRAWL_MAX_REPEATED_SEGMENT = int(os.getenv('CRAWL_MAX_REPEATED_SEGMENT', 3))
+    # Máximo de URLs por patrón de ruta (números sustituidos); 0 lo desactiva
+    CRAWL_PATTERN_BUDGET = int(os.getenv('CRAWL_PATTERN_BUDGET', 200))
+
+    # Capa de descarga: puertos SOCKS de Tor (host:puerto separados por comas) y circuitos
+    # aislados por puerto (credenciales SOCKS distintas con IsolateSOCKSAuth)
+    TOR_PROXIES = os.getenv('TOR_PROXIES', f'{PROXY_HOST}:{PROXY_PORT}')
+    TOR_ISOLATION_CIRCUITS = int(os.getenv('TOR_ISOLATION_CIRCUITS', 1))
+    FETCH_MAX_RETRIES = int(os.getenv('FETCH_MAX_RETRIES', 2))
+    FETCH_BACKOFF_BASE = float(os.getenv('FETCH_BACKOFF_BASE', 0.5))
+    FETCH_POOL_HOSTS = int(os.getenv('FETCH_POOL_HOSTS', 32))
+    FETCH_POOL_MAXSIZE = int(os.getenv('FETCH_POOL_MAXSIZE', 8))
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 3))
+    CIRCUIT_COOLDOWN = float(os.getenv('CIRCUIT_COOLDOWN', 30))
+    CIRCUIT_LATENCY_ALPHA = float(os.getenv('CIRCUIT_LATENCY_ALPHA', 0.2))
+
+    # Descarga en streaming: tipos aceptados y tamaño máximo del cuerpo
+    FETCH_ALLOWED_TYPES = os.getenv('FETCH_ALLOWED_TYPES', 'text/html,application/xhtml+xml')
+    FETCH_MAX_BYTES = int(os.getenv('FETCH_MAX_BYTES', 5 * 1024 * 1024))
+
+    # Métricas: tiempos por etapa guardados por página y perfilado por muestreo de un trabajo
+    METRICS_STORE_PAGE_TIMINGS = os.getenv('METRICS_STORE_PAGE_TIMINGS', '0') == '1'
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.01))
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'perfiles')
+
+    # Resultados en streaming: cola entre el rastreo y su consumidor, resúmenes que guarda
+    # cada trabajo y segundos entre eventos de progreso del stream
+    STREAM_QUEUE_SIZE = int(os.getenv('STREAM_QUEUE_SIZE', 100))
+    JOB_RESULTS_LIMIT = int(os.getenv('JOB_RESULTS_LIMIT', 1000))
+    STREAM_HEARTBEAT = float(os.getenv('STREAM_HEARTBEAT', 15))
+
+    # Grafo de enlaces: carga en memoria, cálculo periódico de PageRank y grado de entrada
+    LINK_GRAPH_ENABLED = os.getenv('LINK_GRAPH_ENABLED', '0') == '1'
+    LINK_GRAPH_RANK_INTERVAL = float(os.getenv('LINK_GRAPH_RANK_INTERVAL', 600))
+    LINK_GRAPH_DAMPING = float(os.getenv('LINK_GRAPH_DAMPING', 0.85))
+    LINK_GRAPH_TOLERANCE = float(os.getenv('LINK_GRAPH_TOLERANCE', 1e-6))
+    LINK_GRAPH_MAX_ITER = int(os.getenv('LINK_GRAPH_MAX_ITER', 100))
+    # Aristas pendientes que provocan la compactación del CSR, y filas por lote al cargar y guardar
+    LINK_GRAPH_COMPACT_EDGES = int(os.getenv('LINK_GRAPH_COMPACT_EDGES', 100000))
+    LINK_GRAPH_LOAD_BATCH = int(os.getenv('LINK_GRAPH_LOAD_BATCH', 1000))
+
+    # Almacenamiento compacto: nivel de zlib del texto, caracteres en claro indexados por
+    # FULLTEXT, URLs con id en memoria y páginas por lote al copiar los datos antiguos
+    STORAGE_COMPRESSION_LEVEL = int(os.getenv('STORAGE_COMPRESSION_LEVEL', 6))
+    STORAGE_SEARCH_CHARS = int(os.getenv('STORAGE_SEARCH_CHARS', 16000))
+    URL_ID_CACHE_SIZE = int(os.getenv('URL_ID_CACHE_SIZE', 100000))
+    STORAGE_MIGRATION_BATCH = int(os.getenv('STORAGE_MIGRATION_BATCH', 1000))
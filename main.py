@@ -1,13 +1,25 @@
 # main.py
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, Response, render_template, stream_template, request, redirect, url_for, jsonify, abort, send_file
 from urllib.parse import urlparse
-import io
+import os
+import queue
+import threading
 import base64
-import matplotlib.pyplot as plt
+import json
+from datetime import datetime
 from config import Config
 from scraping.onion_scraper import OnionScraper
-from scraping.database_manager import DatabaseManager
+from scraping.db_pool import get_pool, PooledDatabase
 from scraping.text_classifier import TextClassifier
+from scraping.job_manager import CrawlJobManager
+from scraping.classification_cache import ClassificationCache
+from scraping.tiered_classifier import tier_stats
+from scraping.recrawl_scheduler import RecrawlScheduler
+from scraping.charts import ChartCache, render_theme_pie
+from scraping.fetcher import get_fetcher
+from scraping.metrics import metrics
+from scraping.link_graph import LinkRanker, get_link_graph
+from scraping.storage import parse_id
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -20,22 +32,76 @@ def get_database_config():
         'database': app.config['DB_NAME']
     }
 
+def get_db_pool():
+    # El pool se crea (y el esquema se migra) la primera vez que se necesita
+    return get_pool(**get_database_config())
+
+classification_cache = None
+classification_cache_lock = threading.Lock()
+
+def get_classification_cache():
+    # La caché se comparte entre todos los trabajos del proceso
+    global classification_cache
+    with classification_cache_lock:
+        if classification_cache is None and Config.CLASSIFICATION_CACHE_ENABLED:
+            classification_cache = ClassificationCache(PooledDatabase(get_db_pool()))
+    return classification_cache
+
+def build_scraper(job):
+    text_classifier = TextClassifier(cache=get_classification_cache())
+    db_manager = PooledDatabase(get_db_pool())
+    scraper = OnionScraper(job.url, Config.PROXY_HOST, Config.PROXY_PORT, db_manager, text_classifier,
+                           max_depth=job.max_depth, incremental=job.incremental)
+    return scraper, db_manager.close
+
+job_manager = CrawlJobManager(build_scraper)
+recrawl_scheduler = None
+link_ranker = None
+
+def start_background_services():
+    # Hilos de fondo del proceso servidor. No se arrancan al importar el módulo: los
+    # procesos del pool de NER se lanzan con spawn y vuelven a importar __main__
+    global recrawl_scheduler, link_ranker
+    if Config.RECRAWL_SCHEDULER_ENABLED and recrawl_scheduler is None:
+        recrawl_scheduler = RecrawlScheduler(job_manager, PooledDatabase(get_db_pool()))
+        recrawl_scheduler.start()
+    if Config.LINK_GRAPH_ENABLED and link_ranker is None:
+        link_ranker = LinkRanker(PooledDatabase(get_db_pool()))
+        link_ranker.start()
+
+def get_request_params():
+    return request.form if request.form else (request.get_json(silent=True) or {})
+
+def get_int_param(params, name, default):
+    value = params.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"El parámetro {name} debe ser un número entero")
+
+def submit_scrape_job(url):
+    if not url.startswith(('http://', 'https://')):
+        url = 'http://' + url
+    params = get_request_params()
+    priority = get_int_param(params, 'prioridad', 0)
+    max_depth = get_int_param(params, 'max_depth', 3)
+    incremental = str(params.get('incremental', '')).lower() in ('1', 'true', 'on')
+    profile = str(params.get('perfil', '')).lower() in ('1', 'true', 'on')
+    # submit valida prioridad y max_depth (ValueError) y recorta max_depth a JOB_MAX_DEPTH
+    return job_manager.submit(url, priority=priority, max_depth=max_depth, incremental=incremental, profile=profile)
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
-        url = request.form['url']
-        db_manager = DatabaseManager(**get_database_config())
-        text_classifier = TextClassifier()
-        scraper = OnionScraper(url, Config.PROXY_HOST, Config.PROXY_PORT, db_manager, text_classifier)
         try:
-            results = scraper.scrape()
-            domain = urlparse(url).netloc
-            return render_template('results.html', results=results, domain=domain)
-        except Exception as e:
-            message = f"Error durante el scraping: {e}"
-            return render_template('results.html', message=message)
-        finally:
-            db_manager.close()
+            job_id = submit_scrape_job(request.form['url'])
+        except ValueError as e:
+            return render_template('results.html', message=str(e)), 400
+        except queue.Full:
+            return render_template('results.html', message="La cola de scraping está llena. Inténtelo más tarde.")
+        return redirect(url_for('job_page', job_id=job_id))
     return render_template('index.html')
 
 @app.route('/results')
@@ -45,29 +111,233 @@ def results():
 
 @app.route('/scrape', methods=['POST'])
 def scrape():
-    url = request.form['url']
-    if not url.startswith(('http://', 'https://')):
-        url = 'http://' + url
-    db_manager = DatabaseManager(**get_database_config())
-    text_classifier = TextClassifier()
-    scraper = OnionScraper(url, Config.PROXY_HOST, Config.PROXY_PORT, db_manager, text_classifier)
     try:
-        results = scraper.scrape()
-        domain = urlparse(url).netloc
-        return render_template('results.html', results=results, domain=domain)
-    except Exception as e:
-        return render_template('results.html', message=str(e))
-    finally:
-        db_manager.close()
+        job_id = submit_scrape_job(request.form['url'])
+    except ValueError as e:
+        return render_template('results.html', message=str(e)), 400
+    except queue.Full:
+        return render_template('results.html', message="La cola de scraping está llena. Inténtelo más tarde.")
+    return redirect(url_for('job_page', job_id=job_id))
+
+@app.route('/jobs', methods=['GET', 'POST'])
+def jobs():
+    if request.method == 'POST':
+        url = get_request_params().get('url')
+        if not url:
+            return jsonify({'error': 'Falta el parámetro url'}), 400
+        try:
+            job_id = submit_scrape_job(url)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except queue.Full:
+            return jsonify({'error': 'La cola de scraping está llena'}), 503
+        return jsonify({'job_id': job_id}), 202
+    return jsonify({
+        'trabajos': [job.to_dict() for job in job_manager.list_jobs()],
+        'cola': job_manager.queue_size()
+    })
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        abort(404)
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def job_cancel(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        abort(404)
+    cancelled = job_manager.cancel(job_id)
+    return jsonify({'job_id': job_id, 'cancelado': cancelled, 'estado': job.status})
+
+@app.route('/jobs/<job_id>/view')
+def job_page(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        abort(404)
+    if job.is_finished():
+        domain = urlparse(job.url).netloc
+        message = f"Error durante el scraping: {job.error}" if job.error else None
+        if not message and job.results_total > len(job.results):
+            message = (f"Se muestran las últimas {len(job.results)} de {job.results_total} páginas; "
+                       f"el resto está en el historial.")
+        return render_template('results.html', results=list(job.results), domain=domain, message=message)
+    return render_template('job.html', job=job.to_dict())
+
+def sse_event(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+def job_progress(job):
+    status = job.to_dict()
+    return {name: status[name] for name in ('estado', 'paginas_descargadas', 'paginas_procesadas',
+                                            'paginas_sin_cambios', 'profundidad_cola', 'errores', 'resultados')}
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    # Server-sent events: un evento 'pagina' por cada página procesada, 'progreso'
+    # periódicamente y 'fin' al terminar. Al reconectar, el navegador envía Last-Event-ID
+    # y se continúa desde ahí
+    job = job_manager.get(job_id)
+    if not job:
+        abort(404)
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('after', '0')
+    after = int(last_id) if last_id.isdigit() else 0
+
+    def stream(after):
+        while True:
+            first, summaries, finished = job.wait_for_results(after, Config.STREAM_HEARTBEAT)
+            for number, summary in enumerate(summaries, first):
+                yield sse_event('pagina', summary, number)
+                after = number
+            if finished:
+                yield sse_event('fin', job_progress(job))
+                return
+            yield sse_event('progreso', job_progress(job))
+
+    return Response(stream(after), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/cache_stats')
+def cache_stats():
+    cache = get_classification_cache()
+    return jsonify(cache.stats() if cache else {})
+
+@app.route('/classifier_stats')
+def classifier_stats():
+    return jsonify({'modo': Config.CLASSIFIER_TIER_MODE, **tier_stats.snapshot()})
+
+@app.route('/circuits')
+def circuits():
+    return jsonify(get_fetcher().pool.stats())
+
+@app.route('/jobs/<job_id>/profile')
+def job_profile(job_id):
+    job = job_manager.get(job_id)
+    if not job or not job.profile_path:
+        abort(404)
+    return send_file(job.profile_path, mimetype='text/plain', as_attachment=True)
+
+def running_scrapers():
+    return [job.scraper for job in job_manager.list_jobs() if job.status == 'en_curso' and job.scraper]
+
+def pending_writes():
+    return sum(scraper.write_buffer.pending_count() for scraper in running_scrapers() if scraper.write_buffer)
+
+def jobs_by_status():
+    counts = {}
+    for job in job_manager.list_jobs():
+        counts[job.status] = counts.get(job.status, 0) + 1
+    return counts
+
+def classification_cache_counts():
+    # Sin crear la caché (ni su conexión) si aún no la ha usado ningún trabajo
+    cache = classification_cache
+    if not cache:
+        return {}
+    stats = cache.stats()
+    return {name: stats[name] for name in ('aciertos_memoria', 'aciertos_bd', 'fallos')}
+
+# Valores que ya llevan otros componentes; se leen al generar /metrics
+metrics.collect('indexador_cola_trabajos', 'gauge', 'Trabajos de rastreo esperando en la cola', job_manager.queue_size)
+metrics.collect('indexador_trabajos', 'gauge', 'Trabajos de rastreo por estado', jobs_by_status, label='estado')
+metrics.collect('indexador_frontera_pendientes', 'gauge', 'URLs pendientes en la frontera de los trabajos en curso',
+                lambda: sum(scraper.queue_depth() for scraper in running_scrapers()))
+metrics.collect('indexador_escritura_pendientes', 'gauge', 'Páginas en los buffers de escritura', pending_writes)
+metrics.collect('indexador_cache_clasificacion_total', 'counter', 'Consultas a la caché de clasificaciones por resultado',
+                classification_cache_counts, label='resultado')
+metrics.collect('indexador_clasificaciones_total', 'counter', 'Clasificaciones por nivel (local o llm)',
+                lambda: {nivel: tier_stats.snapshot()[nivel] for nivel in ('local', 'llm')}, label='nivel')
+
+def link_graph_size():
+    graph = get_link_graph()
+    return {'nodos': graph.node_count(), 'aristas': graph.edge_count()} if graph else {}
+
+metrics.collect('indexador_grafo_enlaces', 'gauge', 'Nodos y aristas del grafo de enlaces en memoria', link_graph_size,
+                label='tipo')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/recrawl')
+def recrawl():
+    with get_db_pool().manager() as db_manager:
+        return jsonify(db_manager.get_recrawl_domains())
+
+@app.route('/link_graph')
+def link_graph():
+    # Estado del grafo de enlaces y las páginas con mayor PageRank guardado
+    limit = get_int_arg('limit', 20, 1, 500)
+    graph = get_link_graph()
+    with get_db_pool().manager() as db_manager:
+        top = db_manager.get_top_scores(limit)
+    return jsonify({
+        'activo': Config.LINK_GRAPH_ENABLED,
+        'nodos': graph.node_count() if graph else 0,
+        'aristas': graph.edge_count() if graph else 0,
+        'calculo': link_ranker.stats if link_ranker else None,
+        'mejores': top
+    })
+
+def get_int_arg(name, default, minimum, maximum):
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        value = default
+    return min(max(value, minimum), maximum)
+
+def encode_cursor(row, order='fecha'):
+    # Cursor opaco con la clave (fecha_captura, id) o (pagerank, id) de la última fila mostrada
+    key = repr(float(row['pagerank'])) if order == 'pagerank' else row['fecha_captura'].isoformat()
+    raw = f"{key}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(value, order='fecha'):
+    try:
+        key, last_id = base64.urlsafe_b64decode(value.encode('ascii')).decode('utf-8').split('|', 1)
+        parse_id(last_id)
+        return (float(key) if order == 'pagerank' else datetime.fromisoformat(key)), last_id
+    except (ValueError, UnicodeError):
+        abort(400, "Cursor de paginación no válido")
 
 @app.route('/history')
 def history():
-    db_manager = DatabaseManager(**get_database_config())
+    limit = get_int_arg('limit', Config.HISTORY_PAGE_SIZE, 1, Config.HISTORY_MAX_PAGE_SIZE)
+    order = 'pagerank' if request.args.get('orden') == 'pagerank' else 'fecha'
+    after = decode_cursor(request.args['after'], order) if request.args.get('after') else None
+    filters = {
+        'host': request.args.get('domain') or None,
+        'tematica': request.args.get('tematica') or None,
+        'es_ilicito': {'1': True, '0': False}.get(request.args.get('ilicito', ''))
+    }
+    with get_db_pool().manager() as db_manager:
+        history_data, has_more = db_manager.get_history(limit, after, order=order, **filters)
+    next_cursor = encode_cursor(history_data[-1], order) if has_more else None
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return jsonify({'results': history_data, 'next': next_cursor})
+    # La conexión ya se devolvió al pool; la plantilla se envía por partes
+    return stream_template('history.html', history=history_data, next_cursor=next_cursor, limit=limit,
+                           domain=request.args.get('domain', ''), tematica=request.args.get('tematica', ''),
+                           ilicito=request.args.get('ilicito', ''), orden=request.args.get('orden', ''))
+
+@app.route('/pages/<page_id>')
+def page_detail(page_id):
+    # Captura completa, con el texto descomprimido
     try:
-        history_data = db_manager.get_history()
-        return render_template('history.html', history=history_data)
-    finally:
-        db_manager.close()
+        parse_id(page_id)
+    except ValueError:
+        abort(404)
+    with get_db_pool().manager() as db_manager:
+        page = db_manager.get_page(page_id)
+    if page is None:
+        abort(404)
+    return jsonify(page)
 
 @app.route('/stats')
 def stats():
@@ -75,44 +345,52 @@ def stats():
     if not domain:
         return "Domain parameter is missing", 400
 
-    db_manager = DatabaseManager(**get_database_config())
-    try:
+    with get_db_pool().manager() as db_manager:
         stats_data = db_manager.get_stats_for_domain(domain)
         summary_data = db_manager.get_summary_for_domain(domain)
-        return render_template('stats.html', stats=stats_data, summary=summary_data)
-    finally:
-        db_manager.close()
+        copia_pendiente = db_manager.is_legacy_copy_pending()
+        return render_template('stats.html', stats=stats_data, summary=summary_data, copia_pendiente=copia_pendiente)
+
+@app.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    host = request.args.get('host') or None
+    boolean_mode = request.args.get('mode') == 'boolean'
+    order = 'pagerank' if request.args.get('orden') == 'pagerank' else 'relevancia'
+    per_page = get_int_arg('per_page', Config.SEARCH_PAGE_SIZE, 1, Config.SEARCH_MAX_PAGE_SIZE)
+    # OFFSET acotado: las páginas profundas obligarían a ordenar demasiadas filas
+    page = get_int_arg('page', 1, 1, Config.SEARCH_MAX_OFFSET // per_page + 1)
+    total, results = 0, []
+    if query:
+        with get_db_pool().manager() as db_manager:
+            total, results = db_manager.search_pages(query, per_page, (page - 1) * per_page, host, boolean_mode, order)
+    pages = -(-total // per_page)
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return jsonify({'q': query, 'page': page, 'per_page': per_page, 'total': total, 'pages': pages, 'results': results})
+    return render_template('search.html', query=query, host=host, mode=request.args.get('mode', ''), orden=request.args.get('orden', ''),
+                           results=results, total=total, page=page, pages=pages, per_page=per_page)
+
+theme_chart = ChartCache(render_theme_pie)
 
 @app.route('/stats_tematica')
 def stats_tematica():
-    db_manager = DatabaseManager(**get_database_config())
-    try:
+    with get_db_pool().manager() as db_manager:
         stats_tematica_data = db_manager.get_stats_by_tematica()
-        labels = [stat['clasificacion_tematica'] for stat in stats_tematica_data]
-        data = [stat['count'] for stat in stats_tematica_data]
-        
-        # Crear gráfico de pastel con fondo oscuro y letras blancas
-        plt.style.use('dark_background')
-        fig, ax = plt.subplots()
-        wedges, texts, autotexts = ax.pie(data, labels=labels, autopct='%1.1f%%', startangle=90, colors=plt.cm.Paired.colors)
-        ax.axis('equal')  # Para que el gráfico sea circular
-
-        # Personalizar texto
-        for text in texts:
-            text.set_color('white')
-        for autotext in autotexts:
-            autotext.set_color('white')
-
-        # Guardar gráfico en un buffer
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', transparent=True)
-        buf.seek(0)
-        img_data = base64.b64encode(buf.getvalue()).decode('utf-8')
-        buf.close()
-
-        return render_template('stats_tematica.html', img_data=img_data)
-    finally:
-        db_manager.close()
+    labels = [stat['clasificacion_tematica'] for stat in stats_tematica_data]
+    data = [stat['count'] for stat in stats_tematica_data]
+    img_data = theme_chart.get(labels, data)
+    return render_template('stats_tematica.html', img_data=img_data)
+
+@app.route('/stats_diarias')
+def stats_diarias():
+    days = get_int_arg('days', 30, 1, 366)
+    with get_db_pool().manager() as db_manager:
+        return jsonify(db_manager.get_daily_stats(days))
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    debug = True
+    # Con el recargador de Flask este bloque se ejecuta también en el proceso que
+    # vigila los ficheros; los servicios solo se arrancan en el que sirve peticiones
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
+    app.run(host='0.0.0.0', port=5000, debug=debug)
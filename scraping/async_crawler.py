@@ -0,0 +1,274 @@
+# async_crawler.py
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack
+from urllib.parse import urlparse
+
+import aiohttp
+from aiohttp_socks import ProxyConnector
+
+from config import Config
+from .fetcher import RETRYABLE_STATUS, CHUNK_SIZE, PageReader, check_headers
+from .metrics import metrics
+
+
+class AsyncCrawler:
+    """Motor de rastreo asíncrono para OnionScraper.
+
+    Mantiene varias descargas en vuelo a través del proxy SOCKS5h y separa el
+    trabajo en etapas (descarga -> parseo -> NLP/clasificación -> guardado)
+    comunicadas por colas, de forma que una llamada lenta al LLM no detiene
+    a los descargadores. Las URLs se reservan por lotes de la frontera del
+    scraper, igual que en el bucle serie, y se dan por terminadas al guardarse.
+    """
+
+    def __init__(self, scraper, concurrency=None, per_host_concurrency=None, analysis_workers=None, parse_workers=2):
+        self.scraper = scraper
+        self.concurrency = concurrency or Config.CRAWL_CONCURRENCY
+        self.per_host_concurrency = per_host_concurrency or Config.CRAWL_PER_HOST_CONCURRENCY
+        self.analysis_workers = analysis_workers or Config.CRAWL_ANALYSIS_WORKERS
+        self.parse_workers = parse_workers
+        self.host_semaphores = {}
+        # URLs reservadas de la frontera del scraper que aún no han salido del parseo
+        self.in_flight = 0
+
+    def run(self):
+        self.scraper.async_crawler = self
+        try:
+            asyncio.run(self.crawl())
+        finally:
+            self.scraper.async_crawler = None
+
+    def queue_depth(self):
+        frontier = getattr(self, 'frontier', None)
+        if frontier is None:
+            return 0
+        return frontier.qsize() + self.parse_queue.qsize() + self.analysis_queue.qsize()
+
+    async def crawl(self):
+        # El número de descargadores es el límite global de peticiones en vuelo
+        self.frontier = asyncio.Queue()
+        self.parse_queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        self.analysis_queue = asyncio.Queue(maxsize=self.analysis_workers * 4)
+        self.parse_executor = ThreadPoolExecutor(max_workers=self.parse_workers, thread_name_prefix='parseo')
+        self.analysis_executor = ThreadPoolExecutor(max_workers=self.analysis_workers, thread_name_prefix='analisis')
+        # La conexión a la base de datos no es segura entre hilos: un único hilo escribe
+        self.db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db')
+
+        tasks = []
+        try:
+            async with AsyncExitStack() as stack:
+                await self.open_sessions(stack)
+                tasks += [asyncio.create_task(self.fetch_worker()) for _ in range(self.concurrency)]
+                tasks += [asyncio.create_task(self.parse_worker()) for _ in range(self.parse_workers)]
+                tasks += [asyncio.create_task(self.analysis_worker()) for _ in range(self.analysis_workers)]
+                await self.drain()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.parse_executor.shutdown(wait=True)
+            self.analysis_executor.shutdown(wait=True)
+            self.db_executor.shutdown(wait=True)
+        logging.info(f"Rastreo asíncrono finalizado: {self.scraper.progress['paginas_procesadas']} páginas procesadas.")
+
+    async def open_sessions(self, stack):
+        # Una sesión (y su pool de conexiones keep-alive) por circuito de la capa de descarga
+        self.fetcher = self.scraper.fetcher
+        timeout = aiohttp.ClientTimeout(total=self.fetcher.timeout)
+        self.sessions = {}
+        for circuit in self.fetcher.pool.circuits:
+            if circuit.proxy_url:
+                connector = ProxyConnector.from_url(
+                    circuit.proxy_url.replace('socks5h://', 'socks5://', 1),
+                    rdns=True,
+                    limit=self.concurrency,
+                    limit_per_host=self.per_host_concurrency
+                )
+            else:
+                connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host_concurrency)
+            session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self.sessions[circuit.name] = await stack.enter_async_context(session)
+
+    async def drain(self):
+        loop = asyncio.get_running_loop()
+        await self.refill()
+        while True:
+            await self.frontier.join()
+            if await self.refill() or self.in_flight:
+                continue
+            await self.analysis_queue.join()
+            # Los trabajadores también reservan URLs: solo se termina si no queda ninguna en vuelo
+            if self.in_flight:
+                continue
+            if self.scraper.is_cancelled():
+                break
+            if await loop.run_in_executor(self.db_executor, self.scraper.frontier.is_exhausted):
+                break
+            # Otros trabajadores tienen URLs reservadas y aún pueden encolar enlaces
+            await asyncio.sleep(Config.FRONTIER_POLL_INTERVAL)
+            await self.refill()
+
+    async def refill(self):
+        # Reserva en la frontera del scraper lo justo para mantener ocupados a los
+        # descargadores; el resto queda disponible para otros trabajadores
+        wanted = min(self.concurrency * 2, Config.FRONTIER_LEASE_BATCH) - self.frontier.qsize()
+        if wanted <= 0 or self.scraper.is_cancelled():
+            return 0
+        loop = asyncio.get_running_loop()
+        leased = await loop.run_in_executor(self.db_executor, self.scraper.frontier.lease, wanted)
+        for entry in leased:
+            self.in_flight += 1
+            self.frontier.put_nowait(entry)
+        return len(leased)
+
+    def frontier_task_done(self):
+        self.in_flight -= 1
+        self.frontier.task_done()
+
+    async def complete(self, urls):
+        await asyncio.get_running_loop().run_in_executor(self.db_executor, self.scraper.frontier.complete, urls)
+
+    async def fetch_worker(self):
+        while True:
+            url, depth = await self.frontier.get()
+            handed_off = False
+            try:
+                if self.scraper.is_cancelled():
+                    # Sin completar: al cancelar, la frontera devuelve la URL a la cola
+                    handed_off = None
+                    continue
+                logging.info(f"Visitando: {url} (Profundidad: {depth})")
+                with metrics.timer('descarga'):
+                    fetched = await self.fetch(url)
+                if fetched and (fetched['status'] == 304 or self.scraper.is_unchanged(url, fetched['content_hash'])):
+                    await asyncio.get_running_loop().run_in_executor(
+                        self.db_executor, self.scraper.handle_unchanged,
+                        url, depth, fetched['headers'], fetched['content_hash'])
+                elif fetched:
+                    self.scraper.count_page('descargada', fetched['bytes'])
+                    await self.parse_queue.put((url, depth, fetched))
+                    handed_off = True
+            except Exception as e:
+                self.scraper.record_error(f"Error inesperado descargando {url}: {e}")
+            finally:
+                # Si la página pasa al parseo, es esa etapa la que la da por terminada
+                # tras encolar sus enlaces
+                if handed_off is False:
+                    await self.complete([url])
+                if not handed_off:
+                    self.frontier_task_done()
+                    await self.refill()
+
+    async def fetch(self, url):
+        host = urlparse(url).hostname
+        semaphore = self.host_semaphores.setdefault(host, asyncio.Semaphore(self.per_host_concurrency))
+        pool = self.fetcher.pool
+        tried = set()
+        async with semaphore:
+            start_time = time.time()
+            for attempt in range(self.fetcher.max_retries + 1):
+                circuit = pool.choose(host, exclude=tried)
+                tried.add(circuit.name)
+                request_start = time.monotonic()
+                try:
+                    async with self.sessions[circuit.name].get(url, headers=self.scraper.conditional_headers(url)) as response:
+                        pool.record_success(circuit, time.monotonic() - request_start)
+                        if response.status in RETRYABLE_STATUS and attempt < self.fetcher.max_retries:
+                            espera = self.fetcher.backoff(attempt, response)
+                            logging.warning(f"{url} devolvió {response.status}; reintento {attempt + 1} en {espera:.1f} s")
+                            await asyncio.sleep(espera)
+                            continue
+                        fetched = {'status': response.status, 'url': str(response.url), 'headers': response.headers, 'html': None,
+                                   'content_hash': None, 'bytes': 0}
+                        if response.status == 304:
+                            return fetched
+                        if response.status != 200:
+                            self.scraper.record_error(f"Error al acceder a la página {url}: Código de estado {response.status}")
+                            return None
+                        # Igual que Fetcher.fetch_page: se filtra por cabeceras y se lee por fragmentos
+                        reason = check_headers(response.headers)
+                        if reason:
+                            self.scraper.record_skip(url, reason, response.headers)
+                            return None
+                        reader = PageReader(response.headers)
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            if not reader.feed(chunk):
+                                # Al salir sin leer el resto, aiohttp cierra la conexión
+                                self.scraper.record_skip(url, 'abortada', response.headers, reader.size)
+                                return None
+                        fetched['html'], fetched['content_hash'] = reader.finish()
+                        fetched['bytes'] = reader.size
+                        break
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    pool.record_failure(circuit)
+                    if attempt == self.fetcher.max_retries:
+                        self.scraper.record_error(f"Error al realizar la solicitud HTTP: {str(e)}")
+                        return None
+                    espera = self.fetcher.backoff(attempt)
+                    logging.warning(f"Error descargando {url} por {circuit.name} ({e}); reintento {attempt + 1} en {espera:.1f} s")
+                    await asyncio.sleep(espera)
+        fetched['tiempo_conexion'] = time.time() - start_time
+        logging.info(f"Tiempo de conexión para {url}: {fetched['tiempo_conexion']:.2f} segundos")
+        return fetched
+
+    async def parse_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            url, depth, fetched = await self.parse_queue.get()
+            try:
+                start_time = time.time()
+                result = await loop.run_in_executor(self.parse_executor, self.parse_page,
+                                                    url, fetched['html'], depth, fetched['url'])
+                result['tiempo_conexion'] = fetched['tiempo_conexion']
+                result['tiempos']['descarga'] = fetched['tiempo_conexion']
+                result['estado_http'] = (fetched['headers'], fetched['content_hash'])
+                result['tiempo_scraping'] = time.time() - start_time
+                await self.analysis_queue.put(result)
+            except Exception as e:
+                self.scraper.record_error(f"Error al procesar el HTML de {url}: {e}")
+                await self.complete([url])
+            finally:
+                self.parse_queue.task_done()
+                self.frontier_task_done()
+                await self.refill()
+
+    def parse_page(self, url, html, depth, final_url=None):
+        result, anchors = self.scraper.extract_page(url, html, depth, final_url)
+        self.scraper.enqueue_urls(anchors, depth)
+        return result
+
+    async def analysis_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Se toma lo que haya acumulado en la cola (hasta LLM_BATCH_MAX_PAGES) para
+            # que el clasificador pueda agrupar páginas cortas en una sola petición
+            batch = [await self.analysis_queue.get()]
+            while len(batch) < Config.LLM_BATCH_MAX_PAGES and not self.analysis_queue.empty():
+                batch.append(self.analysis_queue.get_nowait())
+            urls = [result['url'] for result in batch]
+            try:
+                if self.scraper.is_cancelled():
+                    urls = []
+                    continue
+                start_time = time.time()
+                batch = await loop.run_in_executor(self.analysis_executor, self.scraper.analyze_results, batch)
+                elapsed = (time.time() - start_time) / len(batch)
+                for result in batch:
+                    result['tiempo_scraping'] += elapsed
+                    logging.info(f"Tiempo de scraping para {result['url']}: {result['tiempo_scraping']:.2f} segundos")
+                    headers, content_hash = result.pop('estado_http')
+                    await loop.run_in_executor(self.db_executor, self.scraper.save_result, result, headers, content_hash)
+                    self.scraper.count_page('procesada')
+                    # Si el consumidor del resumen va lento se bloquea el hilo de la base de datos, no el bucle
+                    await loop.run_in_executor(self.db_executor, self.scraper.emit, result)
+            except Exception as e:
+                self.scraper.record_error(f"Error al analizar {', '.join(urls)}: {e}")
+            finally:
+                # Las páginas se dan por terminadas en la frontera cuando ya están guardadas
+                if urls:
+                    await self.complete(urls)
+                for _ in batch:
+                    self.analysis_queue.task_done()
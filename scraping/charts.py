@@ -0,0 +1,54 @@
+# charts.py
+import base64
+import io
+import threading
+
+from matplotlib import colormaps
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+def render_theme_pie(labels, data):
+    # API orientada a objetos: cada llamada crea su propia figura, sin tocar el
+    # estado global de pyplot, por lo que varias peticiones pueden dibujar a la vez
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    wedges, texts, autotexts = ax.pie(data, labels=labels, autopct='%1.1f%%', startangle=90,
+                                      colors=colormaps['Paired'].colors)
+    ax.axis('equal')  # Para que el gráfico sea circular
+
+    # Texto blanco sobre fondo transparente, como el estilo dark_background original
+    for text in texts:
+        text.set_color('white')
+    for autotext in autotexts:
+        autotext.set_color('white')
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight', transparent=True)
+    return base64.b64encode(buf.getvalue()).decode('utf-8')
+
+
+class ChartCache:
+    """Guarda el último gráfico generado junto con los datos que lo produjeron.
+    Solo se vuelve a dibujar cuando cambian los agregados."""
+
+    def __init__(self, render):
+        self.render = render
+        self.key = None
+        self.image = None
+        self.hits = 0
+        self.renders = 0
+        self.lock = threading.Lock()
+
+    def get(self, labels, data):
+        key = (tuple(labels), tuple(data))
+        with self.lock:
+            # El lock evita que varias peticiones simultáneas dibujen el mismo gráfico
+            if key != self.key:
+                self.image = self.render(labels, data)
+                self.key = key
+                self.renders += 1
+            else:
+                self.hits += 1
+            return self.image
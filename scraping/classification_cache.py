@@ -0,0 +1,111 @@
+# classification_cache.py
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+
+class ClassificationCache:
+    """Caché de resultados del clasificador indexada por el hash del texto normalizado.
+
+    Un LRU en memoria atiende las páginas repetidas dentro del proceso y, por detrás,
+    ``store`` (un PooledDatabase) persiste las entradas entre rastreos. Ambas capas
+    aplican la misma caducidad (TTL); la tabla se poda por tamaño cada cierto número
+    de escrituras.
+
+    ``self.lock`` protege solo el LRU y los contadores: las consultas a ``store`` se
+    hacen fuera de él y en paralelo, así que ``store`` debe poder usarse desde varios
+    hilos (como PooledDatabase, que toma una conexión del pool en cada llamada).
+    """
+
+    PRUNE_EVERY = 500
+
+    def __init__(self, store=None, memory_size=None, ttl=None, max_entries=None):
+        self.store = store
+        self.memory_size = memory_size or Config.CLASSIFICATION_CACHE_MEMORY_SIZE
+        self.ttl = ttl or Config.CLASSIFICATION_CACHE_TTL
+        self.max_entries = max_entries or Config.CLASSIFICATION_CACHE_MAX_ENTRIES
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.counters = {'aciertos_memoria': 0, 'aciertos_bd': 0, 'fallos': 0, 'escrituras': 0}
+
+    @staticmethod
+    def normalize(texto):
+        return re.sub(r'\s+', ' ', texto or '').strip().lower()
+
+    @classmethod
+    def make_key(cls, texto, model, prompt_version):
+        digest = hashlib.sha256()
+        digest.update(f'{model}\0{prompt_version}\0'.encode('utf-8'))
+        digest.update(cls.normalize(texto).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        return self.get_any([key])
+
+    def get_any(self, keys):
+        """Primera entrada vigente de ``keys``, en orden de preferencia. Cuenta como
+        una sola consulta: un acierto (memoria o base de datos) o un fallo."""
+        now = time.time()
+        with self.lock:
+            for key in keys:
+                entry = self.memory.get(key)
+                if entry and now - entry[2] < self.ttl:
+                    self.memory.move_to_end(key)
+                    self.counters['aciertos_memoria'] += 1
+                    return entry[0], entry[1]
+                if entry:
+                    del self.memory[key]
+
+        if self.store:
+            try:
+                rows = self.store.get_cached_classifications(list(keys), self.ttl)
+            except Exception as e:
+                logging.error(f"Error leyendo la caché de clasificación: {e}")
+                rows = {}
+            for key in keys:
+                if key in rows:
+                    resumen, es_ilicito, created_at = rows[key]
+                    self.remember(key, resumen, es_ilicito, created_at)
+                    with self.lock:
+                        self.counters['aciertos_bd'] += 1
+                    return resumen, es_ilicito
+
+        with self.lock:
+            self.counters['fallos'] += 1
+        return None
+
+    def set(self, key, resumen, es_ilicito):
+        self.remember(key, resumen, es_ilicito, time.time())
+        with self.lock:
+            self.counters['escrituras'] += 1
+            self.writes += 1
+            prune = self.writes % self.PRUNE_EVERY == 0
+        if not self.store:
+            return
+        try:
+            self.store.save_cached_classification(key, resumen, es_ilicito)
+            if prune:
+                self.store.prune_classification_cache(self.max_entries, self.ttl)
+        except Exception as e:
+            logging.error(f"Error escribiendo en la caché de clasificación: {e}")
+
+    def remember(self, key, resumen, es_ilicito, created_at):
+        with self.lock:
+            self.memory[key] = (resumen, es_ilicito, created_at)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['entradas_memoria'] = len(self.memory)
+        lookups = stats['aciertos_memoria'] + stats['aciertos_bd'] + stats['fallos']
+        stats['tasa_aciertos'] = (stats['aciertos_memoria'] + stats['aciertos_bd']) / lookups if lookups else 0.0
+        return stats
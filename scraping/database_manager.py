@@ -3,15 +3,31 @@ import mysql.connector
 import logging
 import uuid
 import time
+import hashlib
+from datetime import datetime, timedelta
+from config import Config
+from .migrations import ensure_schema, run_migrations, legacy_copy_pending
+from .urls import normalize_host
+from .metrics import metrics, PAGE_STAGES
+from .link_graph import record_page_links
+from .storage import (new_id, format_id, parse_id, compress_text, decompress_text, snippet, search_text, url_hash,
+                      url_dictionary)
+
+def format_ids(rows):
+    # Ids binarios en hexadecimal, para JSON, plantillas y cursores
+    for row in rows:
+        row['id'] = format_id(row['id'])
+    return rows
 
 class DatabaseManager:
-    def __init__(self, host, user, password, database):
+    def __init__(self, host=None, user=None, password=None, database=None, connection=None):
         self.host = host
         self.user = user
         self.password = password
         self.database = database
-        self.connection = None
-        self.connect()
+        self.connection = connection
+        if connection is None:
+            self.connect()
 
     def connect(self):
         retry_count = 0
@@ -23,10 +39,10 @@ class DatabaseManager:
                     user=self.user,
                     password=self.password,
                     database=self.database,
-                    use_pure=True
+                    use_pure=Config.DB_USE_PURE
                 )
                 logging.info("Conexión a la base de datos establecida con éxito.")
-                self.create_tables()
+                ensure_schema(self.connection)
                 break
             except mysql.connector.Error as error:
                 logging.error(f"Error al conectar a la base de datos: {error}")
@@ -36,153 +52,579 @@ class DatabaseManager:
                     raise ConnectionError("Error al conectar a la base de datos después de varios intentos.")
 
     def create_tables(self):
-        with self.connection.cursor() as cursor:
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS datos_completos (
-                    id CHAR(36) PRIMARY KEY,
-                    url VARCHAR(255) NOT NULL,
-                    titulo VARCHAR(255),
-                    texto TEXT,
-                    fecha_captura DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    clasificacion_tematica VARCHAR(255),
-                    resumen TEXT,
-                    es_ilicito TINYINT(1),
-                    tiempo_scraping FLOAT,
-                    tiempo_conexion FLOAT,
-                    profundidad INT,
-                    INDEX (url),
-                    INDEX (clasificacion_tematica)
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS imagenes (
-                    id CHAR(36) PRIMARY KEY,
-                    datos_completos_id CHAR(36),
-                    url VARCHAR(255),
-                    imagen VARCHAR(255),
-                    FOREIGN KEY (datos_completos_id) REFERENCES datos_completos(id)
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS enlaces (
-                    id CHAR(36) PRIMARY KEY,
-                    datos_completos_id CHAR(36),
-                    url VARCHAR(255),
-                    enlace VARCHAR(1000),
-                    FOREIGN KEY (datos_completos_id) REFERENCES datos_completos(id)
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS metadatos (
-                    id CHAR(36) PRIMARY KEY,
-                    datos_completos_id CHAR(36),
-                    url VARCHAR(255),
-                    nombre VARCHAR(255),
-                    contenido TEXT,
-                    FOREIGN KEY (datos_completos_id) REFERENCES datos_completos(id)
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS entidades (
-                    id CHAR(36) PRIMARY KEY,
-                    datos_completos_id CHAR(36),
-                    url VARCHAR(255),
-                    entidad VARCHAR(255),
-                    tipo VARCHAR(255),
-                    FOREIGN KEY (datos_completos_id) REFERENCES datos_completos(id)
-                )
-            """)
-            self.connection.commit()
+        run_migrations(self.connection)
 
     def save_data(self, url, titulo, texto, enlaces, imagenes, scripts, estilos, metadatos, entidades,
-                  clasificacion_tematica, resumen, es_ilicito, tiempo_scraping, tiempo_conexion, profundidad):
+                  clasificacion_tematica, resumen, es_ilicito, tiempo_scraping, tiempo_conexion, profundidad, tiempos=None):
+        page = {
+            'url': url, 'titulo': titulo, 'texto': texto, 'enlaces': enlaces, 'imagenes': imagenes,
+            'scripts': scripts, 'estilos': estilos, 'metadatos': metadatos, 'entidades': entidades,
+            'clasificacion': clasificacion_tematica, 'resumen': resumen, 'es_ilicito': es_ilicito,
+            'tiempo_scraping': tiempo_scraping, 'tiempo_conexion': tiempo_conexion, 'profundidad': profundidad,
+            'tiempos': tiempos
+        }
+        return self.save_pages([page])
+
+    def save_pages(self, pages):
+        # Una sola transacción para todas las páginas y un executemany por tabla: el
+        # conector agrupa cada uno en un INSERT multi-fila en lugar de una ida y vuelta
+        # por enlace, imagen, metadato o entidad. Las URLs se guardan una vez en la
+        # tabla urls y las páginas y enlaces las referencian por id.
+        start_time = time.perf_counter()
         try:
+            url_ids = url_dictionary.resolve(self.connection, [page['url'] for page in pages] +
+                                             [enlace for page in pages for enlace in page['enlaces']])
+            datos, enlaces, imagenes, metadatos, entidades, tiempos = [], [], [], [], [], []
+            for page in pages:
+                data_id = new_id()
+                url = page['url']
+                texto = page['texto']
+                datos.append((data_id, url_ids[url], normalize_host(url), page['titulo'], snippet(texto), compress_text(texto),
+                              search_text(texto), page['clasificacion'], page['resumen'], page['es_ilicito'],
+                              page['tiempo_scraping'], page['tiempo_conexion'], page['profundidad']))
+                enlaces.extend((data_id, orden, url_ids[enlace]) for orden, enlace in enumerate(page['enlaces']))
+                imagenes.extend((data_id, orden, imagen) for orden, imagen in enumerate(page['imagenes']))
+                metadatos.extend((data_id, orden, nombre, contenido)
+                                 for orden, (nombre, contenido) in enumerate(page['metadatos'].items()))
+                entidades.extend((data_id, orden, entidad, tipo) for orden, (entidad, tipo) in enumerate(page['entidades']))
+                if Config.METRICS_STORE_PAGE_TIMINGS and page.get('tiempos'):
+                    tiempos.append((data_id, *(page['tiempos'].get(etapa) for etapa in PAGE_STAGES)))
+
             self.connection.start_transaction()
             with self.connection.cursor() as cursor:
-                data_id = str(uuid.uuid4())
-                cursor.execute("""
-                    INSERT INTO datos_completos (id, url, titulo, texto, clasificacion_tematica, resumen, es_ilicito, tiempo_scraping, tiempo_conexion, profundidad)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (data_id, url, titulo, texto, clasificacion_tematica, resumen, es_ilicito, tiempo_scraping, tiempo_conexion, profundidad))
-                
-                for enlace in enlaces:
-                    enlace_id = str(uuid.uuid4())
-                    cursor.execute("""
-                        INSERT INTO enlaces (id, datos_completos_id, url, enlace)
+                cursor.executemany("""
+                    INSERT INTO datos_completos (id, url_id, host, titulo, fragmento, texto_comprimido, texto_busqueda,
+                                                 clasificacion_tematica, resumen, es_ilicito, tiempo_scraping, tiempo_conexion, profundidad)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, datos)
+                if enlaces:
+                    cursor.executemany("""
+                        INSERT INTO enlaces (datos_completos_id, orden, url_id)
+                        VALUES (%s, %s, %s)
+                    """, enlaces)
+                if imagenes:
+                    cursor.executemany("""
+                        INSERT INTO imagenes (datos_completos_id, orden, imagen)
+                        VALUES (%s, %s, %s)
+                    """, imagenes)
+                if metadatos:
+                    cursor.executemany("""
+                        INSERT INTO metadatos (datos_completos_id, orden, nombre, contenido)
                         VALUES (%s, %s, %s, %s)
-                    """, (enlace_id, data_id, url, enlace))
-                
-                for imagen in imagenes:
-                    imagen_id = str(uuid.uuid4())
-                    cursor.execute("""
-                        INSERT INTO imagenes (id, datos_completos_id, url, imagen)
+                    """, metadatos)
+                if entidades:
+                    cursor.executemany("""
+                        INSERT INTO entidades (datos_completos_id, orden, entidad, tipo)
                         VALUES (%s, %s, %s, %s)
-                    """, (imagen_id, data_id, url, imagen))
-                
-                for nombre, contenido in metadatos.items():
-                    meta_id = str(uuid.uuid4())
-                    cursor.execute("""
-                        INSERT INTO metadatos (id, datos_completos_id, url, nombre, contenido)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, (meta_id, data_id, url, nombre, contenido))
-                
-                for entidad, tipo in entidades:
-                    entidad_id = str(uuid.uuid4())
-                    cursor.execute("""
-                        INSERT INTO entidades (id, datos_completos_id, url, entidad, tipo)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, (entidad_id, data_id, url, entidad, tipo))
+                    """, entidades)
+                if tiempos:
+                    cursor.executemany("""
+                        INSERT INTO tiempos_pagina (datos_completos_id, descarga, parseo, idioma, ner, clasificacion)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                    """, tiempos)
+                self.update_rollups(cursor, pages)
 
             self.connection.commit()
-            logging.info(f"Datos guardados exitosamente para URL={url}")
+            logging.info(f"Datos guardados exitosamente para {len(pages)} página(s): {', '.join(page['url'] for page in pages[:5])}")
+            # Tras el commit, para que el grafo solo refleje páginas guardadas
+            record_page_links(pages)
+            return True
         except mysql.connector.Error as err:
             self.connection.rollback()
             logging.error(f"Error al guardar datos: {err}")
+            return False
+        finally:
+            metrics.record_stage('escritura', time.perf_counter() - start_time)
+
+    def update_rollups(self, cursor, pages):
+        # Los agregados se actualizan en la misma transacción que las páginas, así
+        # las estadísticas se leen de tablas con una fila por temática o dominio.
+        # Las claves se ordenan para que dos escritores bloqueen filas en el mismo orden.
+        tematicas, dominios = {}, {}
+        for page in pages:
+            tematica = page['clasificacion'] or ''
+            ilicita = 1 if page['es_ilicito'] else 0
+            paginas, ilicitas = tematicas.get(tematica, (0, 0))
+            tematicas[tematica] = (paginas + 1, ilicitas + ilicita)
+            host = normalize_host(page['url'])
+            if host:
+                totals = dominios.setdefault(host, [0, 0, 0, 0.0, 0.0])
+                totals[0] += 1
+                totals[1] += ilicita
+                totals[2] = max(totals[2], page['profundidad'] or 0)
+                totals[3] += page['tiempo_scraping'] or 0
+                totals[4] += page['tiempo_conexion'] or 0
+        rows = [(tematica, paginas, ilicitas) for tematica, (paginas, ilicitas) in sorted(tematicas.items())]
+        cursor.executemany("""
+            INSERT INTO resumen_tematicas (clasificacion_tematica, paginas, ilicitas)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE paginas = paginas + VALUES(paginas), ilicitas = ilicitas + VALUES(ilicitas)
+        """, rows)
+        cursor.executemany("""
+            INSERT INTO resumen_diario (dia, clasificacion_tematica, paginas, ilicitas)
+            VALUES (CURDATE(), %s, %s, %s)
+            ON DUPLICATE KEY UPDATE paginas = paginas + VALUES(paginas), ilicitas = ilicitas + VALUES(ilicitas)
+        """, rows)
+        if dominios:
+            cursor.executemany("""
+                INSERT INTO resumen_dominios (host, paginas, ilicitas, max_profundidad, tiempo_scraping, tiempo_conexion, ultima_captura)
+                VALUES (%s, %s, %s, %s, %s, %s, NOW())
+                ON DUPLICATE KEY UPDATE
+                    paginas = paginas + VALUES(paginas),
+                    ilicitas = ilicitas + VALUES(ilicitas),
+                    max_profundidad = GREATEST(COALESCE(max_profundidad, 0), VALUES(max_profundidad)),
+                    tiempo_scraping = tiempo_scraping + VALUES(tiempo_scraping),
+                    tiempo_conexion = tiempo_conexion + VALUES(tiempo_conexion),
+                    ultima_captura = VALUES(ultima_captura)
+            """, [(host, *totals) for host, totals in sorted(dominios.items())])
 
-    def get_history(self):
+    def get_history(self, limit, after=None, host=None, tematica=None, es_ilicito=None, order='fecha'):
+        # Paginación por clave (fecha_captura, id) en lugar de OFFSET: cada página
+        # empieza donde acabó la anterior usando el índice, sea cual sea el tamaño de
+        # la tabla. Solo se leen las columnas del listado, con el texto recortado.
+        # Con order='pagerank' la clave es (pagerank, id), sobre la columna indexada que
+        # LinkRanker copia de puntuaciones en cada captura.
+        # El fragmento se guarda en claro al escribir; el texto completo está comprimido.
+        conditions, params = [], []
+        if host:
+            conditions.append("host = %s")
+            params.append(normalize_host(host))
+        if tematica:
+            conditions.append("clasificacion_tematica = %s")
+            params.append(tematica)
+        if es_ilicito is not None:
+            conditions.append("es_ilicito = %s")
+            params.append(int(es_ilicito))
+        # La columna pagerank cambia en cada cálculo de LinkRanker: un cursor de una
+        # página anterior puede entonces saltarse o repetir filas
+        key = "d.pagerank" if order == 'pagerank' else "fecha_captura"
+        if after:
+            value, last_id = after
+            conditions.append(f"({key} < %s OR ({key} = %s AND d.id < %s))")
+            params.extend((value, value, parse_id(last_id)))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
         with self.connection.cursor(dictionary=True) as cursor:
-            cursor.execute("SELECT * FROM datos_completos ORDER BY fecha_captura DESC")
-            return cursor.fetchall()
+            cursor.execute(f"""
+                SELECT d.id, u.url, host, titulo, fragmento, resumen,
+                       clasificacion_tematica, es_ilicito, fecha_captura, d.pagerank
+                FROM datos_completos d
+                JOIN urls u ON u.id = d.url_id
+                {where}
+                ORDER BY {key} DESC, d.id DESC
+                LIMIT %s
+            """, params + [limit + 1])
+            rows = format_ids(cursor.fetchall())
+        # Se pide una fila de más para saber si hay página siguiente
+        has_more = len(rows) > limit
+        return rows[:limit], has_more
 
     def get_stats_for_domain(self, domain):
+        # Igualdad sobre la columna host indexada en lugar de LIKE '%dominio%'
         with self.connection.cursor(dictionary=True) as cursor:
             cursor.execute("""
-                SELECT url, tiempo_scraping, tiempo_conexion, profundidad, clasificacion_tematica, es_ilicito
-                FROM datos_completos
-                WHERE url LIKE %s
-            """, ('%' + domain + '%',))
+                SELECT u.url, tiempo_scraping, tiempo_conexion, profundidad, clasificacion_tematica, es_ilicito
+                FROM datos_completos d
+                JOIN urls u ON u.id = d.url_id
+                WHERE host = %s
+            """, (normalize_host(domain),))
             return cursor.fetchall()
 
     def get_summary_for_domain(self, domain):
+        host = normalize_host(domain)
         with self.connection.cursor(dictionary=True) as cursor:
             cursor.execute("""
                 SELECT
-                    COUNT(*) as total_urls,
-                    MAX(profundidad) as max_profundidad,
+                    COALESCE(SUM(paginas), 0) as total_urls,
+                    MAX(max_profundidad) as max_profundidad,
                     SUM(tiempo_scraping) as total_tiempo_scraping,
                     SUM(tiempo_conexion) as total_tiempo_conexion
-                FROM datos_completos
-                WHERE url LIKE %s
-            """, ('%' + domain + '%',))
+                FROM resumen_dominios
+                WHERE host = %s
+            """, (host,))
             summary_data = cursor.fetchone()
             cursor.execute("""
                 SELECT clasificacion_tematica, COUNT(*) as count
                 FROM datos_completos
-                WHERE url LIKE %s
+                WHERE host = %s
                 GROUP BY clasificacion_tematica
-            """, ('%' + domain + '%',))
+            """, (host,))
             summary_data['clasificaciones'] = cursor.fetchall()
             return summary_data
 
+    def is_legacy_copy_pending(self):
+        # Mientras queden páginas en las tablas _v1, los agregados las cuentan pero
+        # el detalle (datos_completos) todavía no
+        with self.connection.cursor() as cursor:
+            pending = legacy_copy_pending(cursor)
+        self.connection.commit()
+        return pending
+
+    def search_pages(self, query, limit, offset=0, host=None, boolean_mode=False, order='relevancia'):
+        # Búsqueda sobre el índice FULLTEXT (titulo, texto_busqueda, resumen) ordenada
+        # por relevancia, o por PageRank y después relevancia; solo se devuelven las
+        # columnas que muestra el listado. texto_busqueda es el prefijo en claro del
+        # texto, que se guarda comprimido.
+        mode = 'IN BOOLEAN MODE' if boolean_mode else 'IN NATURAL LANGUAGE MODE'
+        match = f"MATCH (titulo, texto_busqueda, resumen) AGAINST (%s {mode})"
+        where = match
+        params = [query]
+        if host:
+            where += " AND host = %s"
+            params.append(normalize_host(host))
+        if order == 'pagerank':
+            order_by = "pagerank DESC, relevancia DESC"
+        else:
+            order_by = "relevancia DESC, fecha_captura DESC"
+        with self.connection.cursor(dictionary=True) as cursor:
+            cursor.execute(f"SELECT COUNT(*) AS total FROM datos_completos WHERE {where}", params)
+            total = cursor.fetchone()['total']
+            cursor.execute(f"""
+                SELECT d.id, u.url, host, titulo, fragmento, resumen,
+                       clasificacion_tematica, es_ilicito, fecha_captura, {match} AS relevancia, d.pagerank
+                FROM datos_completos d
+                JOIN urls u ON u.id = d.url_id
+                WHERE {where}
+                ORDER BY {order_by}
+                LIMIT %s OFFSET %s
+            """, [query] + params + [limit, offset])
+            return total, format_ids(cursor.fetchall())
+
+    def get_page(self, page_id):
+        # Captura completa con el texto descomprimido, sus enlaces, imágenes, metadatos y entidades
+        page_id = parse_id(page_id)
+        with self.connection.cursor(dictionary=True) as cursor:
+            cursor.execute("""
+                SELECT d.id, u.url, host, titulo, texto_comprimido, fecha_captura, clasificacion_tematica, resumen,
+                       es_ilicito, tiempo_scraping, tiempo_conexion, profundidad
+                FROM datos_completos d
+                JOIN urls u ON u.id = d.url_id
+                WHERE d.id = %s
+            """, (page_id,))
+            page = cursor.fetchone()
+            if page is None:
+                return None
+            page['texto'] = decompress_text(page.pop('texto_comprimido'))
+            cursor.execute("""
+                SELECT u.url FROM enlaces e JOIN urls u ON u.id = e.url_id
+                WHERE e.datos_completos_id = %s ORDER BY e.orden
+            """, (page_id,))
+            page['enlaces'] = [row['url'] for row in cursor.fetchall()]
+            cursor.execute("SELECT imagen FROM imagenes WHERE datos_completos_id = %s ORDER BY orden", (page_id,))
+            page['imagenes'] = [row['imagen'] for row in cursor.fetchall()]
+            cursor.execute("SELECT nombre, contenido FROM metadatos WHERE datos_completos_id = %s ORDER BY orden", (page_id,))
+            page['metadatos'] = {row['nombre']: row['contenido'] for row in cursor.fetchall()}
+            cursor.execute("SELECT entidad, tipo FROM entidades WHERE datos_completos_id = %s ORDER BY orden", (page_id,))
+            page['entidades'] = [(row['entidad'], row['tipo']) for row in cursor.fetchall()]
+        return format_ids([page])[0]
+
     def get_stats_by_tematica(self):
+        # Lectura O(temáticas) de la tabla de agregados
         with self.connection.cursor(dictionary=True) as cursor:
             cursor.execute("""
-                SELECT clasificacion_tematica, COUNT(*) as count
-                FROM datos_completos
-                GROUP BY clasificacion_tematica
+                SELECT NULLIF(clasificacion_tematica, '') AS clasificacion_tematica, paginas AS count, ilicitas
+                FROM resumen_tematicas
+                WHERE paginas > 0
+                ORDER BY clasificacion_tematica
             """)
             return cursor.fetchall()
 
+    def get_daily_stats(self, days=30):
+        with self.connection.cursor(dictionary=True) as cursor:
+            cursor.execute("""
+                SELECT dia, NULLIF(clasificacion_tematica, '') AS clasificacion_tematica, paginas, ilicitas
+                FROM resumen_diario
+                WHERE dia >= CURDATE() - INTERVAL %s DAY
+                ORDER BY dia, clasificacion_tematica
+            """, (days,))
+            return cursor.fetchall()
+
+    def get_cached_classifications(self, claves, ttl):
+        # {clave: (resumen, es_ilicito, creado)} de las claves vigentes, en una sola consulta
+        limite = datetime.now() - timedelta(seconds=ttl)
+        placeholders = ', '.join(['%s'] * len(claves))
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT clave, resumen, es_ilicito, creado
+                FROM cache_clasificaciones
+                WHERE clave IN ({placeholders}) AND creado >= %s
+            """, (*claves, limite))
+            rows = cursor.fetchall()
+            if rows:
+                found = [row[0] for row in rows]
+                cursor.execute(f"UPDATE cache_clasificaciones SET ultimo_acceso = %s "
+                               f"WHERE clave IN ({', '.join(['%s'] * len(found))})", (datetime.now(), *found))
+        self.connection.commit()
+        return {clave: (resumen, bool(es_ilicito), creado.timestamp()) for clave, resumen, es_ilicito, creado in rows}
+
+    def save_cached_classification(self, clave, resumen, es_ilicito):
+        ahora = datetime.now()
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO cache_clasificaciones (clave, resumen, es_ilicito, creado, ultimo_acceso)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE resumen = VALUES(resumen), es_ilicito = VALUES(es_ilicito),
+                        creado = VALUES(creado), ultimo_acceso = VALUES(ultimo_acceso)
+                """, (clave, resumen, es_ilicito, ahora, ahora))
+            self.connection.commit()
+        except mysql.connector.Error as err:
+            self.connection.rollback()
+            logging.error(f"Error al guardar en la caché de clasificación: {err}")
+
+    def prune_classification_cache(self, max_entries, ttl):
+        limite = datetime.now() - timedelta(seconds=ttl)
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM cache_clasificaciones WHERE creado < %s", (limite,))
+            cursor.execute("SELECT COUNT(*) FROM cache_clasificaciones")
+            (total,) = cursor.fetchone()
+            exceso = total - max_entries
+            if exceso > 0:
+                # Se expulsan las entradas menos usadas recientemente
+                cursor.execute("DELETE FROM cache_clasificaciones ORDER BY ultimo_acceso ASC LIMIT %s", (exceso,))
+        self.connection.commit()
+        logging.info("Caché de clasificación podada.")
+
+    def get_url_states(self, host):
+        with self.connection.cursor(dictionary=True) as cursor:
+            cursor.execute("""
+                SELECT url, etag, last_modified, content_hash
+                FROM estado_urls
+                WHERE host = %s
+            """, (host,))
+            return {row['url']: row for row in cursor.fetchall()}
+
+    def save_url_states(self, states):
+        # states: lista de (url, host, etag, last_modified, content_hash, cambiada)
+        ahora = datetime.now()
+        rows = [(hashlib.sha256(url.encode('utf-8')).hexdigest(), url, host, etag, last_modified, content_hash,
+                 ahora, ahora if cambiada else None)
+                for url, host, etag, last_modified, content_hash, cambiada in states]
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.executemany("""
+                    INSERT INTO estado_urls (url_hash, url, host, etag, last_modified, content_hash, ultima_comprobacion, ultimo_cambio)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE etag = VALUES(etag), last_modified = VALUES(last_modified),
+                        content_hash = VALUES(content_hash), ultima_comprobacion = VALUES(ultima_comprobacion),
+                        ultimo_cambio = COALESCE(VALUES(ultimo_cambio), ultimo_cambio)
+                """, rows)
+            self.connection.commit()
+        except mysql.connector.Error as err:
+            self.connection.rollback()
+            logging.error(f"Error al guardar el estado de las URLs: {err}")
+
+    def get_links_for_url(self, url):
+        # Enlaces de la última captura de la URL, para seguir rastreando páginas sin cambios
+        with self.connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT u.url
+                FROM enlaces e
+                JOIN urls u ON u.id = e.url_id
+                JOIN (
+                    SELECT d.id FROM datos_completos d
+                    JOIN urls pu ON pu.id = d.url_id
+                    WHERE pu.url_hash = %s
+                    ORDER BY fecha_captura DESC LIMIT 1
+                ) ultima ON e.datos_completos_id = ultima.id
+                ORDER BY e.orden
+            """, (url_hash(url),))
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_page_links(self, after, batch_size):
+        # Lote de páginas en orden (fecha_captura, id) con sus enlaces, para cargar el
+        # grafo de enlaces: devuelve la clave de la última página (None al terminar)
+        # y una lista de (url, [enlaces])
+        with self.connection.cursor() as cursor:
+            if after:
+                fecha, last_id = after
+                cursor.execute("""
+                    SELECT d.id, u.url, fecha_captura FROM datos_completos d
+                    JOIN urls u ON u.id = d.url_id
+                    WHERE fecha_captura > %s OR (fecha_captura = %s AND d.id > %s)
+                    ORDER BY fecha_captura, d.id LIMIT %s
+                """, (fecha, fecha, last_id, batch_size))
+            else:
+                cursor.execute("""
+                    SELECT d.id, u.url, fecha_captura FROM datos_completos d
+                    JOIN urls u ON u.id = d.url_id
+                    ORDER BY fecha_captura, d.id LIMIT %s
+                """, (batch_size,))
+            pages = cursor.fetchall()
+            if not pages:
+                return None, []
+            links = {bytes(page_id): [] for page_id, _, _ in pages}
+            placeholders = ', '.join(['%s'] * len(links))
+            cursor.execute(f"""
+                SELECT e.datos_completos_id, u.url FROM enlaces e JOIN urls u ON u.id = e.url_id
+                WHERE e.datos_completos_id IN ({placeholders})
+            """, list(links))
+            for page_id, enlace in cursor.fetchall():
+                links[bytes(page_id)].append(enlace)
+        last_id, _, fecha = pages[-1]
+        return (fecha, last_id), [(url, links[bytes(page_id)]) for page_id, url, _ in pages]
+
+    def save_page_scores(self, rows):
+        # rows: (url, pagerank, enlaces_entrantes) calculados por el grafo de enlaces
+        try:
+            url_ids = url_dictionary.resolve(self.connection, [row[0] for row in rows])
+            rows = [(url_ids[url], pagerank, enlaces_entrantes) for url, pagerank, enlaces_entrantes in rows]
+            with self.connection.cursor() as cursor:
+                cursor.executemany("""
+                    INSERT INTO puntuaciones (url_id, pagerank, enlaces_entrantes, calculado)
+                    VALUES (%s, %s, %s, NOW())
+                    ON DUPLICATE KEY UPDATE pagerank = VALUES(pagerank), enlaces_entrantes = VALUES(enlaces_entrantes),
+                                            calculado = VALUES(calculado)
+                """, rows)
+                # Copia en las capturas para el orden del historial (índice url_id, fecha_captura)
+                cursor.executemany("UPDATE datos_completos SET pagerank = %s WHERE url_id = %s",
+                                   [(pagerank, url_id) for url_id, pagerank, _ in rows])
+            self.connection.commit()
+        except mysql.connector.Error as err:
+            self.connection.rollback()
+            logging.error(f"Error al guardar las puntuaciones: {err}")
+
+    def get_top_scores(self, limit):
+        with self.connection.cursor(dictionary=True) as cursor:
+            cursor.execute("""
+                SELECT u.url, pagerank, enlaces_entrantes, calculado
+                FROM puntuaciones p JOIN urls u ON u.id = p.url_id
+                ORDER BY pagerank DESC LIMIT %s
+            """, (limit,))
+            return cursor.fetchall()
+
+    def frontier_start(self, url_inicial):
+        # Devuelve (rastreo_id, reanudado): si hay un rastreo activo para la URL se
+        # reanuda; si no, se crea uno nuevo. INSERT IGNORE sobre la clave única
+        # resuelve la carrera entre dos procesos que arrancan a la vez.
+        url_hash = hashlib.sha256(url_inicial.encode('utf-8')).hexdigest()
+        ahora = datetime.now()
+        with self.connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT IGNORE INTO rastreos (id, url_inicial, url_hash, activo, estado, creado, actualizado)
+                VALUES (%s, %s, %s, 1, 'en_curso', %s, %s)
+            """, (str(uuid.uuid4()), url_inicial, url_hash, ahora, ahora))
+            creado = cursor.rowcount == 1
+            cursor.execute("SELECT id FROM rastreos WHERE url_hash = %s AND activo = 1", (url_hash,))
+            rastreo_id = cursor.fetchone()[0]
+        self.connection.commit()
+        return rastreo_id, not creado
+
+    def frontier_add(self, rastreo_id, entries):
+        # entries: lista de (url_hash, url, profundidad); los duplicados se ignoran
+        with self.connection.cursor() as cursor:
+            cursor.executemany("""
+                INSERT IGNORE INTO frontera (rastreo_id, url_hash, url, profundidad)
+                VALUES (%s, %s, %s, %s)
+            """, [(rastreo_id, url_hash, url, profundidad) for url_hash, url, profundidad in entries])
+            added = cursor.rowcount
+        self.connection.commit()
+        return added
+
+    def frontier_lease(self, rastreo_id, limit, lease_seconds, max_attempts):
+        # Reserva hasta limit URLs pendientes (o con la reserva caducada) marcándolas con
+        # un token propio; otro trabajador no las verá hasta que caduque la reserva
+        token = str(uuid.uuid4())
+        with self.connection.cursor() as cursor:
+            cursor.execute("""
+                UPDATE frontera
+                SET estado = 'en_proceso', lease_token = %s,
+                    lease_expira = NOW() + INTERVAL %s SECOND, intentos = intentos + 1
+                WHERE rastreo_id = %s AND intentos < %s
+                  AND (estado = 'pendiente' OR (estado = 'en_proceso' AND lease_expira < NOW()))
+                ORDER BY profundidad, id
+                LIMIT %s
+            """, (token, lease_seconds, rastreo_id, max_attempts, limit))
+            self.connection.commit()
+            if not cursor.rowcount:
+                return []
+            cursor.execute("""
+                SELECT url, profundidad FROM frontera
+                WHERE rastreo_id = %s AND lease_token = %s
+                ORDER BY profundidad, id
+            """, (rastreo_id, token))
+            return cursor.fetchall()
+
+    def frontier_finish_urls(self, rastreo_id, url_hashes, estado='hecho'):
+        # 'hecho' al terminar una URL; 'pendiente' la devuelve a la cola sin consumir
+        # el intento (p. ej. al cancelar)
+        penalty = 1 if estado == 'pendiente' else 0
+        with self.connection.cursor() as cursor:
+            cursor.executemany("""
+                UPDATE frontera SET estado = %s, lease_token = NULL, lease_expira = NULL,
+                    intentos = GREATEST(intentos - %s, 0)
+                WHERE rastreo_id = %s AND url_hash = %s
+            """, [(estado, penalty, rastreo_id, url_hash) for url_hash in url_hashes])
+        self.connection.commit()
+
+    def frontier_counts(self, rastreo_id, max_attempts):
+        with self.connection.cursor(dictionary=True) as cursor:
+            cursor.execute("""
+                SELECT
+                    COALESCE(SUM(estado = 'pendiente'
+                        OR (estado = 'en_proceso' AND lease_expira < NOW() AND intentos < %s)), 0) AS pendientes,
+                    COALESCE(SUM(estado = 'en_proceso' AND lease_expira >= NOW()), 0) AS en_proceso,
+                    COALESCE(SUM(estado = 'hecho'), 0) AS hechas
+                FROM frontera
+                WHERE rastreo_id = %s
+            """, (max_attempts, rastreo_id))
+            return {key: int(value) for key, value in cursor.fetchone().items()}
+
+    def frontier_known_hashes(self, rastreo_id, after_id=0, batch_size=10000):
+        # Un lote de hashes ya conocidos (para reconstruir el filtro de Bloom al reanudar);
+        # devuelve también el último id para pedir el siguiente
+        with self.connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT id, url_hash FROM frontera
+                WHERE rastreo_id = %s AND id > %s
+                ORDER BY id LIMIT %s
+            """, (rastreo_id, after_id, batch_size))
+            rows = cursor.fetchall()
+        return (rows[-1][0] if rows else after_id), [url_hash for _, url_hash in rows]
+
+    def frontier_close(self, rastreo_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute("""
+                UPDATE rastreos SET activo = NULL, estado = 'completado', actualizado = %s WHERE id = %s
+            """, (datetime.now(), rastreo_id))
+        self.connection.commit()
+
+    def get_recrawl_domain(self, host):
+        with self.connection.cursor(dictionary=True) as cursor:
+            cursor.execute("SELECT * FROM dominios_recrawl WHERE host = %s", (host,))
+            return cursor.fetchone()
+
+    def save_recrawl_domain(self, host, url_inicial, intervalo, proximo_rastreo, paginas_totales, paginas_cambiadas):
+        with self.connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO dominios_recrawl (host, url_inicial, intervalo, ultimo_rastreo, proximo_rastreo, paginas_totales, paginas_cambiadas)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE url_inicial = VALUES(url_inicial), intervalo = VALUES(intervalo),
+                    ultimo_rastreo = VALUES(ultimo_rastreo), proximo_rastreo = VALUES(proximo_rastreo),
+                    paginas_totales = VALUES(paginas_totales), paginas_cambiadas = VALUES(paginas_cambiadas)
+            """, (host, url_inicial, intervalo, datetime.now(), proximo_rastreo, paginas_totales, paginas_cambiadas))
+        self.connection.commit()
+
+    def get_due_recrawl_domains(self, limit=10):
+        with self.connection.cursor(dictionary=True) as cursor:
+            cursor.execute("""
+                SELECT host, url_inicial, intervalo
+                FROM dominios_recrawl
+                WHERE proximo_rastreo <= %s
+                ORDER BY proximo_rastreo
+                LIMIT %s
+            """, (datetime.now(), limit))
+            return cursor.fetchall()
+
+    def postpone_recrawl_domain(self, host, proximo_rastreo):
+        with self.connection.cursor() as cursor:
+            cursor.execute("UPDATE dominios_recrawl SET proximo_rastreo = %s WHERE host = %s", (proximo_rastreo, host))
+        self.connection.commit()
+
+    def get_recrawl_domains(self):
+        with self.connection.cursor(dictionary=True) as cursor:
+            cursor.execute("SELECT * FROM dominios_recrawl ORDER BY proximo_rastreo")
+            return cursor.fetchall()
+
     def close(self):
         if self.connection and self.connection.is_connected():
             self.connection.close()
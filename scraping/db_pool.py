@@ -0,0 +1,114 @@
+# db_pool.py
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import pooling
+
+from config import Config
+from .database_manager import DatabaseManager
+from .migrations import ensure_schema
+
+
+class ConnectionPool:
+    """Pool de conexiones MySQL compartido por todo el proceso.
+
+    Cada conexión se comprueba con ``ping`` al prestarse y se reconecta si el
+    servidor la cerró. Si todas están ocupadas se espera hasta ``timeout`` segundos.
+    """
+
+    def __init__(self, host, user, password, database, size=None, timeout=None):
+        self.size = size or Config.DB_POOL_SIZE
+        self.timeout = timeout or Config.DB_POOL_TIMEOUT
+        retry_count = 0
+        max_retries = 3
+        while True:
+            try:
+                self.pool = pooling.MySQLConnectionPool(
+                    pool_name='indexador',
+                    pool_size=self.size,
+                    pool_reset_session=True,
+                    host=host,
+                    user=user,
+                    password=password,
+                    database=database,
+                    use_pure=Config.DB_USE_PURE
+                )
+                break
+            except mysql.connector.Error as error:
+                logging.error(f"Error al crear el pool de conexiones: {error}")
+                retry_count += 1
+                if retry_count == max_retries:
+                    raise ConnectionError("Error al conectar a la base de datos después de varios intentos.")
+                time.sleep(2)
+        logging.info(f"Pool de conexiones creado con {self.size} conexiones.")
+        with self.connection() as connection:
+            ensure_schema(connection)
+
+    def get_connection(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                connection = self.pool.get_connection()
+            except pooling.PoolError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+                continue
+            try:
+                connection.ping(reconnect=True, attempts=3, delay=1)
+                return connection
+            except mysql.connector.Error as error:
+                logging.warning(f"Conexión del pool no disponible, se descarta: {error}")
+                connection.close()
+                if time.monotonic() >= deadline:
+                    raise ConnectionError("No hay conexiones sanas disponibles en el pool.")
+
+    @contextmanager
+    def connection(self):
+        connection = self.get_connection()
+        try:
+            yield connection
+        finally:
+            # En una conexión del pool, close() la devuelve al pool
+            connection.close()
+
+    @contextmanager
+    def manager(self):
+        with self.connection() as connection:
+            yield DatabaseManager(connection=connection)
+
+
+class PooledDatabase:
+    """Expone los métodos de DatabaseManager tomando una conexión del pool en cada
+    llamada, por lo que puede usarse desde varios hilos a la vez."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __getattr__(self, name):
+        if not callable(getattr(DatabaseManager, name, None)):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            with self.pool.manager() as db_manager:
+                return getattr(db_manager, name)(*args, **kwargs)
+        return call
+
+    def close(self):
+        # Las conexiones se devuelven al pool tras cada llamada
+        pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(host, user, password, database):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(host, user, password, database)
+    return _pool
@@ -0,0 +1,330 @@
+# fetcher.py
+import codecs
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([A-Za-z0-9_.:-]+)', re.IGNORECASE)
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_type_list(value):
+    return {item.strip().lower() for item in value.split(',') if item.strip()}
+
+
+def media_type(headers):
+    return (headers.get('Content-Type') or '').split(';', 1)[0].strip().lower()
+
+
+def declared_length(headers):
+    try:
+        return int(headers.get('Content-Length'))
+    except (TypeError, ValueError):
+        return None
+
+
+def header_charset(headers):
+    for param in (headers.get('Content-Type') or '').split(';')[1:]:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'charset' and value.strip():
+            return value.strip().strip('"\'')
+    return None
+
+
+def check_headers(headers, allowed_types=None, max_bytes=None):
+    # Decide antes de leer el cuerpo si merece la pena descargarlo: devuelve el
+    # motivo para omitirlo o None. Sin Content-Type se intenta igualmente.
+    allowed_types = allowed_types if allowed_types is not None else parse_type_list(Config.FETCH_ALLOWED_TYPES)
+    max_bytes = max_bytes or Config.FETCH_MAX_BYTES
+    tipo = media_type(headers)
+    if tipo and tipo not in allowed_types:
+        return 'tipo'
+    length = declared_length(headers)
+    if length is not None and length > max_bytes:
+        return 'tamano'
+    return None
+
+
+class PageReader:
+    """Lee el cuerpo por fragmentos: calcula el hash y decodifica de forma
+    incremental, y se detiene en cuanto se supera ``max_bytes``."""
+
+    def __init__(self, headers, max_bytes=None):
+        self.max_bytes = max_bytes or Config.FETCH_MAX_BYTES
+        self.charset = header_charset(headers)
+        self.decoder = None
+        self.hasher = hashlib.sha256()
+        self.parts = []
+        self.size = 0
+
+    def create_decoder(self, first_chunk):
+        # Charset de la cabecera, si no el de <meta charset> del principio del documento, si no UTF-8
+        charset = self.charset
+        if not charset:
+            match = META_CHARSET.search(first_chunk[:2048])
+            charset = match.group(1).decode('ascii') if match else 'utf-8'
+        try:
+            return codecs.getincrementaldecoder(charset)(errors='replace')
+        except LookupError:
+            return codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def feed(self, chunk):
+        # Devuelve False si el cuerpo supera el límite y hay que abortar
+        if not chunk:
+            return True
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            return False
+        if self.decoder is None:
+            self.decoder = self.create_decoder(chunk)
+        self.hasher.update(chunk)
+        self.parts.append(self.decoder.decode(chunk))
+        return True
+
+    def finish(self):
+        if self.decoder is not None:
+            self.parts.append(self.decoder.decode(b'', final=True))
+        return ''.join(self.parts), self.hasher.hexdigest()
+
+
+class DownloadStats:
+    """Recursos omitidos por tipo o tamaño y descargas abortadas, para ajustar los límites."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {'omitidas_tipo': 0, 'omitidas_tamano': 0, 'abortadas': 0,
+                       'bytes_omitidos': 0, 'bytes_descartados': 0}
+
+    def record(self, reason, headers, bytes_read=0):
+        with self.lock:
+            if reason == 'abortada':
+                self.counts['abortadas'] += 1
+                self.counts['bytes_descartados'] += bytes_read
+            else:
+                self.counts['omitidas_' + reason] += 1
+                # Si el servidor declara el tamaño se sabe cuánto se ha ahorrado
+                self.counts['bytes_omitidos'] += declared_length(headers) or 0
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+def parse_proxies(value):
+    # "localhost:9050,localhost:9052" -> [('localhost', 9050), ('localhost', 9052)]
+    endpoints = []
+    for item in value.split(','):
+        item = item.strip()
+        if item:
+            host, _, port = item.rpartition(':')
+            endpoints.append((host or 'localhost', int(port)))
+    return endpoints
+
+
+class Circuit:
+    """Un puerto SOCKS de Tor, opcionalmente con credenciales propias: con
+    IsolateSOCKSAuth (activo por defecto en Tor) cada usuario distinto usa un circuito
+    distinto. Guarda la latencia media y los fallos para poder evitarlo si se degrada."""
+
+    def __init__(self, name, proxy_url):
+        self.name = name
+        self.proxy_url = proxy_url
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.latency = None
+        self.cooldown_until = 0.0
+
+    def is_available(self, now):
+        return now >= self.cooldown_until
+
+    def score(self):
+        # Menor es mejor; un circuito sin medidas se prueba antes que los conocidos y
+        # uno que solo ha fallado cuenta como si agotara el tiempo de espera
+        if self.latency is None:
+            return float(Config.REQUEST_TIMEOUT) if self.failures else 0.0
+        failure_rate = self.failures / self.requests if self.requests else 0.0
+        return self.latency * (1 + 4 * failure_rate)
+
+    def to_dict(self, now):
+        return {
+            'circuito': self.name,
+            'peticiones': self.requests,
+            'fallos': self.failures,
+            'fallos_consecutivos': self.consecutive_failures,
+            'latencia_media': round(self.latency, 3) if self.latency is not None else None,
+            'en_pausa': max(0.0, round(self.cooldown_until - now, 1))
+        }
+
+
+class CircuitPool:
+    """Reparte las peticiones entre circuitos: cada host se mantiene en el mismo
+    circuito (para aprovechar las conexiones keep-alive) mientras esté sano y no sea
+    mucho más lento que el mejor; si no, se elige el mejor de dos al azar. Tras
+    ``failure_threshold`` fallos de conexión seguidos el circuito se pausa un tiempo
+    que crece exponencialmente."""
+
+    def __init__(self, circuits, failure_threshold=None, cooldown=None, alpha=None):
+        self.circuits = circuits
+        self.failure_threshold = failure_threshold or Config.CIRCUIT_FAILURE_THRESHOLD
+        self.cooldown = cooldown or Config.CIRCUIT_COOLDOWN
+        self.alpha = alpha or Config.CIRCUIT_LATENCY_ALPHA
+        self.host_circuits = {}
+        self.lock = threading.Lock()
+
+    def choose(self, host, exclude=()):
+        now = time.monotonic()
+        with self.lock:
+            candidates = [circuit for circuit in self.circuits if circuit.name not in exclude] or self.circuits
+            available = [circuit for circuit in candidates if circuit.is_available(now)]
+            if not available:
+                # Todos en pausa: el que antes vuelva
+                return min(candidates, key=lambda circuit: circuit.cooldown_until)
+            best = min(available, key=Circuit.score)
+            sticky = self.host_circuits.get(host)
+            if sticky in available and sticky.score() <= 2 * best.score() + 0.5:
+                return sticky
+            pair = random.sample(available, min(2, len(available)))
+            chosen = min(pair, key=Circuit.score)
+            self.host_circuits[host] = chosen
+            return chosen
+
+    def record_success(self, circuit, latency):
+        with self.lock:
+            circuit.requests += 1
+            circuit.consecutive_failures = 0
+            circuit.trips = 0
+            circuit.latency = latency if circuit.latency is None else \
+                (1 - self.alpha) * circuit.latency + self.alpha * latency
+
+    def record_failure(self, circuit):
+        with self.lock:
+            circuit.requests += 1
+            circuit.failures += 1
+            circuit.consecutive_failures += 1
+            if circuit.consecutive_failures >= self.failure_threshold:
+                circuit.trips += 1
+                pause = min(self.cooldown * 2 ** (circuit.trips - 1), 600)
+                circuit.cooldown_until = time.monotonic() + pause
+                circuit.consecutive_failures = 0
+                logging.warning(f"Circuito {circuit.name} en pausa {pause:.0f} s tras varios fallos seguidos")
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            return [circuit.to_dict(now) for circuit in self.circuits]
+
+
+def build_circuits(endpoints=None, isolation=None):
+    endpoints = endpoints if endpoints is not None else parse_proxies(Config.TOR_PROXIES)
+    isolation = isolation or Config.TOR_ISOLATION_CIRCUITS
+    circuits = []
+    for host, port in endpoints:
+        for index in range(isolation):
+            if isolation > 1:
+                proxy_url = f'socks5h://indexador{index}:x@{host}:{port}'
+            else:
+                proxy_url = f'socks5h://{host}:{port}'
+            circuits.append(Circuit(f'{host}:{port}/{index}', proxy_url))
+    return circuits
+
+
+class Fetcher:
+    """Capa de descarga: una sesión keep-alive por circuito (urllib3 mantiene dentro
+    un pool de conexiones por host) y reintentos con espera exponencial por otro
+    circuito."""
+
+    def __init__(self, pool=None, max_retries=None, backoff_base=None, timeout=None):
+        self.pool = pool or CircuitPool(build_circuits())
+        self.max_retries = Config.FETCH_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = Config.FETCH_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.timeout = timeout or Config.REQUEST_TIMEOUT
+        self.sessions = {circuit.name: self.create_session(circuit) for circuit in self.pool.circuits}
+
+    @staticmethod
+    def create_session(circuit):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=Config.FETCH_POOL_HOSTS, pool_maxsize=Config.FETCH_POOL_MAXSIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if circuit.proxy_url:
+            session.proxies = {'http': circuit.proxy_url, 'https': circuit.proxy_url}
+        return session
+
+    def backoff(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff_base * (2 ** attempt) + random.uniform(0, self.backoff_base)
+
+    def get(self, url, headers=None, stream=False):
+        host = requests.utils.urlparse(url).hostname
+        tried = set()
+        for attempt in range(self.max_retries + 1):
+            circuit = self.pool.choose(host, exclude=tried)
+            tried.add(circuit.name)
+            start_time = time.monotonic()
+            try:
+                response = self.sessions[circuit.name].get(url, headers=headers, timeout=self.timeout, stream=stream)
+            except requests.RequestException as e:
+                # Fallo de conexión o tiempo agotado: se atribuye al circuito
+                self.pool.record_failure(circuit)
+                if attempt == self.max_retries:
+                    raise
+                espera = self.backoff(attempt)
+                logging.warning(f"Error descargando {url} por {circuit.name} ({e}); reintento {attempt + 1} en {espera:.1f} s")
+                time.sleep(espera)
+                continue
+            # El servidor respondió: el circuito funciona aunque la página devuelva un error
+            self.pool.record_success(circuit, time.monotonic() - start_time)
+            if response.status_code in RETRYABLE_STATUS and attempt < self.max_retries:
+                espera = self.backoff(attempt, response)
+                logging.warning(f"{url} devolvió {response.status_code}; reintento {attempt + 1} en {espera:.1f} s")
+                response.close()
+                time.sleep(espera)
+                continue
+            return response
+
+    def fetch_page(self, url, headers=None):
+        """Descarga en streaming: comprueba Content-Type y Content-Length antes de leer
+        el cuerpo y aborta si supera FETCH_MAX_BYTES. Devuelve un dict con ``status``,
+        ``url`` (la final, tras las redirecciones), ``headers``, ``html``,
+        ``content_hash``, ``bytes`` (leídos) y ``omitida`` (motivo o None)."""
+        response = self.get(url, headers=headers, stream=True)
+        try:
+            page = {'status': response.status_code, 'url': response.url, 'headers': response.headers, 'html': None,
+                    'content_hash': None, 'bytes': 0, 'omitida': None}
+            if response.status_code != 200:
+                return page
+            page['omitida'] = check_headers(response.headers)
+            if page['omitida']:
+                return page
+            reader = PageReader(response.headers)
+            for chunk in response.iter_content(CHUNK_SIZE):
+                if not reader.feed(chunk):
+                    page['omitida'] = 'abortada'
+                    break
+            page['bytes'] = reader.size
+            if not page['omitida']:
+                page['html'], page['content_hash'] = reader.finish()
+            return page
+        finally:
+            # Cerrar sin leer el resto descarta la conexión en lugar de devolverla al pool
+            response.close()
+
+
+@lru_cache(maxsize=1)
+def get_fetcher():
+    # Los circuitos y su estado de salud se comparten entre todos los rastreos del proceso
+    return Fetcher()
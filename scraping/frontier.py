@@ -0,0 +1,333 @@
+# frontier.py
+import hashlib
+import logging
+import math
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+from config import Config
+
+
+def url_hash(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+class BloomFilter:
+    """Conjunto aproximado de hashes de URL: ~2,4 MB por millón de URLs con una tasa
+    de falsos positivos de 1e-4, frente a cientos de MB para las cadenas completas.
+    Un falso positivo hace que una URL nueva se considere ya vista y no se encole."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, hex_digest):
+        # Doble hashing a partir del SHA-256 que ya se calcula para la URL
+        h1 = int(hex_digest[:16], 16)
+        h2 = int(hex_digest[16:32], 16) | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, hex_digest):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self.positions(hex_digest))
+
+    def add(self, hex_digest):
+        for pos in self.positions(hex_digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+
+class ScalableBloomFilter:
+    # Cuando un filtro se llena se añade otro el doble de grande y con la mitad de
+    # tasa de error, de modo que la tasa total queda acotada sin conocer el tamaño final
+    def __init__(self, capacity=None, error_rate=None):
+        self.capacity = capacity or Config.FRONTIER_BLOOM_CAPACITY
+        self.error_rate = error_rate or Config.FRONTIER_BLOOM_ERROR_RATE
+        self.filters = [BloomFilter(self.capacity, self.error_rate / 2)]
+
+    def __contains__(self, hex_digest):
+        return any(hex_digest in bloom for bloom in self.filters)
+
+    def add(self, hex_digest):
+        current = self.filters[-1]
+        if current.count >= current.capacity:
+            current = BloomFilter(current.capacity * 2, self.error_rate / 2 ** (len(self.filters) + 1))
+            self.filters.append(current)
+        current.add(hex_digest)
+
+    def memory_bytes(self):
+        return sum(len(bloom.bits) for bloom in self.filters)
+
+
+class MemoryFrontier:
+    """Frontera en memoria (comportamiento original): se pierde si el proceso termina."""
+
+    def __init__(self, base_url):
+        self.queue = deque()
+        self.seen = set()
+        self.lock = threading.Lock()
+        self.stats = {'encoladas': 0, 'duplicadas': 0}
+        self.add([(base_url, 0)])
+
+    def add(self, entries):
+        # Devuelve las URLs que no se habían visto
+        added = []
+        with self.lock:
+            for url, depth in entries:
+                if url in self.seen:
+                    self.stats['duplicadas'] += 1
+                    continue
+                self.seen.add(url)
+                self.queue.append((url, depth))
+                added.append(url)
+            self.stats['encoladas'] += len(added)
+        return added
+
+    def lease(self, limit):
+        with self.lock:
+            return [self.queue.popleft() for _ in range(min(limit, len(self.queue)))]
+
+    def complete(self, urls):
+        pass
+
+    def release_all(self):
+        pass
+
+    def pending_count(self):
+        return len(self.queue)
+
+    def is_exhausted(self):
+        return not self.queue
+
+    def close(self, completed):
+        pass
+
+
+class PersistentFrontier:
+    """Frontera persistente y compartida entre procesos o nodos.
+
+    Las URLs se guardan en la tabla ``frontera`` de ``store`` (MySQL o SQLite) y cada
+    trabajador las reserva por lotes con un plazo (``lease``); si el trabajador muere,
+    la reserva caduca y otro las retoma. Un rastreo activo sobre la misma URL inicial
+    se reanuda en lugar de empezar de cero. Para saber qué URLs ya se conocen se usa un
+    filtro de Bloom en memoria con los hashes; la tabla tiene la última palabra.
+    """
+
+    def __init__(self, store, base_url, lease_seconds=None, max_attempts=None):
+        self.store = store
+        self.lease_seconds = lease_seconds or Config.FRONTIER_LEASE_SECONDS
+        self.max_attempts = max_attempts or Config.FRONTIER_MAX_ATTEMPTS
+        self.seen = ScalableBloomFilter()
+        self.leased = {}
+        self.lock = threading.Lock()
+        self.stats = {'encoladas': 0, 'duplicadas': 0}
+        self.rastreo_id, self.resumed = store.frontier_start(base_url)
+        if self.resumed:
+            self.load_known()
+            logging.info(f"Reanudando el rastreo {self.rastreo_id} de {base_url}")
+        self.add([(base_url, 0)])
+
+    def load_known(self):
+        after_id = 0
+        while True:
+            after_id, hashes = self.store.frontier_known_hashes(self.rastreo_id, after_id)
+            if not hashes:
+                break
+            for hex_digest in hashes:
+                self.seen.add(hex_digest)
+
+    def add(self, entries):
+        new = []
+        with self.lock:
+            for url, depth in entries:
+                hex_digest = url_hash(url)
+                if hex_digest in self.seen:
+                    self.stats['duplicadas'] += 1
+                    continue
+                self.seen.add(hex_digest)
+                new.append((hex_digest, url, depth))
+        if new:
+            # Otro trabajador puede haber encolado ya alguna: la clave única la descarta
+            self.stats['encoladas'] += self.store.frontier_add(self.rastreo_id, new)
+        return [url for _, url, _ in new]
+
+    def lease(self, limit):
+        rows = self.store.frontier_lease(self.rastreo_id, limit, self.lease_seconds, self.max_attempts)
+        with self.lock:
+            for url, depth in rows:
+                self.leased[url] = url_hash(url)
+        return [(url, depth) for url, depth in rows]
+
+    def complete(self, urls):
+        with self.lock:
+            hashes = [self.leased.pop(url, None) or url_hash(url) for url in urls]
+        if hashes:
+            self.store.frontier_finish_urls(self.rastreo_id, hashes)
+
+    def release_all(self):
+        # Al cancelar, las URLs reservadas vuelven a la cola sin esperar a que caduquen
+        with self.lock:
+            hashes, self.leased = list(self.leased.values()), {}
+        if hashes:
+            self.store.frontier_finish_urls(self.rastreo_id, hashes, estado='pendiente')
+
+    def counts(self):
+        return self.store.frontier_counts(self.rastreo_id, self.max_attempts)
+
+    def pending_count(self):
+        return self.counts()['pendientes']
+
+    def is_exhausted(self):
+        # Sin pendientes ni reservas vigentes de otros trabajadores, que aún podrían añadir enlaces
+        counts = self.counts()
+        return not counts['pendientes'] and not counts['en_proceso']
+
+    def close(self, completed):
+        if completed:
+            self.store.frontier_close(self.rastreo_id)
+
+
+class SQLiteFrontierStore:
+    """Implementación de los métodos ``frontier_*`` de DatabaseManager sobre un fichero
+    SQLite local, para rastreos reanudables sin servidor MySQL (varios procesos de la
+    misma máquina pueden compartir el fichero)."""
+
+    def __init__(self, path=None):
+        self.path = path or Config.FRONTIER_SQLITE_PATH
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS rastreos (
+                    id TEXT PRIMARY KEY,
+                    url_inicial TEXT NOT NULL,
+                    url_hash TEXT NOT NULL,
+                    activo INTEGER,
+                    estado TEXT NOT NULL,
+                    creado REAL NOT NULL,
+                    actualizado REAL NOT NULL,
+                    UNIQUE (url_hash, activo)
+                );
+                CREATE TABLE IF NOT EXISTS frontera (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    rastreo_id TEXT NOT NULL,
+                    url_hash TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    profundidad INTEGER NOT NULL,
+                    estado TEXT NOT NULL DEFAULT 'pendiente',
+                    lease_token TEXT,
+                    lease_expira REAL,
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    UNIQUE (rastreo_id, url_hash)
+                );
+                CREATE INDEX IF NOT EXISTS idx_frontera_cola ON frontera (rastreo_id, estado, profundidad, id);
+                CREATE INDEX IF NOT EXISTS idx_frontera_lease ON frontera (rastreo_id, lease_token);
+            """)
+
+    def frontier_start(self, url_inicial):
+        hex_digest = url_hash(url_inicial)
+        ahora = time.time()
+        with self.lock:
+            cursor = self.connection.execute("""
+                INSERT OR IGNORE INTO rastreos (id, url_inicial, url_hash, activo, estado, creado, actualizado)
+                VALUES (?, ?, ?, 1, 'en_curso', ?, ?)
+            """, (str(uuid.uuid4()), url_inicial, hex_digest, ahora, ahora))
+            creado = cursor.rowcount == 1
+            rastreo_id = self.connection.execute(
+                "SELECT id FROM rastreos WHERE url_hash = ? AND activo = 1", (hex_digest,)).fetchone()[0]
+        return rastreo_id, not creado
+
+    def frontier_add(self, rastreo_id, entries):
+        with self.lock:
+            before = self.connection.total_changes
+            self.connection.execute("BEGIN")
+            self.connection.executemany("""
+                INSERT OR IGNORE INTO frontera (rastreo_id, url_hash, url, profundidad) VALUES (?, ?, ?, ?)
+            """, [(rastreo_id, hex_digest, url, profundidad) for hex_digest, url, profundidad in entries])
+            self.connection.execute("COMMIT")
+            return self.connection.total_changes - before
+
+    def frontier_lease(self, rastreo_id, limit, lease_seconds, max_attempts):
+        token = str(uuid.uuid4())
+        ahora = time.time()
+        with self.lock:
+            self.connection.execute("""
+                UPDATE frontera
+                SET estado = 'en_proceso', lease_token = ?, lease_expira = ?, intentos = intentos + 1
+                WHERE id IN (
+                    SELECT id FROM frontera
+                    WHERE rastreo_id = ? AND intentos < ?
+                      AND (estado = 'pendiente' OR (estado = 'en_proceso' AND lease_expira < ?))
+                    ORDER BY profundidad, id
+                    LIMIT ?
+                )
+            """, (token, ahora + lease_seconds, rastreo_id, max_attempts, ahora, limit))
+            return self.connection.execute("""
+                SELECT url, profundidad FROM frontera
+                WHERE rastreo_id = ? AND lease_token = ?
+                ORDER BY profundidad, id
+            """, (rastreo_id, token)).fetchall()
+
+    def frontier_finish_urls(self, rastreo_id, url_hashes, estado='hecho'):
+        penalty = 1 if estado == 'pendiente' else 0
+        with self.lock:
+            self.connection.execute("BEGIN")
+            self.connection.executemany("""
+                UPDATE frontera SET estado = ?, lease_token = NULL, lease_expira = NULL,
+                    intentos = MAX(intentos - ?, 0)
+                WHERE rastreo_id = ? AND url_hash = ?
+            """, [(estado, penalty, rastreo_id, hex_digest) for hex_digest in url_hashes])
+            self.connection.execute("COMMIT")
+
+    def frontier_counts(self, rastreo_id, max_attempts):
+        ahora = time.time()
+        with self.lock:
+            pendientes, en_proceso, hechas = self.connection.execute("""
+                SELECT
+                    COALESCE(SUM(estado = 'pendiente'
+                        OR (estado = 'en_proceso' AND lease_expira < ? AND intentos < ?)), 0),
+                    COALESCE(SUM(estado = 'en_proceso' AND lease_expira >= ?), 0),
+                    COALESCE(SUM(estado = 'hecho'), 0)
+                FROM frontera
+                WHERE rastreo_id = ?
+            """, (ahora, max_attempts, ahora, rastreo_id)).fetchone()
+        return {'pendientes': pendientes, 'en_proceso': en_proceso, 'hechas': hechas}
+
+    def frontier_known_hashes(self, rastreo_id, after_id=0, batch_size=10000):
+        with self.lock:
+            rows = self.connection.execute("""
+                SELECT id, url_hash FROM frontera WHERE rastreo_id = ? AND id > ? ORDER BY id LIMIT ?
+            """, (rastreo_id, after_id, batch_size)).fetchall()
+        return (rows[-1][0] if rows else after_id), [hex_digest for _, hex_digest in rows]
+
+    def frontier_close(self, rastreo_id):
+        with self.lock:
+            self.connection.execute("UPDATE rastreos SET activo = NULL, estado = 'completado', actualizado = ? WHERE id = ?",
+                                    (time.time(), rastreo_id))
+
+
+_sqlite_stores = {}
+_sqlite_lock = threading.Lock()
+
+
+def get_sqlite_store(path=None):
+    path = path or Config.FRONTIER_SQLITE_PATH
+    with _sqlite_lock:
+        if path not in _sqlite_stores:
+            _sqlite_stores[path] = SQLiteFrontierStore(path)
+        return _sqlite_stores[path]
+
+
+def create_frontier(base_url, db_manager, backend=None):
+    backend = backend or Config.FRONTIER_BACKEND
+    if backend == 'mysql':
+        return PersistentFrontier(db_manager, base_url)
+    if backend == 'sqlite':
+        return PersistentFrontier(get_sqlite_store(), base_url)
+    return MemoryFrontier(base_url)
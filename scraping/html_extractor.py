@@ -0,0 +1,225 @@
+# html_extractor.py
+import logging
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse
+
+from bs4 import BeautifulSoup
+
+from config import Config
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+TEXT_TAGS = {'p', 'span', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li'}
+SKIP_TAGS = {'script', 'style', 'noscript', 'template'}
+
+
+def extract_from_soup(url, soup, base_hostname, canonicalize=None):
+    # Ruta original: varias pasadas find_all sobre el árbol de BeautifulSoup.
+    # canonicalize (URL -> URL) se aplica a los enlaces internos que se guardan
+    title_tag = soup.find('title')
+    titulo = title_tag.text.strip() if title_tag else "Sin título"
+    texto_tags = soup.find_all(list(TEXT_TAGS))
+    texto = ' '.join(tag.get_text(strip=True) for tag in texto_tags)
+    base_tag = soup.find('base', href=True)
+    if base_tag:
+        url = urljoin(url, base_tag['href'])
+    anchors = [urljoin(url, a['href']) for a in soup.find_all('a', href=True)]
+    enlaces = [link for link in anchors if urlparse(link).hostname == base_hostname]
+    if canonicalize:
+        enlaces = [canonicalize(link) for link in enlaces]
+    imagenes = [img['src'] for img in soup.find_all('img', src=True)]
+    scripts = [script['src'] for script in soup.find_all('script', src=True)]
+    estilos = [link['href'] for link in soup.find_all('link', href=True) if 'stylesheet' in link.get('rel', [])]
+    metadatos = {}
+    for meta_tag in soup.find_all('meta'):
+        nombre = meta_tag.get('name')
+        contenido = meta_tag.get('content')
+        if nombre and contenido:
+            metadatos[nombre] = contenido
+    return {
+        'titulo': titulo,
+        'texto': texto,
+        'enlaces': enlaces,
+        'imagenes': imagenes,
+        'scripts': scripts,
+        'estilos': estilos,
+        'metadatos': metadatos,
+        'anchors': anchors
+    }
+
+
+class ExtractionHandler:
+    """Recoge en una sola pasada título, texto, enlaces, imágenes, scripts, estilos
+    y metadatos a partir de eventos start/end/data. Cada nodo de texto se añade una
+    única vez aunque esté anidado en varios div/p/span. Los enlaces se resuelven
+    contra ``url`` o, si la página lo declara, contra su primer ``<base href>``; los
+    internos se guardan en ``enlaces`` en forma canónica si se da ``canonicalize``."""
+
+    def __init__(self, url, base_hostname, canonicalize=None):
+        self.url = url
+        self.base_hostname = base_hostname
+        self.canonicalize = canonicalize
+        self.canonical = {}
+        self.title_parts = None
+        self.title = None
+        self.text_parts = []
+        self.open_text_tags = []
+        self.skip_depth = 0
+        self.anchors = []
+        self.enlaces = []
+        self.imagenes = []
+        self.scripts = []
+        self.estilos = []
+        self.metadatos = {}
+        self.resolved = {}
+        self.has_base = False
+
+    def resolve(self, href):
+        absolute = self.resolved.get(href)
+        if absolute is None:
+            absolute = self.resolved[href] = urljoin(self.url, href)
+        return absolute
+
+    def canonical_link(self, absolute):
+        if not self.canonicalize:
+            return absolute
+        canonical = self.canonical.get(absolute)
+        if canonical is None:
+            canonical = self.canonical[absolute] = self.canonicalize(absolute)
+        return canonical
+
+    def start(self, tag, attrs):
+        if tag in TEXT_TAGS:
+            self.open_text_tags.append(tag)
+        elif tag in SKIP_TAGS:
+            self.skip_depth += 1
+            if tag == 'script' and attrs.get('src'):
+                self.scripts.append(attrs['src'])
+        elif tag == 'a':
+            href = attrs.get('href')
+            if href is not None:
+                absolute = self.resolve(href)
+                self.anchors.append(absolute)
+                if urlparse(absolute).hostname == self.base_hostname:
+                    self.enlaces.append(self.canonical_link(absolute))
+        elif tag == 'img':
+            if attrs.get('src'):
+                self.imagenes.append(attrs['src'])
+        elif tag == 'link':
+            if attrs.get('href') and 'stylesheet' in (attrs.get('rel') or '').lower().split():
+                self.estilos.append(attrs['href'])
+        elif tag == 'meta':
+            nombre, contenido = attrs.get('name'), attrs.get('content')
+            if nombre and contenido:
+                self.metadatos[nombre] = contenido
+        elif tag == 'title' and self.title is None:
+            self.title_parts = []
+        elif tag == 'base' and not self.has_base and attrs.get('href'):
+            # Como en los navegadores, solo cuenta el primero
+            self.has_base = True
+            self.url = urljoin(self.url, attrs['href'])
+            self.resolved.clear()
+
+    def end(self, tag):
+        if tag in TEXT_TAGS:
+            # HTML mal cerrado: se cierra hasta la etiqueta correspondiente si está abierta
+            if tag in self.open_text_tags:
+                while self.open_text_tags.pop() != tag:
+                    pass
+        elif tag in SKIP_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+        elif tag == 'title' and self.title_parts is not None:
+            self.title = ''.join(self.title_parts).strip()
+            self.title_parts = None
+
+    def data(self, data):
+        if self.title_parts is not None:
+            self.title_parts.append(data)
+        elif self.open_text_tags and not self.skip_depth:
+            data = data.strip()
+            if data:
+                self.text_parts.append(data)
+
+    def close(self):
+        if self.title is None and self.title_parts is not None:
+            self.title = ''.join(self.title_parts).strip()
+        return {
+            'titulo': self.title or "Sin título",
+            'texto': ' '.join(self.text_parts),
+            'enlaces': self.enlaces,
+            'imagenes': self.imagenes,
+            'scripts': self.scripts,
+            'estilos': self.estilos,
+            'metadatos': self.metadatos,
+            'anchors': self.anchors
+        }
+
+
+class StdlibEventParser(HTMLParser):
+    # Adaptador del parser de la librería estándar al interfaz start/end/data
+    def __init__(self, handler):
+        super().__init__(convert_charrefs=True)
+        self.handler = handler
+
+    def handle_starttag(self, tag, attrs):
+        self.handler.start(tag, {name: value for name, value in attrs if value is not None})
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.handler.end(tag)
+
+    def handle_endtag(self, tag):
+        self.handler.end(tag)
+
+    def handle_data(self, data):
+        self.handler.data(data)
+
+
+class SoupExtractor:
+    name = 'soup'
+
+    def __init__(self, parser='html.parser'):
+        self.parser = parser
+
+    def extract(self, url, html, base_hostname, canonicalize=None):
+        return extract_from_soup(url, BeautifulSoup(html, self.parser), base_hostname, canonicalize)
+
+
+class SinglePassExtractor:
+    name = 'fast'
+
+    def __init__(self, parser=None):
+        if parser is None:
+            parser = 'lxml' if etree is not None else 'html.parser'
+        if parser == 'lxml' and etree is None:
+            logging.warning("lxml no está instalado; se usa html.parser para la extracción.")
+            parser = 'html.parser'
+        self.parser = parser
+
+    def extract(self, url, html, base_hostname, canonicalize=None):
+        handler = ExtractionHandler(url, base_hostname, canonicalize)
+        if not html.strip():
+            return handler.close()
+        if self.parser == 'lxml':
+            try:
+                parser = etree.HTMLParser(target=handler, recover=True, no_network=True)
+                parser.feed(html)
+                return parser.close()
+            except etree.LxmlError as e:
+                logging.warning(f"lxml no pudo analizar {url} ({e}); se reintenta con html.parser.")
+                handler = ExtractionHandler(url, base_hostname, canonicalize)
+        parser = StdlibEventParser(handler)
+        parser.feed(html)
+        parser.close()
+        return handler.close()
+
+
+def get_extractor(name=None, parser=None):
+    name = name or Config.HTML_EXTRACTOR
+    parser = parser or Config.HTML_PARSER or None
+    if name == 'soup':
+        return SoupExtractor(parser or 'html.parser')
+    return SinglePassExtractor(parser)
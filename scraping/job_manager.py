@@ -0,0 +1,230 @@
+# job_manager.py
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+from config import Config
+from .metrics import SamplingProfiler
+
+
+def validate_job_params(priority, max_depth):
+    # Comprobaciones comunes a todos los que encolan trabajos (API, formulario y
+    # planificador de re-rastreos); max_depth se recorta a JOB_MAX_DEPTH
+    try:
+        priority, max_depth = int(priority), int(max_depth)
+    except (TypeError, ValueError):
+        raise ValueError("La prioridad y max_depth deben ser números enteros")
+    if max_depth < 0:
+        raise ValueError("El parámetro max_depth no puede ser negativo")
+    return priority, min(max_depth, Config.JOB_MAX_DEPTH)
+
+
+class CrawlJob:
+    def __init__(self, url, priority=0, max_depth=3, incremental=False, profile=False):
+        self.id = str(uuid.uuid4())
+        self.url = url
+        self.priority = priority
+        self.max_depth = max_depth
+        self.incremental = incremental
+        self.profile = profile
+        self.profile_path = None
+        self.status = 'en_cola'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Solo los últimos JOB_RESULTS_LIMIT resúmenes; las páginas completas están en la base de datos
+        self.results = deque(maxlen=Config.JOB_RESULTS_LIMIT)
+        self.results_total = 0
+        self.changed = threading.Condition()
+        self.error = None
+        self.scraper = None
+        self.cancel_requested = False
+
+    def is_finished(self):
+        return self.status in ('completado', 'cancelado', 'error')
+
+    def add_result(self, summary):
+        with self.changed:
+            self.results.append(summary)
+            self.results_total += 1
+            self.changed.notify_all()
+
+    def finish(self, status):
+        with self.changed:
+            self.status = status
+            self.finished_at = time.time()
+            self.changed.notify_all()
+
+    def wait_for_results(self, after, timeout):
+        """Espera hasta ``timeout`` segundos a que haya resúmenes posteriores al número
+        ``after`` o a que el trabajo termine. Devuelve ``(primero, resúmenes, terminado)``,
+        donde ``primero`` es el número del primer resumen devuelto (se numeran desde 1)."""
+        with self.changed:
+            if self.results_total <= after and not self.is_finished():
+                self.changed.wait(timeout)
+            first = self.results_total - len(self.results) + 1
+            # Los que ya salieron de la ventana de JOB_RESULTS_LIMIT se pierden
+            skip = max(0, after + 1 - first)
+            return first + skip, list(self.results)[skip:], self.is_finished()
+
+    def to_dict(self):
+        scraper = self.scraper
+        progress = dict(scraper.progress) if scraper else {}
+        return {
+            'id': self.id,
+            'url': self.url,
+            'estado': self.status,
+            'prioridad': self.priority,
+            'max_depth': self.max_depth,
+            'incremental': self.incremental,
+            'creado': self.created_at,
+            'iniciado': self.started_at,
+            'finalizado': self.finished_at,
+            'paginas_descargadas': progress.get('paginas_descargadas', 0),
+            'paginas_procesadas': progress.get('paginas_procesadas', 0),
+            'paginas_sin_cambios': progress.get('paginas_sin_cambios', 0),
+            'errores': progress.get('errores', 0),
+            'ultimo_error': self.error or progress.get('ultimo_error'),
+            'profundidad_cola': scraper.queue_depth() if scraper and not self.is_finished() else 0,
+            'escritura': self.write_stats(scraper, progress),
+            'frontera': dict(scraper.frontier.stats) if scraper and scraper.frontier else None,
+            'descartes_url': dict(scraper.url_filter.stats) if scraper else None,
+            'descargas': scraper.download_stats.snapshot() if scraper else None,
+            'perfil': self.profile_path,
+            'resultados': self.results_total
+        }
+
+    def write_stats(self, scraper, progress):
+        write_buffer = scraper.write_buffer if scraper else None
+        if write_buffer:
+            return {**write_buffer.stats, 'pendientes': write_buffer.pending_count(),
+                    'saturado': write_buffer.is_saturated()}
+        return progress.get('escritura')
+
+
+class CrawlJobManager:
+    """Pool acotado de hilos que ejecuta trabajos de rastreo fuera de la petición HTTP.
+
+    ``scraper_factory(job)`` debe devolver una tupla ``(scraper, cleanup)``; ``cleanup``
+    se invoca al terminar el trabajo (p. ej. para cerrar la conexión a la base de datos).
+    Los trabajos con mayor prioridad se ejecutan antes.
+    """
+
+    def __init__(self, scraper_factory, max_workers=None, max_queued=None, history_limit=None):
+        self.scraper_factory = scraper_factory
+        self.max_workers = max_workers or Config.JOB_WORKERS
+        self.history_limit = history_limit or Config.JOB_HISTORY_LIMIT
+        self.queue = queue.PriorityQueue(maxsize=max_queued or Config.JOB_QUEUE_SIZE)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.sequence = itertools.count()
+        self.workers = []
+
+    def start(self):
+        with self.lock:
+            if self.workers:
+                return
+            for i in range(self.max_workers):
+                worker = threading.Thread(target=self.worker_loop, name=f'crawl-worker-{i}', daemon=True)
+                worker.start()
+                self.workers.append(worker)
+            logging.info(f"Pool de rastreo iniciado con {self.max_workers} hilos.")
+
+    def submit(self, url, priority=0, max_depth=3, incremental=False, profile=False):
+        priority, max_depth = validate_job_params(priority, max_depth)
+        self.start()
+        job = CrawlJob(url, priority, max_depth, incremental, profile)
+        with self.lock:
+            self.jobs[job.id] = job
+            self.prune_history()
+        try:
+            # PriorityQueue extrae primero el menor valor: se invierte la prioridad
+            self.queue.put_nowait((-priority, next(self.sequence), job.id))
+        except queue.Full:
+            with self.lock:
+                del self.jobs[job.id]
+            raise
+        logging.info(f"Trabajo {job.id} encolado para {url} (prioridad {priority})")
+        return job.id
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if not job or job.is_finished():
+            return False
+        job.cancel_requested = True
+        if job.scraper:
+            job.scraper.cancel()
+        logging.info(f"Cancelación solicitada para el trabajo {job_id}")
+        return True
+
+    def queue_size(self):
+        return self.queue.qsize()
+
+    def prune_history(self):
+        finished = [job for job in self.jobs.values() if job.is_finished()]
+        excess = len(finished) - self.history_limit
+        if excess > 0:
+            for job in sorted(finished, key=lambda job: job.finished_at)[:excess]:
+                del self.jobs[job.id]
+
+    def worker_loop(self):
+        while True:
+            _, _, job_id = self.queue.get()
+            try:
+                job = self.jobs.get(job_id)
+                if job:
+                    self.run_job(job)
+            finally:
+                self.queue.task_done()
+
+    def run_job(self, job):
+        if job.cancel_requested:
+            job.finish('cancelado')
+            return
+        job.status = 'en_curso'
+        job.started_at = time.time()
+        cleanup = None
+        status = 'error'
+        # El perfilador muestrea todos los hilos: conviene usarlo sin otros trabajos en curso
+        profiler = SamplingProfiler().start() if job.profile else None
+        try:
+            job.scraper, cleanup = self.scraper_factory(job)
+            if job.cancel_requested:
+                job.scraper.cancel()
+            # Los resúmenes se publican según terminan las páginas (ver /jobs/<id>/events)
+            for summary in job.scraper.iter_scrape():
+                job.add_result(summary)
+            status = 'cancelado' if job.scraper.is_cancelled() else 'completado'
+        except Exception as e:
+            logging.error(f"Error en el trabajo {job.id}: {e}")
+            job.error = str(e)
+        finally:
+            if profiler:
+                self.save_profile(job, profiler)
+            if cleanup:
+                cleanup()
+            job.finish(status)
+            logging.info(f"Trabajo {job.id} finalizado con estado {job.status}")
+
+    def save_profile(self, job, profiler):
+        profiler.stop()
+        try:
+            os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+            path = os.path.join(Config.PROFILE_DIR, f'{job.id}.folded')
+            profiler.write(path)
+            job.profile_path = path
+        except OSError as e:
+            logging.error(f"No se pudo guardar el perfil del trabajo {job.id}: {e}")
@@ -0,0 +1,159 @@
+# keyword_matcher.py
+import json
+import logging
+from collections import deque
+from functools import lru_cache
+
+from config import Config
+
+DEFAULT_TOPICS = {
+    "Drogas": ["droga", "cocaína", "marihuana", "heroína", "metanfetamina"],
+    "Armas": ["arma", "fusil", "pistola", "munición", "explosivo"],
+    "Finanzas": ["bitcoin", "criptomoneda", "dinero", "btc", "lavado de dinero", "banco"],
+    "Hacking": ["hack", "ciberseguridad", "malware", "ransomware", "ddos", "phishing"],
+    "Falsificacion Documental": ["pasaportes falsos", "identificación", "licencia", "documento falso", "visa", "falsificación de identidad"],
+    "Servicios Ilegales": ["asesinato", "golpe", "fraude", "corrupción"],
+    "Contenido Explicito": ["pornografía", "abuso", "explícito", "infantil"],
+    "Mercado Negro": ["tráfico", "mercado negro", "venta ilegal", "comercio ilícito"],
+    "Contrabando": ["contrabando", "mercancía ilegal", "traficante"],
+    "Fraude": ["fraude", "estafa", "esquema ponzi", "phishing"],
+    "Violencia": ["violencia", "terrorismo", "ataque", "secuestro"],
+    "Extorsion": ["extorsión", "secuestro", "amenaza", "chantaje"],
+    "Falsificacion": ["falsificación", "falso", "imitar", "fraude"]
+}
+
+INDETERMINADO = "Indeterminado"
+
+
+class KeywordMatcher:
+    """Autómata de Aho-Corasick: localiza todas las palabras clave en una sola pasada
+    sobre el texto, independientemente de cuántas haya."""
+
+    def __init__(self, keywords, word_start=False):
+        self.keywords = [keyword.lower() for keyword in keywords]
+        self.word_start = word_start
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for index, keyword in enumerate(self.keywords):
+            self.add(keyword, index)
+        self.build()
+
+    def add(self, keyword, index):
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append(index)
+
+    def build(self):
+        # Los hijos de la raíz fallan a la raíz; el resto se resuelve en anchura
+        pending = deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self.goto[state].items():
+                pending.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def iter_matches(self, text):
+        text = text.lower()
+        goto, fail, output, keywords = self.goto, self.fail, self.output, self.keywords
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in output[state]:
+                start = position - len(keywords[index]) + 1
+                # Evita coincidencias en mitad de palabra ("arma" dentro de "alarma")
+                if self.word_start and start > 0 and text[start - 1].isalnum():
+                    continue
+                yield start, index
+
+    def count(self, text):
+        counts = {}
+        for _, index in self.iter_matches(text):
+            counts[index] = counts.get(index, 0) + 1
+        return counts
+
+
+class LocalDecision:
+    def __init__(self, theme, confident, scores, keywords):
+        self.theme = theme
+        self.confident = confident
+        self.scores = scores
+        self.keywords = keywords
+
+
+class ThemeMatcher:
+    """Asigna temáticas a partir de las palabras clave configuradas.
+
+    ``decide`` puntúa el texto bruto de la página y solo considera la decisión
+    fiable si la temática ganadora supera ``min_hits`` coincidencias y a la segunda
+    por un factor ``margin``; en caso contrario el resultado es ambiguo y se
+    recurre al LLM.
+    """
+
+    def __init__(self, topics, min_hits=None, margin=None):
+        self.topics = topics
+        self.min_hits = min_hits or Config.LOCAL_CLASSIFIER_MIN_HITS
+        self.margin = margin or Config.LOCAL_CLASSIFIER_MARGIN
+        self.themes = list(topics)
+        self.keyword_themes = []
+        keywords = []
+        for theme_index, theme in enumerate(self.themes):
+            for keyword in topics[theme]:
+                keywords.append(keyword)
+                self.keyword_themes.append(theme_index)
+        self.summary_matcher = KeywordMatcher(keywords)
+        self.page_matcher = KeywordMatcher(keywords, word_start=True)
+
+    def first_theme(self, classification_summary):
+        # Misma semántica que el antiguo determine_theme: primera temática (en orden
+        # de configuración) con alguna palabra clave presente en el resumen del LLM
+        found = {self.keyword_themes[index] for _, index in self.summary_matcher.iter_matches(classification_summary)}
+        return self.themes[min(found)] if found else INDETERMINADO
+
+    def decide(self, texto):
+        scores = {}
+        keywords = {}
+        for index, hits in self.page_matcher.count(texto).items():
+            theme = self.themes[self.keyword_themes[index]]
+            scores[theme] = scores.get(theme, 0) + hits
+            keywords.setdefault(theme, []).append(self.page_matcher.keywords[index])
+        if not scores:
+            return LocalDecision(INDETERMINADO, False, scores, [])
+        ranking = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        theme, best = ranking[0]
+        second = ranking[1][1] if len(ranking) > 1 else 0
+        confident = best >= self.min_hits and best >= self.margin * second
+        return LocalDecision(theme, confident, scores, keywords[theme])
+
+
+def load_topics(path=None):
+    path = path or Config.TOPICS_FILE
+    if not path:
+        return DEFAULT_TOPICS
+    try:
+        with open(path, encoding='utf-8') as topics_file:
+            return json.load(topics_file)
+    except (OSError, ValueError) as e:
+        logging.error(f"No se pudo cargar el fichero de temáticas {path}: {e}. Se usan las temáticas por defecto.")
+        return DEFAULT_TOPICS
+
+
+@lru_cache(maxsize=1)
+def get_theme_matcher():
+    # Se compila una única vez por proceso
+    return ThemeMatcher(load_topics())
@@ -0,0 +1,237 @@
+# link_graph.py
+import logging
+import threading
+import time
+
+import numpy as np
+
+from config import Config
+from .urls import canonicalize_url
+
+
+class LinkGraph:
+    """Grafo de enlaces en memoria. Cada URL tiene un id entero y las aristas se
+    guardan en formato CSR: los destinos de las aristas del nodo ``i`` son
+    ``indices[indptr[i]:indptr[i + 1]]`` (arrays de NumPy de int64/int32).
+
+    Al guardar de nuevo una página, sus enlaces sustituyen a los anteriores. Los
+    cambios se acumulan en ``pending`` y se incorporan al CSR en bloque (``compact``),
+    en lugar de reconstruir los arrays en cada página."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.urls = []
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        # Nodos rastreados (con sus enlaces conocidos), frente a los que solo son destino
+        self.crawled = np.zeros(0, dtype=bool)
+        self.pending = {}
+        self.pending_edges = 0
+        self.version = 0
+
+    def node_id(self, url):
+        node = self.ids.get(url)
+        if node is None:
+            node = self.ids[url] = len(self.urls)
+            self.urls.append(url)
+        return node
+
+    def node_count(self):
+        return len(self.urls)
+
+    def edge_count(self):
+        return len(self.indices) + self.pending_edges
+
+    def set_links(self, url, links):
+        # Los destinos se canonicalizan igual que las URLs de la frontera, así un enlace
+        # y la página rastreada a la que apunta son el mismo nodo
+        with self.lock:
+            source = self.node_id(url)
+            targets = {self.node_id(canonicalize_url(link)[0]) for link in links}
+            targets.discard(source)
+            self.set_link_ids(source, np.fromiter(targets, dtype=np.int32, count=len(targets)))
+
+    def set_link_ids(self, source, targets):
+        # Llamar con el lock tomado (o antes de compartir el grafo)
+        previous = self.pending.get(source)
+        self.pending_edges += len(targets) - (len(previous) if previous is not None else 0)
+        self.pending[source] = targets
+        self.version += 1
+        if self.pending_edges >= Config.LINK_GRAPH_COMPACT_EDGES:
+            self.compact_locked()
+
+    def compact(self):
+        with self.lock:
+            self.compact_locked()
+
+    def compact_locked(self):
+        if not self.pending:
+            return
+        n = len(self.urls)
+        old_nodes = len(self.indptr) - 1
+        old_sources = np.repeat(np.arange(old_nodes, dtype=np.int32), np.diff(self.indptr))
+        # Se descartan las aristas de los nodos reescritos y se añaden las nuevas
+        replaced = np.zeros(n, dtype=bool)
+        new_sources = np.fromiter(self.pending.keys(), dtype=np.int32, count=len(self.pending))
+        replaced[new_sources] = True
+        keep = ~replaced[old_sources]
+        counts = np.fromiter((len(targets) for targets in self.pending.values()), dtype=np.int64, count=len(self.pending))
+        sources = np.concatenate([old_sources[keep], np.repeat(new_sources, counts)])
+        indices = np.concatenate([self.indices[keep]] + list(self.pending.values()))
+        order = np.argsort(sources, kind='stable')
+        self.indices = indices[order].astype(np.int32, copy=False)
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=n), out=self.indptr[1:])
+        crawled = np.zeros(n, dtype=bool)
+        crawled[:len(self.crawled)] = self.crawled
+        crawled[new_sources] = True
+        self.crawled = crawled
+        self.pending = {}
+        self.pending_edges = 0
+
+    def snapshot(self):
+        # Arrays coherentes para calcular fuera del lock; compact crea arrays nuevos
+        # en lugar de modificar los existentes
+        with self.lock:
+            self.compact_locked()
+            n = len(self.urls)
+            indptr = self.indptr
+            if len(indptr) - 1 < n:
+                # Nodos nuevos sin aristas salientes desde la última compactación
+                indptr = np.concatenate([indptr, np.full(n + 1 - len(indptr), indptr[-1])])
+            crawled = np.zeros(n, dtype=bool)
+            crawled[:len(self.crawled)] = self.crawled
+            return indptr, self.indices, crawled, list(self.urls), self.version
+
+    @staticmethod
+    def in_degree(indices, n):
+        return np.bincount(indices, minlength=n)
+
+    @staticmethod
+    def pagerank(indptr, indices, damping=None, tolerance=None, max_iter=None):
+        """PageRank por iteración de potencias, vectorizado: en cada paso cada arista
+        reparte rank/grado_salida de su origen y np.bincount suma por destino. La masa
+        de los nodos sin enlaces salientes se reparte entre todos."""
+        damping = damping or Config.LINK_GRAPH_DAMPING
+        tolerance = tolerance or Config.LINK_GRAPH_TOLERANCE
+        max_iter = max_iter or Config.LINK_GRAPH_MAX_ITER
+        n = len(indptr) - 1
+        if n == 0:
+            return np.zeros(0), 0
+        out_degree = np.diff(indptr)
+        sources = np.repeat(np.arange(n, dtype=np.int32), out_degree)
+        dangling = out_degree == 0
+        inverse_degree = np.zeros(n)
+        inverse_degree[~dangling] = 1.0 / out_degree[~dangling]
+        rank = np.full(n, 1.0 / n)
+        for iteration in range(1, max_iter + 1):
+            shares = (rank * inverse_degree)[sources]
+            new_rank = np.bincount(indices, weights=shares, minlength=n)
+            new_rank = damping * (new_rank + rank[dangling].sum() / n) + (1.0 - damping) / n
+            delta = np.abs(new_rank - rank).sum()
+            rank = new_rank
+            if delta < tolerance:
+                break
+        return rank, iteration
+
+    def rank(self):
+        """Devuelve ``(urls, pagerank, grado_entrada, iteraciones, version)`` de los nodos rastreados."""
+        indptr, indices, crawled, urls, version = self.snapshot()
+        rank, iterations = self.pagerank(indptr, indices)
+        in_degree = self.in_degree(indices, len(urls))
+        nodes = np.flatnonzero(crawled)
+        return [urls[node] for node in nodes], rank[nodes], in_degree[nodes], iterations, version
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_link_graph():
+    return _graph
+
+
+def record_page_links(pages):
+    # Actualización incremental desde DatabaseManager.save_pages (solo si el grafo está cargado)
+    graph = _graph
+    if graph is None:
+        return
+    for page in pages:
+        graph.set_links(page['url'], page['enlaces'])
+
+
+def load_link_graph(db_manager, batch_size=None):
+    """Construye el grafo a partir de las tablas datos_completos y enlaces, de la
+    captura más antigua a la más reciente, de modo que cada página queda con los
+    enlaces de su última captura."""
+    global _graph
+    batch_size = batch_size or Config.LINK_GRAPH_LOAD_BATCH
+    with _graph_lock:
+        if _graph is not None:
+            return _graph
+        graph = LinkGraph()
+        # Se publica antes de cargar para no perder las páginas guardadas mientras tanto
+        _graph = graph
+    start_time = time.monotonic()
+    after = None
+    while True:
+        after, pages = db_manager.get_page_links(after, batch_size)
+        for url, links in pages:
+            graph.set_links(url, links)
+        if not after:
+            break
+    graph.compact()
+    logging.info(f"Grafo de enlaces cargado: {graph.node_count()} nodos, {graph.edge_count()} aristas "
+                 f"en {time.monotonic() - start_time:.1f} s")
+    return graph
+
+
+class LinkRanker:
+    """Hilo que carga el grafo de enlaces y, cada ``interval`` segundos, recalcula
+    PageRank y grado de entrada si el grafo ha cambiado y los guarda en la tabla
+    puntuaciones."""
+
+    def __init__(self, db_manager, interval=None):
+        self.db_manager = db_manager
+        self.interval = interval or Config.LINK_GRAPH_RANK_INTERVAL
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.ranked_version = None
+        self.stats = {'calculos': 0, 'ultimo_calculo': None, 'segundos_ultimo_calculo': None, 'iteraciones': None}
+
+    def start(self):
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self.run, name='link-ranker', daemon=True)
+        self.thread.start()
+        logging.info("Cálculo periódico de PageRank iniciado.")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        try:
+            graph = load_link_graph(self.db_manager)
+        except Exception as e:
+            logging.error(f"No se pudo cargar el grafo de enlaces: {e}")
+            return
+        while not self.stop_event.is_set():
+            if graph.version != self.ranked_version:
+                try:
+                    self.rank_and_store(graph)
+                except Exception as e:
+                    logging.error(f"Error al calcular PageRank: {e}")
+            self.stop_event.wait(self.interval)
+
+    def rank_and_store(self, graph):
+        start_time = time.monotonic()
+        urls, ranks, in_degrees, iterations, version = graph.rank()
+        rows = list(zip(urls, ranks.tolist(), in_degrees.tolist()))
+        for start in range(0, len(rows), Config.LINK_GRAPH_LOAD_BATCH):
+            self.db_manager.save_page_scores(rows[start:start + Config.LINK_GRAPH_LOAD_BATCH])
+        self.ranked_version = version
+        elapsed = time.monotonic() - start_time
+        self.stats.update(calculos=self.stats['calculos'] + 1, ultimo_calculo=time.time(),
+                          segundos_ultimo_calculo=elapsed, iteraciones=iterations)
+        logging.info(f"PageRank de {len(rows)} páginas calculado en {iterations} iteraciones ({elapsed:.1f} s)")
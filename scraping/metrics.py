@@ -0,0 +1,197 @@
+# metrics.py
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from config import Config
+
+# Límites superiores (segundos) de los buckets del histograma de etapas
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Etapas del pipeline que se guardan por página cuando METRICS_STORE_PAGE_TIMINGS está activo
+PAGE_STAGES = ('descarga', 'parseo', 'idioma', 'ner', 'clasificacion')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Contadores, histogramas y valores instantáneos del proceso, en formato de
+    exposición de texto de Prometheus. Los valores instantáneos se calculan con
+    una función al generar la salida."""
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.help = {}
+        self.types = {}
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = {}
+        self.raw = None
+
+    def keep_raw_samples(self):
+        # Guarda además cada observación, para calcular percentiles exactos en los benchmarks
+        with self.lock:
+            self.raw = {}
+
+    def raw_samples(self, name):
+        # {etiquetas: [valores]} de un histograma, si se activó keep_raw_samples
+        with self.lock:
+            return {labels: list(values) for (key, labels), values in (self.raw or {}).items() if key == name}
+
+    def describe(self, name, kind, help_text):
+        self.types[name] = kind
+        self.help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][index] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+            if self.raw is not None:
+                self.raw.setdefault(key, []).append(value)
+
+    def collect(self, name, kind, help_text, callback, label=None):
+        # Valores que ya cuenta otro componente (cachés, colas): callback devuelve un
+        # número o, si se indica label, un dict {valor_etiqueta: número}
+        self.describe(name, kind, help_text)
+        self.collectors[name] = (callback, label)
+
+    def record_stage(self, stage, elapsed, results=()):
+        # Una observación por llamada; si la etapa procesa un lote de páginas, a cada
+        # una se le anota en result['tiempos'] la parte proporcional
+        self.observe('indexador_etapa_segundos', elapsed, etapa=stage)
+        if results:
+            share = elapsed / len(results)
+            for result in results:
+                timings = result.setdefault('tiempos', {})
+                timings[stage] = timings.get(stage, 0.0) + share
+
+    @contextmanager
+    def timer(self, stage, results=()):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - start_time, results)
+
+    def render(self):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(buckets), total, count) for key, (buckets, total, count) in self.histograms.items()}
+        samples = {}
+        for (name, labels), value in counters.items():
+            samples.setdefault(name, []).append(f'{name}{format_labels(labels)} {format_value(value)}')
+        for (name, labels), (buckets, total, count) in histograms.items():
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float('inf'),), buckets + [count - sum(buckets)]):
+                cumulative += bucket
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", format_value(bound)),))} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {format_value(total)}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+        for name, (callback, label) in list(self.collectors.items()):
+            try:
+                value = callback()
+            except Exception as e:
+                logging.error(f"Error calculando la métrica {name}: {e}")
+                continue
+            if label:
+                samples[name] = [f'{name}{format_labels(((label, key),))} {format_value(item)}'
+                                 for key, item in sorted(value.items())]
+            else:
+                samples[name] = [f'{name} {format_value(value)}']
+
+        output = []
+        for name in sorted(samples):
+            if name in self.help:
+                output.append(f'# HELP {name} {self.help[name]}')
+                output.append(f'# TYPE {name} {self.types[name]}')
+            output.extend(samples[name])
+        return '\n'.join(output) + '\n'
+
+
+# Métricas compartidas por todos los scrapers del proceso
+metrics = Metrics()
+metrics.describe('indexador_etapa_segundos', 'histogram', 'Duración de cada etapa del pipeline (por llamada o lote)')
+metrics.describe('indexador_paginas_total', 'counter', 'Páginas por resultado (descargada, procesada, sin_cambios, omitida)')
+metrics.describe('indexador_bytes_descargados_total', 'counter', 'Bytes de cuerpo leídos')
+metrics.describe('indexador_errores_total', 'counter', 'Errores de descarga o procesamiento')
+
+
+class SamplingProfiler:
+    """Perfilador por muestreo: cada ``interval`` segundos toma la pila de todos los
+    hilos del proceso y cuenta cuántas veces aparece cada pila. El resultado
+    se escribe en formato "folded" (una pila por línea, funciones separadas por ';'),
+    que entienden flamegraph.pl y speedscope."""
+
+    def __init__(self, interval=None, max_depth=64):
+        self.interval = interval or Config.PROFILE_SAMPLE_INTERVAL
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='perfilador', daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self.stacks[self.fold(frame)] += 1
+            self.samples += 1
+
+    def fold(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        logging.info(f"Perfil guardado en {path} ({self.samples} muestras)")
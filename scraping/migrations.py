@@ -0,0 +1,536 @@
+# migrations.py
+import logging
+import threading
+
+from .urls import normalize_host
+
+BACKFILL_BATCH_SIZE = 5000
+MIGRATION_LOCK = 'indexador_migraciones'
+# Segundos que espera cada intento de GET_LOCK y número de intentos
+MIGRATION_LOCK_TIMEOUT = 60
+MIGRATION_LOCK_ATTEMPTS = 3
+
+# Tablas que la migración 10 conserva con el sufijo _v1 mientras se copian sus datos
+LEGACY_TABLES = ('datos_completos', 'enlaces', 'imagenes', 'metadatos', 'entidades', 'tiempos_pagina')
+LEGACY_SUFFIX = '_v1'
+
+
+def table_exists(cursor, table):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return cursor.fetchone()[0] > 0
+
+
+def column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def index_exists(cursor, table, index):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index))
+    return cursor.fetchone()[0] > 0
+
+
+def add_column(table, column, definition):
+    # Los ALTER de MySQL no son transaccionales: si una migración se interrumpe a
+    # medias, al reintentarla se saltan las columnas e índices ya creados
+    def step(connection, cursor):
+        if not column_exists(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+
+def add_index(table, index, definition, kind='INDEX'):
+    def step(connection, cursor):
+        if not index_exists(cursor, table, index):
+            cursor.execute(f"CREATE {kind} {index} ON {table} {definition}")
+    return step
+
+
+def rename_table(table, new_name):
+    def step(connection, cursor):
+        if table_exists(cursor, table) and not table_exists(cursor, new_name):
+            cursor.execute(f"RENAME TABLE {table} TO {new_name}")
+    return step
+
+
+def backfill_hosts(connection, cursor):
+    # Rellena host en las filas existentes por lotes para no bloquear la tabla
+    # con una única transacción enorme; el host se calcula igual que al escribir
+    last_id = ''
+    total = 0
+    while True:
+        cursor.execute("""
+            SELECT id, url FROM datos_completos
+            WHERE host IS NULL AND id > %s
+            ORDER BY id LIMIT %s
+        """, (last_id, BACKFILL_BATCH_SIZE))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        cursor.executemany("UPDATE datos_completos SET host = %s WHERE id = %s",
+                           [(normalize_host(url) or '', row_id) for row_id, url in rows])
+        connection.commit()
+        last_id = rows[-1][0]
+        total += len(rows)
+    logging.info(f"Columna host rellenada en {total} filas")
+
+
+def drop_empty_legacy_tables(connection, cursor):
+    # La migración 10 solo cambia el esquema: la copia de los datos _v1 la hace
+    # python -m scraping.storage_migration para no bloquear al primer proceso que conecta.
+    # En una instalación nueva las tablas antiguas están vacías y se borran aquí
+    source = 'datos_completos' + LEGACY_SUFFIX
+    if not table_exists(cursor, source):
+        return
+    cursor.execute(f"SELECT 1 FROM {source} LIMIT 1")
+    if cursor.fetchone() is None:
+        drop_legacy_tables(cursor)
+    else:
+        logging.warning("Las páginas anteriores siguen en las tablas _v1 y no aparecen en el historial ni en la "
+                        "búsqueda hasta copiarlas con python -m scraping.storage_migration")
+
+
+def drop_legacy_tables(cursor):
+    # Primero las tablas hijas, por sus claves ajenas
+    for table in reversed(LEGACY_TABLES):
+        cursor.execute(f"DROP TABLE IF EXISTS {table}{LEGACY_SUFFIX}")
+
+
+# Recalcula los agregados a partir de datos_completos (migración 6 y fin de la copia
+# al almacenamiento compacto)
+REBUILD_ROLLUPS = [
+    "DELETE FROM resumen_tematicas",
+    """
+    INSERT INTO resumen_tematicas (clasificacion_tematica, paginas, ilicitas)
+    SELECT COALESCE(clasificacion_tematica, ''), COUNT(*), COALESCE(SUM(es_ilicito = 1), 0)
+    FROM datos_completos
+    GROUP BY COALESCE(clasificacion_tematica, '')
+    """,
+    "DELETE FROM resumen_dominios",
+    """
+    INSERT INTO resumen_dominios (host, paginas, ilicitas, max_profundidad, tiempo_scraping, tiempo_conexion, ultima_captura)
+    SELECT host, COUNT(*), COALESCE(SUM(es_ilicito = 1), 0), MAX(profundidad),
+           COALESCE(SUM(tiempo_scraping), 0), COALESCE(SUM(tiempo_conexion), 0), MAX(fecha_captura)
+    FROM datos_completos
+    WHERE host IS NOT NULL
+    GROUP BY host
+    """,
+    "DELETE FROM resumen_diario",
+    """
+    INSERT INTO resumen_diario (dia, clasificacion_tematica, paginas, ilicitas)
+    SELECT DATE(fecha_captura), COALESCE(clasificacion_tematica, ''), COUNT(*), COALESCE(SUM(es_ilicito = 1), 0)
+    FROM datos_completos
+    GROUP BY DATE(fecha_captura), COALESCE(clasificacion_tematica, '')
+    """,
+]
+
+
+def rebuild_rollups(cursor):
+    for statement in REBUILD_ROLLUPS:
+        cursor.execute(statement)
+
+
+def legacy_copy_pending(cursor):
+    # True si quedan páginas de las tablas _v1 sin copiar al formato compacto
+    source = 'datos_completos' + LEGACY_SUFFIX
+    if not table_exists(cursor, source):
+        return False
+    cursor.execute("SELECT fecha, antiguo_id FROM migracion_almacenamiento WHERE tabla = 'datos_completos'")
+    fecha, last_id = cursor.fetchone()
+    if last_id is None:
+        cursor.execute(f"SELECT 1 FROM {source} LIMIT 1")
+    else:
+        cursor.execute(f"""
+            SELECT 1 FROM {source}
+            WHERE fecha_captura > %s OR (fecha_captura = %s AND id > %s)
+            LIMIT 1
+        """, (fecha, fecha, last_id))
+    return cursor.fetchone() is not None
+
+
+# Cada migración se aplica una sola vez y queda registrada en schema_version.
+# Para cambiar el esquema se añade una entrada nueva al final; nunca se edita una ya publicada.
+# Un paso puede ser una sentencia SQL o una función (connection, cursor) para rellenos por lotes.
+MIGRATIONS = [
+    (1, "Tablas iniciales", [
+        """
+        CREATE TABLE IF NOT EXISTS datos_completos (
+            id CHAR(36) PRIMARY KEY,
+            url VARCHAR(255) NOT NULL,
+            titulo VARCHAR(255),
+            texto TEXT,
+            fecha_captura DATETIME DEFAULT CURRENT_TIMESTAMP,
+            clasificacion_tematica VARCHAR(255),
+            resumen TEXT,
+            es_ilicito TINYINT(1),
+            tiempo_scraping FLOAT,
+            tiempo_conexion FLOAT,
+            profundidad INT,
+            INDEX (url),
+            INDEX (clasificacion_tematica)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS imagenes (
+            id CHAR(36) PRIMARY KEY,
+            datos_completos_id CHAR(36),
+            url VARCHAR(255),
+            imagen VARCHAR(255),
+            FOREIGN KEY (datos_completos_id) REFERENCES datos_completos(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS enlaces (
+            id CHAR(36) PRIMARY KEY,
+            datos_completos_id CHAR(36),
+            url VARCHAR(255),
+            enlace VARCHAR(1000),
+            FOREIGN KEY (datos_completos_id) REFERENCES datos_completos(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS metadatos (
+            id CHAR(36) PRIMARY KEY,
+            datos_completos_id CHAR(36),
+            url VARCHAR(255),
+            nombre VARCHAR(255),
+            contenido TEXT,
+            FOREIGN KEY (datos_completos_id) REFERENCES datos_completos(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS entidades (
+            id CHAR(36) PRIMARY KEY,
+            datos_completos_id CHAR(36),
+            url VARCHAR(255),
+            entidad VARCHAR(255),
+            tipo VARCHAR(255),
+            FOREIGN KEY (datos_completos_id) REFERENCES datos_completos(id)
+        )
+        """,
+    ]),
+    (2, "Caché de clasificaciones", [
+        """
+        CREATE TABLE IF NOT EXISTS cache_clasificaciones (
+            clave CHAR(64) PRIMARY KEY,
+            resumen TEXT,
+            es_ilicito TINYINT(1),
+            creado DATETIME NOT NULL,
+            ultimo_acceso DATETIME NOT NULL,
+            INDEX (ultimo_acceso)
+        )
+        """,
+    ]),
+    (3, "Estado por URL y planificación de re-rastreos", [
+        """
+        CREATE TABLE IF NOT EXISTS estado_urls (
+            url_hash CHAR(64) PRIMARY KEY,
+            url VARCHAR(1000) NOT NULL,
+            host VARCHAR(255),
+            etag VARCHAR(255),
+            last_modified VARCHAR(64),
+            content_hash CHAR(64),
+            ultima_comprobacion DATETIME,
+            ultimo_cambio DATETIME,
+            INDEX (host)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS dominios_recrawl (
+            host VARCHAR(255) PRIMARY KEY,
+            url_inicial VARCHAR(1000) NOT NULL,
+            intervalo INT NOT NULL,
+            ultimo_rastreo DATETIME,
+            proximo_rastreo DATETIME,
+            paginas_totales INT,
+            paginas_cambiadas INT,
+            INDEX (proximo_rastreo)
+        )
+        """,
+    ]),
+    (4, "Columna host indexada e índice de texto completo", [
+        add_column('datos_completos', 'host', 'VARCHAR(255) NULL AFTER url'),
+        backfill_hosts,
+        add_index('datos_completos', 'idx_datos_host_fecha', '(host, fecha_captura)'),
+        add_index('datos_completos', 'ft_datos_busqueda', '(titulo, texto, resumen)', kind='FULLTEXT INDEX'),
+    ]),
+    (5, "Índices para el historial paginado", [
+        add_index('datos_completos', 'idx_datos_fecha', '(fecha_captura, id)'),
+        add_index('datos_completos', 'idx_datos_tematica_fecha', '(clasificacion_tematica, fecha_captura, id)'),
+        add_index('datos_completos', 'idx_datos_ilicito_fecha', '(es_ilicito, fecha_captura, id)'),
+    ]),
+    (6, "Tablas de agregados por temática, dominio y día", [
+        """
+        CREATE TABLE IF NOT EXISTS resumen_tematicas (
+            clasificacion_tematica VARCHAR(255) PRIMARY KEY,
+            paginas BIGINT NOT NULL DEFAULT 0,
+            ilicitas BIGINT NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS resumen_dominios (
+            host VARCHAR(255) PRIMARY KEY,
+            paginas BIGINT NOT NULL DEFAULT 0,
+            ilicitas BIGINT NOT NULL DEFAULT 0,
+            max_profundidad INT,
+            tiempo_scraping DOUBLE NOT NULL DEFAULT 0,
+            tiempo_conexion DOUBLE NOT NULL DEFAULT 0,
+            ultima_captura DATETIME
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS resumen_diario (
+            dia DATE NOT NULL,
+            clasificacion_tematica VARCHAR(255) NOT NULL,
+            paginas BIGINT NOT NULL DEFAULT 0,
+            ilicitas BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, clasificacion_tematica)
+        )
+        """,
+        # Carga inicial a partir de los datos existentes; después se mantienen al escribir
+        *REBUILD_ROLLUPS,
+    ]),
+    (7, "Frontera de rastreo persistente", [
+        # activo vale 1 mientras el rastreo está en curso y NULL al terminar: la clave
+        # única permite un solo rastreo activo por URL inicial y cualquier número de terminados
+        """
+        CREATE TABLE IF NOT EXISTS rastreos (
+            id CHAR(36) PRIMARY KEY,
+            url_inicial VARCHAR(1000) NOT NULL,
+            url_hash CHAR(64) NOT NULL,
+            activo TINYINT(1) NULL,
+            estado VARCHAR(20) NOT NULL,
+            creado DATETIME NOT NULL,
+            actualizado DATETIME NOT NULL,
+            UNIQUE KEY uq_rastreo_activo (url_hash, activo)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS frontera (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            rastreo_id CHAR(36) NOT NULL,
+            url_hash CHAR(64) NOT NULL,
+            url VARCHAR(1000) NOT NULL,
+            profundidad INT NOT NULL,
+            estado VARCHAR(16) NOT NULL DEFAULT 'pendiente',
+            lease_token CHAR(36),
+            lease_expira DATETIME,
+            intentos INT NOT NULL DEFAULT 0,
+            UNIQUE KEY uq_frontera_url (rastreo_id, url_hash),
+            INDEX idx_frontera_cola (rastreo_id, estado, profundidad, id),
+            INDEX idx_frontera_lease (rastreo_id, lease_token)
+        )
+        """,
+    ]),
+    (8, "Tiempos por etapa de cada página", [
+        """
+        CREATE TABLE IF NOT EXISTS tiempos_pagina (
+            datos_completos_id CHAR(36) PRIMARY KEY,
+            descarga DOUBLE,
+            parseo DOUBLE,
+            idioma DOUBLE,
+            ner DOUBLE,
+            clasificacion DOUBLE,
+            FOREIGN KEY (datos_completos_id) REFERENCES datos_completos(id)
+        )
+        """,
+    ]),
+    (9, "Puntuaciones del grafo de enlaces (PageRank y grado de entrada)", [
+        """
+        CREATE TABLE IF NOT EXISTS puntuaciones (
+            url VARCHAR(255) PRIMARY KEY,
+            pagerank DOUBLE NOT NULL,
+            enlaces_entrantes INT NOT NULL,
+            calculado DATETIME,
+            INDEX idx_pagerank (pagerank)
+        )
+        """,
+    ]),
+    # Ids binarios ordenados por tiempo en lugar de uuid4 en CHAR(36), URLs en una
+    # tabla diccionario referenciada por id y texto comprimido con zlib. El índice
+    # FULLTEXT no puede leer el texto comprimido: se indexa texto_busqueda, un prefijo
+    # en claro de STORAGE_SEARCH_CHARS caracteres. Las tablas anteriores se renombran
+    # a *_v1 y se copian por lotes; puntuaciones se recalcula desde el grafo de enlaces.
+    (10, "Almacenamiento compacto: ids ordenados, diccionario de URLs y texto comprimido", [
+        *(rename_table(table, table + LEGACY_SUFFIX) for table in LEGACY_TABLES),
+        "DROP TABLE IF EXISTS puntuaciones",
+        """
+        CREATE TABLE IF NOT EXISTS urls (
+            id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+            url_hash BINARY(16) NOT NULL,
+            url VARCHAR(2048) NOT NULL,
+            UNIQUE KEY uq_urls_hash (url_hash)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS datos_completos (
+            id BINARY(16) PRIMARY KEY,
+            url_id BIGINT UNSIGNED NOT NULL,
+            host VARCHAR(255),
+            titulo VARCHAR(255),
+            fragmento VARCHAR(300),
+            texto_comprimido MEDIUMBLOB,
+            texto_busqueda TEXT,
+            fecha_captura DATETIME DEFAULT CURRENT_TIMESTAMP,
+            clasificacion_tematica VARCHAR(255),
+            resumen TEXT,
+            es_ilicito TINYINT(1),
+            tiempo_scraping FLOAT,
+            tiempo_conexion FLOAT,
+            profundidad INT,
+            INDEX idx_datos_url_fecha (url_id, fecha_captura),
+            INDEX idx_datos_host_fecha (host, fecha_captura),
+            INDEX idx_datos_fecha (fecha_captura, id),
+            INDEX idx_datos_tematica_fecha (clasificacion_tematica, fecha_captura, id),
+            INDEX idx_datos_ilicito_fecha (es_ilicito, fecha_captura, id),
+            FULLTEXT INDEX ft_datos_busqueda (titulo, texto_busqueda, resumen),
+            CONSTRAINT fk_datos_url FOREIGN KEY (url_id) REFERENCES urls(id)
+        )
+        """,
+        # Las tablas hijas no necesitan id propio: la clave (página, orden) agrupa las
+        # filas de cada página y, como el id de página crece con el tiempo, se inserta al final
+        """
+        CREATE TABLE IF NOT EXISTS enlaces (
+            datos_completos_id BINARY(16) NOT NULL,
+            orden INT UNSIGNED NOT NULL,
+            url_id BIGINT UNSIGNED NOT NULL,
+            PRIMARY KEY (datos_completos_id, orden),
+            CONSTRAINT fk_enlaces_datos FOREIGN KEY (datos_completos_id) REFERENCES datos_completos(id),
+            CONSTRAINT fk_enlaces_url FOREIGN KEY (url_id) REFERENCES urls(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS imagenes (
+            datos_completos_id BINARY(16) NOT NULL,
+            orden INT UNSIGNED NOT NULL,
+            imagen VARCHAR(255),
+            PRIMARY KEY (datos_completos_id, orden),
+            CONSTRAINT fk_imagenes_datos FOREIGN KEY (datos_completos_id) REFERENCES datos_completos(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS metadatos (
+            datos_completos_id BINARY(16) NOT NULL,
+            orden INT UNSIGNED NOT NULL,
+            nombre VARCHAR(255),
+            contenido TEXT,
+            PRIMARY KEY (datos_completos_id, orden),
+            CONSTRAINT fk_metadatos_datos FOREIGN KEY (datos_completos_id) REFERENCES datos_completos(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS entidades (
+            datos_completos_id BINARY(16) NOT NULL,
+            orden INT UNSIGNED NOT NULL,
+            entidad VARCHAR(255),
+            tipo VARCHAR(255),
+            PRIMARY KEY (datos_completos_id, orden),
+            CONSTRAINT fk_entidades_datos FOREIGN KEY (datos_completos_id) REFERENCES datos_completos(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS tiempos_pagina (
+            datos_completos_id BINARY(16) PRIMARY KEY,
+            descarga DOUBLE,
+            parseo DOUBLE,
+            idioma DOUBLE,
+            ner DOUBLE,
+            clasificacion DOUBLE,
+            CONSTRAINT fk_tiempos_datos FOREIGN KEY (datos_completos_id) REFERENCES datos_completos(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS puntuaciones (
+            url_id BIGINT UNSIGNED PRIMARY KEY,
+            pagerank DOUBLE NOT NULL,
+            enlaces_entrantes INT NOT NULL,
+            calculado DATETIME,
+            INDEX idx_pagerank (pagerank),
+            CONSTRAINT fk_puntuaciones_url FOREIGN KEY (url_id) REFERENCES urls(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS migracion_almacenamiento (
+            tabla VARCHAR(64) PRIMARY KEY,
+            fecha DATETIME,
+            antiguo_id CHAR(36),
+            filas BIGINT NOT NULL DEFAULT 0
+        )
+        """,
+        "INSERT IGNORE INTO migracion_almacenamiento (tabla, filas) VALUES ('datos_completos', 0)",
+        drop_empty_legacy_tables,
+    ]),
+    # PageRank copiado en cada captura para ordenar el historial por el índice
+    # (pagerank, id) sin unir puntuaciones; LinkRanker lo rellena en su primer cálculo
+    (11, "PageRank indexado en datos_completos", [
+        add_column('datos_completos', 'pagerank', 'DOUBLE NOT NULL DEFAULT 0'),
+        add_index('datos_completos', 'idx_datos_pagerank', '(pagerank, id)'),
+    ]),
+]
+
+_applied_lock = threading.Lock()
+_applied = False
+
+
+def acquire_migration_lock(cursor):
+    # GET_LOCK devuelve 1 si obtiene el bloqueo, 0 si se agota la espera (otro proceso
+    # sigue migrando) y NULL si hay un error; sin el bloqueo no se aplica nada
+    for attempt in range(1, MIGRATION_LOCK_ATTEMPTS + 1):
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK, MIGRATION_LOCK_TIMEOUT))
+        acquired = cursor.fetchone()[0]
+        if acquired == 1:
+            return
+        logging.warning(f"No se pudo obtener el bloqueo de migraciones (intento {attempt} de "
+                        f"{MIGRATION_LOCK_ATTEMPTS}, GET_LOCK devolvió {acquired})")
+    raise RuntimeError("No se pudo obtener el bloqueo de migraciones: otro proceso sigue aplicándolas.")
+
+
+def run_migrations(connection, target=None):
+    # GET_LOCK evita que dos procesos apliquen a la vez la misma migración; target
+    # limita la versión aplicada (el benchmark de almacenamiento crea el esquema anterior)
+    with connection.cursor() as cursor:
+        acquire_migration_lock(cursor)
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INT PRIMARY KEY,
+                    descripcion VARCHAR(255),
+                    aplicada DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute("SELECT version FROM schema_version")
+            applied = {row[0] for row in cursor.fetchall()}
+            for version, description, statements in MIGRATIONS:
+                if target is not None and version > target:
+                    break
+                if version in applied:
+                    continue
+                logging.info(f"Aplicando migración {version}: {description}")
+                for statement in statements:
+                    if callable(statement):
+                        statement(connection, cursor)
+                    else:
+                        cursor.execute(statement)
+                cursor.execute("INSERT INTO schema_version (version, descripcion) VALUES (%s, %s)", (version, description))
+                connection.commit()
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+            cursor.fetchone()
+
+
+def ensure_schema(connection):
+    # Solo la primera conexión del proceso comprueba el esquema
+    global _applied
+    with _applied_lock:
+        if not _applied:
+            run_migrations(connection)
+            _applied = True
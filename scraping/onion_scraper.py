@@ -1,139 +1,410 @@
 # onion_scraper.py
 import requests
-from bs4 import BeautifulSoup
 import logging
 from urllib.parse import urljoin, urlparse
-from collections import deque
-import spacy
-from langdetect import detect, DetectorFactory
 import time
+import queue
+import threading
+from config import Config
 from .text_classifier import TextClassifier
-from .utils import get_nlp_model
+from .tiered_classifier import TieredClassifier
+from .keyword_matcher import get_theme_matcher
+from .write_buffer import WriteBehindBuffer
+from .recrawl_scheduler import record_domain_crawl
+from .html_extractor import get_extractor, extract_from_soup
+from .utils import get_entity_extractor, detect_languages
+from .frontier import create_frontier
+from .urls import UrlFilter
+from .fetcher import get_fetcher, DownloadStats
+from .metrics import metrics
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Clave de progreso del trabajo para cada valor de la etiqueta estado de indexador_paginas_total
+PROGRESS_KEYS = {'descargada': 'paginas_descargadas', 'procesada': 'paginas_procesadas', 'sin_cambios': 'paginas_sin_cambios'}
+
+# Caracteres del texto que se conservan en el resumen de cada página (el mismo fragmento que el historial)
+SNIPPET_CHARS = 300
+
+
+def summarize_result(result):
+    # Resumen compacto de una página ya guardada: el texto completo, las entidades y
+    # los enlaces quedan en la base de datos y no se retienen en memoria
+    return {
+        'url': result['url'],
+        'titulo': result['titulo'],
+        'fragmento': result['texto'][:SNIPPET_CHARS],
+        'clasificacion': result['clasificacion'],
+        'resumen': result['resumen'],
+        'es_ilicito': result['es_ilicito'],
+        'profundidad': result['profundidad'],
+        'entidades': len(result['entidades']),
+        'enlaces': len(result['enlaces']),
+        'tiempo_scraping': result['tiempo_scraping'],
+        'tiempo_conexion': result['tiempo_conexion'],
+    }
+
+
 class OnionScraper:
-    def __init__(self, base_url, proxy_host, proxy_port, db_manager, text_classifier=None, max_depth=3):
+    def __init__(self, base_url, proxy_host, proxy_port, db_manager, text_classifier=None, max_depth=3, mode=None,
+                 incremental=False, frontier=None, fetcher=None):
+        # Todas las URLs se comparan en forma canónica, también la inicial
+        self.url_filter = UrlFilter()
+        base_url = self.url_filter.canonicalize(base_url)[0]
         self.base_url = base_url
-        self.proxies = {'http': f'socks5h://{proxy_host}:{proxy_port}', 'https': f'socks5h://{proxy_host}:{proxy_port}'}
+        # Se calcula una vez en lugar de por cada enlace
+        self.base_netloc = urlparse(base_url).netloc
+        self.base_hostname = urlparse(base_url).hostname
+        self.extractor = get_extractor()
+        self.proxy_host = proxy_host
+        self.proxy_port = proxy_port
+        # Sesiones keep-alive repartidas entre los circuitos de TOR_PROXIES
+        self.fetcher = fetcher or get_fetcher()
         self.db_manager = db_manager
         self.text_classifier = text_classifier
-        self.to_visit = deque([(base_url, 0)])
-        self.visited_urls = set()
+        self.tiered_classifier = TieredClassifier(text_classifier) if text_classifier else None
+        # La frontera (URLs por visitar y ya vistas) se crea al empezar el rastreo
+        self.frontier = frontier
         self.max_depth = max_depth
+        self.mode = mode or Config.CRAWL_MODE
+        self.cancel_event = threading.Event()
+        self.async_crawler = None
+        self.write_buffer = None
+        # Destino del resumen de cada página procesada (lo fija iter_scrape)
+        self.result_sink = None
+        # Modo incremental: peticiones condicionales y se omiten las páginas sin cambios
+        self.incremental = incremental
+        self.url_states = {}
+        self.pending_states = []
+        self.states_lock = threading.Lock()
+        self.progress = {'paginas_descargadas': 0, 'paginas_procesadas': 0, 'paginas_sin_cambios': 0,
+                         'paginas_cambiadas': 0, 'errores': 0, 'ultimo_error': None}
+        # Recursos que no son HTML o que superan FETCH_MAX_BYTES
+        self.download_stats = DownloadStats()
         logging.info(f"Inicializado el OnionScraper para la URL: {base_url}")
 
     def scrape(self):
-        results = []
-        while self.to_visit:
-            url, depth = self.to_visit.popleft()
-            logging.info(f"Visitando: {url} (Profundidad: {depth})")
-            if url in self.visited_urls or depth > self.max_depth:
-                continue
-            self.visited_urls.add(url)
+        # Lista con el resumen de cada página procesada, al terminar el rastreo
+        return list(self.iter_scrape())
+
+    def iter_scrape(self):
+        """Generador que devuelve el resumen de cada página (``summarize_result``) en
+        cuanto queda guardada. El rastreo se ejecuta en otro hilo; la cola acotada
+        frena al rastreador si el consumidor va más lento, y si deja de iterar el
+        rastreo se cancela."""
+        summaries = queue.Queue(maxsize=Config.STREAM_QUEUE_SIZE)
+        finished = object()
+        errors = []
 
-            start_time = time.time()  # Start time for connection
+        def run():
+            self.result_sink = summaries.put
             try:
-                response = requests.get(url, proxies=self.proxies, timeout=20)
-                tiempo_conexion = time.time() - start_time  # Connection time calculation
-                logging.info(f"Tiempo de conexión para {url}: {tiempo_conexion:.2f} segundos")
-
-                if response.status_code == 200:
-                    start_scraping_time = time.time()  # Start time for scraping
-                    soup = BeautifulSoup(response.text, 'html.parser')
-                    result = self.process_html(url, soup, depth)  # Process HTML
-                    tiempo_scraping = time.time() - start_scraping_time  # Scraping time calculation
-                    logging.info(f"Tiempo de scraping para {url}: {tiempo_scraping:.2f} segundos")
-
-                    # Update result with times
-                    result['tiempo_scraping'] = tiempo_scraping
-                    result['tiempo_conexion'] = tiempo_conexion
-
-                    # Save data with times
-                    self.db_manager.save_data(url, result['titulo'], result['texto'], result['enlaces'], result['imagenes'], 
-                                              result['scripts'], result['estilos'], result['metadatos'], result['entidades'], 
-                                              result['clasificacion'], result['resumen'], result['es_ilicito'], 
-                                              tiempo_scraping, tiempo_conexion, depth)
-                    
-                    results.append(result)
-                    self.enqueue_links(url, soup, depth)
-                else:
-                    logging.error(f"Error al acceder a la página {url}: Código de estado {response.status_code}")
-            except requests.RequestException as e:
-                logging.error(f"Error al realizar la solicitud HTTP: {str(e)}")
-        return results
+                self.crawl()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                self.result_sink = None
+                summaries.put(finished)
+
+        thread = threading.Thread(target=run, name=f'rastreo-{self.base_hostname}', daemon=True)
+        thread.start()
+        try:
+            while True:
+                summary = summaries.get()
+                if summary is finished:
+                    break
+                yield summary
+        finally:
+            if thread.is_alive():
+                # Se vacía la cola para que el rastreador no quede bloqueado al cancelarlo
+                self.cancel()
+                while summaries.get() is not finished:
+                    pass
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def emit(self, result):
+        if self.result_sink:
+            self.result_sink(summarize_result(result))
+
+    def crawl(self):
+        # Los estados previos se cargan siempre para poder medir qué páginas cambiaron
+        self.url_states = self.db_manager.get_url_states(urlparse(self.base_url).hostname) or {}
+        if self.frontier is None:
+            self.frontier = create_frontier(self.base_url, self.db_manager)
+        if Config.WRITE_BEHIND_ENABLED:
+            self.write_buffer = WriteBehindBuffer(self.db_manager, on_saved=self.pages_saved)
+        completed = False
+        try:
+            if self.mode == 'async':
+                from .async_crawler import AsyncCrawler
+                AsyncCrawler(self).run()
+            else:
+                self.scrape_serial()
+            completed = not self.is_cancelled()
+        finally:
+            self.close_frontier(completed)
+            # Se vacía lo pendiente antes de que el llamante cierre la conexión
+            if self.write_buffer:
+                self.write_buffer.close()
+                self.progress['escritura'] = dict(self.write_buffer.stats)
+                self.write_buffer = None
+            self.flush_url_states()
+            self.record_crawl()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def close_frontier(self, completed):
+        # Un rastreo cancelado o interrumpido deja sus URLs pendientes para reanudarlo;
+        # solo se da por terminado cuando ningún trabajador tiene nada más que visitar
+        try:
+            self.frontier.release_all()
+            self.frontier.close(completed and self.frontier.is_exhausted())
+        except Exception as e:
+            logging.error(f"No se pudo cerrar la frontera de {self.base_url}: {e}")
+
+    def queue_depth(self):
+        pending = self.frontier.pending_count() if self.frontier else 0
+        if self.async_crawler:
+            pending += self.async_crawler.queue_depth()
+        return pending
+
+    def record_error(self, message):
+        self.progress['errores'] += 1
+        self.progress['ultimo_error'] = message
+        metrics.inc('indexador_errores_total')
+        logging.error(message)
+
+    def count_page(self, estado, bytes_read=0):
+        self.progress[PROGRESS_KEYS[estado]] += 1
+        metrics.inc('indexador_paginas_total', estado=estado)
+        if bytes_read:
+            metrics.inc('indexador_bytes_descargados_total', bytes_read)
+
+    def conditional_headers(self, url):
+        state = self.url_states.get(url) if self.incremental else None
+        headers = {}
+        if state:
+            if state['etag']:
+                headers['If-None-Match'] = state['etag']
+            if state['last_modified']:
+                headers['If-Modified-Since'] = state['last_modified']
+        return headers
+
+    def is_unchanged(self, url, content_hash):
+        state = self.url_states.get(url)
+        return bool(self.incremental and state and state['content_hash'] == content_hash)
+
+    def record_url_state(self, url, headers, content_hash, changed=None):
+        state = self.url_states.get(url) or {}
+        if changed is None:
+            changed = state.get('content_hash') != content_hash
+        entry = (url, urlparse(url).hostname,
+                 headers.get('ETag') or state.get('etag'),
+                 headers.get('Last-Modified') or state.get('last_modified'),
+                 content_hash or state.get('content_hash'),
+                 changed)
+        with self.states_lock:
+            self.pending_states.append(entry)
+            if changed:
+                self.progress['paginas_cambiadas'] += 1
+            flush = len(self.pending_states) >= 50
+        if flush:
+            self.flush_url_states()
+
+    def flush_url_states(self):
+        with self.states_lock:
+            states, self.pending_states = self.pending_states, []
+        if states:
+            self.db_manager.save_url_states(states)
+
+    def handle_unchanged(self, url, depth, headers, content_hash=None):
+        # La página no ha cambiado: no se procesa ni se guarda de nuevo, pero se siguen
+        # sus enlaces conocidos para alcanzar las páginas que sí puedan haber cambiado
+        logging.info(f"Sin cambios desde el último rastreo: {url}")
+        self.count_page('sin_cambios')
+        self.record_url_state(url, headers, content_hash, changed=False)
+        self.enqueue_urls(self.db_manager.get_links_for_url(url), depth)
+
+    def record_crawl(self):
+        total = self.progress['paginas_procesadas'] + self.progress['paginas_sin_cambios']
+        if not total:
+            return
+        try:
+            record_domain_crawl(self.db_manager, urlparse(self.base_url).hostname, self.base_url,
+                                total, self.progress['paginas_cambiadas'])
+        except Exception as e:
+            logging.error(f"No se pudo registrar el rastreo de {self.base_url}: {e}")
+
+    def scrape_serial(self):
+        while True:
+            if self.is_cancelled():
+                logging.info(f"Scraping cancelado para {self.base_url}")
+                break
+            leased = self.frontier.lease(1)
+            if not leased:
+                if self.frontier.is_exhausted():
+                    break
+                # Otros trabajadores tienen URLs reservadas y aún pueden encolar enlaces
+                time.sleep(Config.FRONTIER_POLL_INTERVAL)
+                continue
+            url, depth = leased[0]
+            logging.info(f"Visitando: {url} (Profundidad: {depth})")
+            try:
+                self.scrape_url(url, depth)
+            finally:
+                self.frontier.complete([url])
+
+    def scrape_url(self, url, depth):
+        start_time = time.time()  # Start time for connection
+        try:
+            with metrics.timer('descarga'):
+                page = self.fetcher.fetch_page(url, headers=self.conditional_headers(url))
+            tiempo_conexion = time.time() - start_time  # Connection time calculation
+            logging.info(f"Tiempo de conexión para {url}: {tiempo_conexion:.2f} segundos")
+
+            if page['status'] == 304:
+                self.handle_unchanged(url, depth, page['headers'])
+            elif page['omitida']:
+                self.record_skip(url, page['omitida'], page['headers'], page['bytes'])
+            elif page['status'] == 200:
+                self.count_page('descargada', page['bytes'])
+                content_hash = page['content_hash']
+                if self.is_unchanged(url, content_hash):
+                    self.handle_unchanged(url, depth, page['headers'], content_hash)
+                    return
+                start_scraping_time = time.time()  # Start time for scraping
+                result, anchors = self.extract_page(url, page['html'], depth, page['url'])
+                result['tiempos']['descarga'] = tiempo_conexion
+                result = self.analyze_result(result)
+                tiempo_scraping = time.time() - start_scraping_time  # Scraping time calculation
+                logging.info(f"Tiempo de scraping para {url}: {tiempo_scraping:.2f} segundos")
+
+                # Update result with times
+                result['tiempo_scraping'] = tiempo_scraping
+                result['tiempo_conexion'] = tiempo_conexion
+
+                # Save data with times
+                self.save_result(result, page['headers'], content_hash)
+
+                self.count_page('procesada')
+                self.emit(result)
+                self.enqueue_urls(anchors, depth)
+            else:
+                self.record_error(f"Error al acceder a la página {url}: Código de estado {page['status']}")
+        except requests.RequestException as e:
+            self.record_error(f"Error al realizar la solicitud HTTP: {str(e)}")
+
+    def record_skip(self, url, reason, headers, bytes_read=0):
+        self.download_stats.record(reason, headers, bytes_read)
+        metrics.inc('indexador_paginas_total', estado='omitida')
+        if bytes_read:
+            metrics.inc('indexador_bytes_descargados_total', bytes_read)
+        if reason == 'abortada':
+            logging.warning(f"Descarga abortada para {url}: supera {Config.FETCH_MAX_BYTES} bytes")
+        else:
+            logging.info(f"Se omite {url} ({reason}): {headers.get('Content-Type')}, "
+                         f"{headers.get('Content-Length') or '?'} bytes")
 
     def process_html(self, url, soup, depth):
-        title_tag = soup.find('title')
-        titulo = title_tag.text.strip() if title_tag else "Sin título"
-        texto_tags = soup.find_all(['p', 'span', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li'])
-        texto = ' '.join(tag.get_text(strip=True) for tag in texto_tags)
-        enlaces = [urljoin(url, a['href']) for a in soup.find_all('a', href=True) if urlparse(urljoin(url, a['href'])).hostname == urlparse(self.base_url).hostname]
-        imagenes = [img['src'] for img in soup.find_all('img', src=True)]
-        scripts = [script['src'] for script in soup.find_all('script', src=True)]
-        estilos = [link['href'] for link in soup.find_all('link', href=True) if 'stylesheet' in link.get('rel', [])]
-        metadatos = {}
-        for meta_tag in soup.find_all('meta'):
-            nombre = meta_tag.get('name')
-            contenido = meta_tag.get('content')
-            if nombre and contenido:
-                metadatos[nombre] = contenido
-
-        nlp_model = get_nlp_model(texto)
-        entidades = []
-        if nlp_model:
-            doc = nlp_model(texto)
-            entidades = [(ent.text, ent.label_) for ent in doc.ents]
-
-        resumen_clasificacion, es_ilicito = self.text_classifier.classify_text_with_chatgpt(texto)
-        clasificacion_tematica = self.determine_theme(resumen_clasificacion)
-
-        result = {
-            'url': url,
-            'titulo': titulo,
-            'texto': texto,
-            'enlaces': enlaces,
-            'imagenes': imagenes,
-            'scripts': scripts,
-            'estilos': estilos,
-            'metadatos': metadatos,
-            'entidades': entidades,
-            'clasificacion': clasificacion_tematica,
-            'resumen': resumen_clasificacion,
-            'es_ilicito': es_ilicito,
-            'profundidad': depth
-        }
-        
+        result = self.extract_html(url, soup, depth)
+        return self.analyze_result(result)
+
+    def extract_html(self, url, soup, depth):
+        result = extract_from_soup(url, soup, self.base_hostname, self.canonical_link)
+        del result['anchors']
+        result['url'] = url
+        result['profundidad'] = depth
         return result
 
+    def extract_page(self, url, html, depth, final_url=None):
+        # Extracción en una sola pasada; devuelve también todos los enlaces absolutos
+        # para encolarlos sin volver a recorrer el documento. Los enlaces relativos se
+        # resuelven contra la URL final de la descarga (tras redirecciones), no contra
+        # la canónica, que solo sirve de clave en la frontera y en la base de datos
+        start_time = time.perf_counter()
+        result = self.extractor.extract(final_url or url, html, self.base_hostname, self.canonical_link)
+        anchors = result.pop('anchors')
+        result['url'] = url
+        result['profundidad'] = depth
+        metrics.record_stage('parseo', time.perf_counter() - start_time, [result])
+        return result, anchors
+
+    def canonical_link(self, url):
+        # Los enlaces guardados usan la misma forma canónica que la frontera y el grafo
+        return self.url_filter.canonicalize(url)[0]
+
+    def analyze_result(self, result):
+        return self.analyze_results([result])[0]
+
+    def analyze_results(self, results):
+        # Etapas costosas (NLP y clasificación), separadas de la extracción para poder
+        # ejecutarlas en otro hilo sin bloquear la descarga de páginas. Varias páginas
+        # se clasifican juntas para agrupar las peticiones cortas al LLM
+        textos = [result['texto'] for result in results]
+        with metrics.timer('idioma', results):
+            idiomas = detect_languages(textos)
+        with metrics.timer('ner', results):
+            entidades = get_entity_extractor().extract(textos, idiomas)
+        for result, entidades_pagina in zip(results, entidades):
+            result['entidades'] = entidades_pagina
+
+        with metrics.timer('clasificacion', results):
+            clasificaciones = self.tiered_classifier.classify_batch(textos)
+        for result, (resumen_clasificacion, es_ilicito, clasificacion_tematica) in zip(results, clasificaciones):
+            result['clasificacion'] = clasificacion_tematica
+            result['resumen'] = resumen_clasificacion
+            result['es_ilicito'] = es_ilicito
+        return results
+
+    def save_result(self, result, headers=None, content_hash=None):
+        # Los validadores y el hash de la URL solo se registran cuando la página está
+        # guardada; si no, los re-rastreos incrementales la darían por vista para siempre
+        if headers is not None:
+            result['estado_http'] = (headers, content_hash)
+        if self.write_buffer:
+            self.write_buffer.add(result)
+            return
+        saved = self.db_manager.save_data(result['url'], result['titulo'], result['texto'], result['enlaces'], result['imagenes'],
+                                          result['scripts'], result['estilos'], result['metadatos'], result['entidades'],
+                                          result['clasificacion'], result['resumen'], result['es_ilicito'],
+                                          result['tiempo_scraping'], result['tiempo_conexion'], result['profundidad'],
+                                          result.get('tiempos'))
+        if saved:
+            self.pages_saved([result])
+
+    def pages_saved(self, pages):
+        for page in pages:
+            estado = page.pop('estado_http', None)
+            if estado:
+                self.record_url_state(page['url'], *estado)
+
     def determine_theme(self, classification_summary):
-        topics = {
-            "Drogas": ["droga", "cocaína", "marihuana", "heroína", "metanfetamina"],
-            "Armas": ["arma", "fusil", "pistola", "munición", "explosivo"],
-            "Finanzas": ["bitcoin", "criptomoneda", "dinero", "btc", "lavado de dinero", "banco"],
-            "Hacking": ["hack", "ciberseguridad", "malware", "ransomware", "ddos", "phishing"],
-            "Falsificacion Documental": ["pasaportes falsos", "identificación", "licencia", "documento falso", "visa", "falsificación de identidad"],
-            "Servicios Ilegales": ["asesinato", "golpe", "fraude", "corrupción"],
-            "Contenido Explicito": ["pornografía", "abuso", "explícito", "infantil"],
-            "Mercado Negro": ["tráfico", "mercado negro", "venta ilegal", "comercio ilícito"],
-            "Contrabando": ["contrabando", "mercancía ilegal", "traficante"],
-            "Fraude": ["fraude", "estafa", "esquema ponzi", "phishing"],
-            "Violencia": ["violencia", "terrorismo", "ataque", "secuestro"],
-            "Extorsion": ["extorsión", "secuestro", "amenaza", "chantaje"],
-            "Falsificacion": ["falsificación", "falso", "imitar", "fraude"]
-        }
-        classification_summary = classification_summary.lower()
-        for theme, keywords in topics.items():
-            if any(keyword in classification_summary for keyword in keywords):
-                return theme
-        return "Indeterminado"
+        if not classification_summary:
+            return "Indeterminado"
+        return get_theme_matcher().first_theme(classification_summary)
 
     def enqueue_links(self, current_url, soup, depth):
-        for link in soup.find_all('a', href=True):
-            absolute_url = urljoin(current_url, link['href'])
-            if absolute_url not in self.visited_urls and self.is_internal_link(absolute_url):
-                logging.info(f"Agregando a la cola: {absolute_url} (Profundidad: {depth + 1})")
-                self.to_visit.append((absolute_url, depth + 1))
+        self.enqueue_urls((urljoin(current_url, link['href']) for link in soup.find_all('a', href=True)), depth)
+
+    def enqueue_urls(self, urls, depth):
+        # Las URLs más profundas que max_depth no llegan a la frontera. El resto se
+        # canonicaliza y se filtra (trampas, presupuestos) antes de que la frontera
+        # descarte las ya vistas
+        if depth + 1 > self.max_depth:
+            return
+        prepared = self.url_filter.prepare(urls, accept=self.is_internal_link)
+        if not prepared:
+            return
+        added = self.frontier.add([(url, depth + 1) for url in prepared])
+        self.url_filter.admit(prepared, added)
+        for url in added:
+            logging.info(f"Agregando a la cola: {url} (Profundidad: {depth + 1})")
 
     def is_internal_link(self, url):
-        return urlparse(url).netloc == urlparse(self.base_url).netloc
+        return urlparse(url).netloc == self.base_netloc
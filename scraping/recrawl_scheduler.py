@@ -0,0 +1,68 @@
+# recrawl_scheduler.py
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from config import Config
+
+
+def compute_next_interval(current, paginas_totales, paginas_cambiadas):
+    # Ajuste adaptativo: los dominios que cambian mucho se revisitan antes y los
+    # estáticos se espacian, siempre dentro de [RECRAWL_MIN_INTERVAL, RECRAWL_MAX_INTERVAL]
+    current = current or Config.RECRAWL_DEFAULT_INTERVAL
+    ratio = paginas_cambiadas / paginas_totales if paginas_totales else 0
+    if ratio >= 0.5:
+        interval = current / 2
+    elif ratio > 0:
+        interval = current * 0.75
+    else:
+        interval = current * 1.5
+    return int(min(max(interval, Config.RECRAWL_MIN_INTERVAL), Config.RECRAWL_MAX_INTERVAL))
+
+
+def record_domain_crawl(db_manager, host, url_inicial, paginas_totales, paginas_cambiadas):
+    domain = db_manager.get_recrawl_domain(host)
+    if domain:
+        interval = compute_next_interval(domain['intervalo'], paginas_totales, paginas_cambiadas)
+    else:
+        interval = Config.RECRAWL_DEFAULT_INTERVAL
+    proximo = datetime.now() + timedelta(seconds=interval)
+    db_manager.save_recrawl_domain(host, url_inicial, interval, proximo, paginas_totales, paginas_cambiadas)
+    logging.info(f"Próximo re-rastreo de {host} en {interval} segundos ({paginas_cambiadas}/{paginas_totales} páginas cambiadas)")
+
+
+class RecrawlScheduler:
+    """Hilo que consulta periódicamente los dominios cuyo re-rastreo ha vencido y
+    los encola como trabajos incrementales de baja prioridad."""
+
+    def __init__(self, job_manager, db_manager, poll_interval=None):
+        self.job_manager = job_manager
+        self.db_manager = db_manager
+        self.poll_interval = poll_interval or Config.RECRAWL_POLL_INTERVAL
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self.run, name='recrawl-scheduler', daemon=True)
+        self.thread.start()
+        logging.info("Planificador de re-rastreos iniciado.")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                self.schedule_due()
+            except Exception as e:
+                logging.error(f"Error en el planificador de re-rastreos: {e}")
+
+    def schedule_due(self):
+        for domain in self.db_manager.get_due_recrawl_domains():
+            # Se aplaza antes de encolar para no duplicar el trabajo mientras se ejecuta;
+            # al terminar, el propio rastreo fija la fecha definitiva
+            self.db_manager.postpone_recrawl_domain(domain['host'], datetime.now() + timedelta(seconds=domain['intervalo']))
+            self.job_manager.submit(domain['url_inicial'], priority=Config.RECRAWL_PRIORITY, incremental=True)
+            logging.info(f"Re-rastreo incremental encolado para {domain['host']}")
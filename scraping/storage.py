@@ -0,0 +1,158 @@
+# storage.py
+import hashlib
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from config import Config
+
+SNIPPET_CHARS = 300
+# Límite en bytes de una columna TEXT de MySQL
+TEXT_MAX_BYTES = 65535
+URL_LOOKUP_BATCH = 1000
+
+
+class IdGenerator:
+    """Ids binarios de 16 bytes ordenados por tiempo, con la disposición de UUIDv7:
+    48 bits de milisegundos desde la época, 12 bits de secuencia y 62 aleatorios.
+    Las inserciones de InnoDB caen al final del índice primario en lugar de
+    repartirse por todo el árbol, como ocurre con uuid4."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_ms = 0
+        self.sequence = 0
+
+    def new_id(self):
+        with self.lock:
+            now_ms = int(time.time() * 1000)
+            if now_ms > self.last_ms:
+                self.last_ms, self.sequence = now_ms, 0
+            else:
+                # Mismo milisegundo (o reloj hacia atrás): la secuencia mantiene el orden
+                self.sequence += 1
+                if self.sequence > 0xFFF:
+                    self.last_ms, self.sequence = self.last_ms + 1, 0
+            return build_id(self.last_ms, self.sequence)
+
+
+def build_id(timestamp_ms, sequence):
+    rand = int.from_bytes(os.urandom(8), 'big') & ((1 << 62) - 1)
+    value = (timestamp_ms << 80) | (0x7 << 76) | (sequence << 64) | (0b10 << 62) | rand
+    return value.to_bytes(16, 'big')
+
+
+def id_from_datetime(value):
+    # Para datos existentes: el id conserva el orden de la fecha de captura
+    return build_id(int(value.timestamp() * 1000), int.from_bytes(os.urandom(2), 'big') & 0xFFF)
+
+
+id_generator = IdGenerator()
+new_id = id_generator.new_id
+
+
+def format_id(value):
+    # Los ids se muestran (JSON, cursores) en hexadecimal
+    return bytes(value).hex() if value is not None else None
+
+
+def parse_id(value):
+    data = bytes.fromhex(value)
+    if len(data) != 16:
+        raise ValueError("Id de página no válido")
+    return data
+
+
+def compress_text(texto):
+    if texto is None:
+        return None
+    return zlib.compress(texto.encode('utf-8'), Config.STORAGE_COMPRESSION_LEVEL)
+
+
+def decompress_text(data):
+    if data is None:
+        return None
+    return zlib.decompress(data).decode('utf-8')
+
+
+def snippet(texto):
+    return (texto or '')[:SNIPPET_CHARS]
+
+
+def search_text(texto):
+    # Prefijo del texto en claro para el índice FULLTEXT, que no puede indexar el
+    # texto comprimido; se recorta también en bytes para que quepa en una columna TEXT
+    texto = (texto or '')[:Config.STORAGE_SEARCH_CHARS]
+    data = texto.encode('utf-8')
+    if len(data) > TEXT_MAX_BYTES:
+        texto = data[:TEXT_MAX_BYTES].decode('utf-8', errors='ignore')
+    return texto
+
+
+def url_hash(url):
+    # 128 bits de SHA-256: clave única de la tabla urls sin indexar la cadena entera
+    return hashlib.sha256(url.encode('utf-8')).digest()[:16]
+
+
+class UrlDictionary:
+    """Resuelve URLs a su id de la tabla urls, insertando las que faltan. Un LRU en
+    memoria evita consultar la base de datos por las URLs ya vistas en el proceso.
+
+    Las inserciones se confirman en su propia transacción, antes que las páginas que
+    las referencian: así un rollback posterior no deja en el LRU ids inexistentes."""
+
+    def __init__(self, memory_size=None):
+        self.memory_size = memory_size or Config.URL_ID_CACHE_SIZE
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+    def cached(self, url):
+        with self.lock:
+            url_id = self.memory.get(url)
+            if url_id is not None:
+                self.memory.move_to_end(url)
+            return url_id
+
+    def remember(self, ids):
+        with self.lock:
+            self.memory.update(ids)
+            while len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+
+    def resolve(self, connection, urls):
+        ids, missing = {}, {}
+        for url in set(urls):
+            url_id = self.cached(url)
+            if url_id is None:
+                missing[url_hash(url)] = url
+            else:
+                ids[url] = url_id
+        if not missing:
+            return ids
+        found = {}
+        with connection.cursor() as cursor:
+            self.lookup(cursor, missing, found)
+            new = sorted((key, url) for key, url in missing.items() if url not in found)
+            if new:
+                # Orden fijo de claves para que dos escritores no se bloqueen mutuamente
+                cursor.executemany("INSERT IGNORE INTO urls (url_hash, url) VALUES (%s, %s)", new)
+                self.lookup(cursor, dict(new), found)
+        connection.commit()
+        self.remember(found)
+        ids.update(found)
+        return ids
+
+    @staticmethod
+    def lookup(cursor, by_hash, found):
+        keys = list(by_hash)
+        for start in range(0, len(keys), URL_LOOKUP_BATCH):
+            batch = keys[start:start + URL_LOOKUP_BATCH]
+            cursor.execute(f"SELECT id, url_hash FROM urls WHERE url_hash IN ({', '.join(['%s'] * len(batch))})", batch)
+            for url_id, key in cursor.fetchall():
+                found[by_hash[bytes(key)]] = url_id
+
+
+# Compartido por todas las conexiones del proceso
+url_dictionary = UrlDictionary()
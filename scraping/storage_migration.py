@@ -0,0 +1,218 @@
+# storage_migration.py
+# Paso al almacenamiento compacto (migración 10) fuera de la aplicación, con
+# progreso por lotes, e informe del espacio en disco antes y después:
+#
+#   python -m scraping.storage_migration [--batch-size 1000]   aplica las migraciones y copia los datos
+#   python -m scraping.storage_migration --report              tamaño de las tablas nuevas frente a las _v1
+#   python -m scraping.storage_migration --drop-legacy         borra las tablas _v1 si la copia está completa
+#
+# La migración 10 solo renombra y crea tablas; la aplicación no copia los datos de
+# las tablas _v1, hay que ejecutar este paso. La copia se reanuda donde se quedó y
+# puede hacerse con la aplicación en marcha.
+import argparse
+import logging
+import sys
+
+import mysql.connector
+
+from config import Config
+from .migrations import (run_migrations, drop_legacy_tables, table_exists, rebuild_rollups, legacy_copy_pending,
+                         LEGACY_TABLES, LEGACY_SUFFIX)
+from .storage import id_from_datetime, compress_text, snippet, search_text, url_dictionary
+from .urls import normalize_host
+
+COMPACT_TABLES = LEGACY_TABLES + ('urls',)
+
+
+def connect():
+    return mysql.connector.connect(host=Config.DB_HOST, user=Config.DB_USER, password=Config.DB_PASSWORD,
+                                   database=Config.DB_NAME, use_pure=Config.DB_USE_PURE)
+
+
+def fetch_children(cursor, table, columns, old_ids):
+    # Filas hijas de un lote de páginas antiguas, agrupadas por página
+    children = {}
+    if not table_exists(cursor, table):
+        return children
+    placeholders = ', '.join(['%s'] * len(old_ids))
+    cursor.execute(f"SELECT datos_completos_id, {columns} FROM {table} WHERE datos_completos_id IN ({placeholders})",
+                   list(old_ids))
+    for row in cursor.fetchall():
+        children.setdefault(row[0], []).append(row[1:])
+    return children
+
+
+def copy_legacy_pages(connection, cursor, batch_size=None):
+    """Copia las páginas de las tablas _v1 al formato compacto, por lotes en orden
+    (fecha_captura, id). El id nuevo se deriva de la fecha de captura, las URLs se
+    resuelven en la tabla urls y el texto se comprime. El avance se guarda en
+    migracion_almacenamiento en la misma transacción que cada lote, así la copia se
+    puede interrumpir y reanudar, y dos procesos no copian el mismo lote."""
+    source = 'datos_completos' + LEGACY_SUFFIX
+    if not table_exists(cursor, source):
+        return
+    batch_size = batch_size or Config.STORAGE_MIGRATION_BATCH
+    while True:
+        cursor.execute("SELECT fecha, antiguo_id, filas FROM migracion_almacenamiento WHERE tabla = 'datos_completos'")
+        fecha, last_id, total = cursor.fetchone()
+        if last_id is None:
+            cursor.execute(f"""
+                SELECT id, url, host, titulo, texto, fecha_captura, clasificacion_tematica, resumen, es_ilicito,
+                       tiempo_scraping, tiempo_conexion, profundidad
+                FROM {source} ORDER BY fecha_captura, id LIMIT %s
+            """, (batch_size,))
+        else:
+            cursor.execute(f"""
+                SELECT id, url, host, titulo, texto, fecha_captura, clasificacion_tematica, resumen, es_ilicito,
+                       tiempo_scraping, tiempo_conexion, profundidad
+                FROM {source}
+                WHERE fecha_captura > %s OR (fecha_captura = %s AND id > %s)
+                ORDER BY fecha_captura, id LIMIT %s
+            """, (fecha, fecha, last_id, batch_size))
+        pages = cursor.fetchall()
+        if not pages:
+            break
+        old_ids = [page[0] for page in pages]
+        enlaces = fetch_children(cursor, 'enlaces' + LEGACY_SUFFIX, 'enlace', old_ids)
+        imagenes = fetch_children(cursor, 'imagenes' + LEGACY_SUFFIX, 'imagen', old_ids)
+        metadatos = fetch_children(cursor, 'metadatos' + LEGACY_SUFFIX, 'nombre, contenido', old_ids)
+        entidades = fetch_children(cursor, 'entidades' + LEGACY_SUFFIX, 'entidad, tipo', old_ids)
+        tiempos = fetch_children(cursor, 'tiempos_pagina' + LEGACY_SUFFIX, 'descarga, parseo, idioma, ner, clasificacion',
+                                 old_ids)
+        # Los enlaces sin URL (NULL en las tablas antiguas) no se pueden referenciar en urls
+        vacios = sum(1 for links in enlaces.values() for (enlace,) in links if enlace is None)
+        if vacios:
+            logging.warning(f"Se omiten {vacios} enlaces sin URL de las tablas _v1")
+        enlaces = {old_id: [enlace for (enlace,) in links if enlace is not None] for old_id, links in enlaces.items()}
+        url_ids = url_dictionary.resolve(connection, [page[1] for page in pages] +
+                                         [enlace for links in enlaces.values() for enlace in links])
+
+        # Si otro proceso ha copiado este lote mientras tanto, se vuelve a leer el avance
+        cursor.execute("SELECT antiguo_id FROM migracion_almacenamiento WHERE tabla = 'datos_completos' FOR UPDATE")
+        if cursor.fetchone()[0] != last_id:
+            connection.rollback()
+            continue
+        datos, rows = [], {'enlaces': [], 'imagenes': [], 'metadatos': [], 'entidades': [], 'tiempos': []}
+        for (old_id, url, host, titulo, texto, fecha_captura, tematica, resumen, es_ilicito,
+             tiempo_scraping, tiempo_conexion, profundidad) in pages:
+            page_id = id_from_datetime(fecha_captura)
+            datos.append((page_id, url_ids[url], host if host is not None else normalize_host(url), titulo, snippet(texto),
+                          compress_text(texto), search_text(texto), fecha_captura, tematica, resumen, es_ilicito,
+                          tiempo_scraping, tiempo_conexion, profundidad))
+            rows['enlaces'].extend((page_id, orden, url_ids[enlace]) for orden, enlace in enumerate(enlaces.get(old_id, [])))
+            rows['imagenes'].extend((page_id, orden, *row) for orden, row in enumerate(imagenes.get(old_id, [])))
+            rows['metadatos'].extend((page_id, orden, *row) for orden, row in enumerate(metadatos.get(old_id, [])))
+            rows['entidades'].extend((page_id, orden, *row) for orden, row in enumerate(entidades.get(old_id, [])))
+            rows['tiempos'].extend((page_id, *row) for row in tiempos.get(old_id, [])[:1])
+        cursor.executemany("""
+            INSERT INTO datos_completos (id, url_id, host, titulo, fragmento, texto_comprimido, texto_busqueda, fecha_captura,
+                                         clasificacion_tematica, resumen, es_ilicito, tiempo_scraping, tiempo_conexion, profundidad)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, datos)
+        for table, statement in (
+                ('enlaces', "INSERT INTO enlaces (datos_completos_id, orden, url_id) VALUES (%s, %s, %s)"),
+                ('imagenes', "INSERT INTO imagenes (datos_completos_id, orden, imagen) VALUES (%s, %s, %s)"),
+                ('metadatos', "INSERT INTO metadatos (datos_completos_id, orden, nombre, contenido) VALUES (%s, %s, %s, %s)"),
+                ('entidades', "INSERT INTO entidades (datos_completos_id, orden, entidad, tipo) VALUES (%s, %s, %s, %s)"),
+                ('tiempos', "INSERT INTO tiempos_pagina (datos_completos_id, descarga, parseo, idioma, ner, clasificacion) "
+                            "VALUES (%s, %s, %s, %s, %s, %s)")):
+            if rows[table]:
+                cursor.executemany(statement, rows[table])
+        last = pages[-1]
+        cursor.execute("""
+            UPDATE migracion_almacenamiento SET fecha = %s, antiguo_id = %s, filas = filas + %s
+            WHERE tabla = 'datos_completos'
+        """, (last[5], last[0], len(pages)))
+        connection.commit()
+        logging.info(f"Copiadas {total + len(pages)} páginas al formato compacto")
+
+    # Los agregados se cargaron de las tablas antiguas y desde entonces suman las
+    # páginas nuevas; al terminar se recalculan sobre las tablas compactas
+    rebuild_rollups(cursor)
+    connection.commit()
+    logging.info("Copia terminada y agregados recalculados; las tablas _v1 se pueden borrar con "
+                 "python -m scraping.storage_migration --drop-legacy")
+
+
+def table_sizes(cursor, tables, analyze=True):
+    # {tabla: (filas, bytes de datos, bytes de índices)} según information_schema;
+    # ANALYZE TABLE actualiza las estimaciones antes de leerlas
+    tables = [table for table in tables if table_exists(cursor, table)]
+    if not tables:
+        return {}
+    if analyze:
+        for table in tables:
+            cursor.execute(f"ANALYZE TABLE {table}")
+            cursor.fetchall()
+    try:
+        # MySQL 8 guarda en caché las estadísticas de information_schema
+        cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+    except mysql.connector.Error:
+        pass
+    placeholders = ', '.join(['%s'] * len(tables))
+    cursor.execute(f"""
+        SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})
+    """, tables)
+    return {name: (rows or 0, data or 0, index or 0) for name, rows, data, index in cursor.fetchall()}
+
+
+def format_mb(value):
+    return f"{value / 2 ** 20:10.1f}"
+
+
+def print_report(cursor, analyze=True):
+    compact = table_sizes(cursor, COMPACT_TABLES, analyze)
+    legacy = table_sizes(cursor, [table + LEGACY_SUFFIX for table in LEGACY_TABLES], analyze)
+    print(f"{'tabla':<18}{'filas':>12}{'datos MiB':>11}{'índices MiB':>13}{'_v1 MiB':>11}{'ahorro':>9}")
+    totals = [0, 0]
+    for table in COMPACT_TABLES:
+        rows, data, index = compact.get(table, (0, 0, 0))
+        previous = sum(legacy.get(table + LEGACY_SUFFIX, (0, 0, 0))[1:])
+        totals[0] += data + index
+        totals[1] += previous
+        saving = f"{(1 - (data + index) / previous) * 100:8.1f}%" if previous else f"{'':>9}"
+        print(f"{table:<18}{rows:>12}{format_mb(data)} {format_mb(index)}  {format_mb(previous)}{saving}")
+    if totals[1]:
+        print(f"Total: {totals[0] / 2 ** 20:.1f} MiB frente a {totals[1] / 2 ** 20:.1f} MiB "
+              f"({(1 - totals[0] / totals[1]) * 100:.1f}% menos)")
+
+
+def copy_complete(cursor):
+    return not legacy_copy_pending(cursor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migración al almacenamiento compacto")
+    parser.add_argument('--batch-size', type=int, default=Config.STORAGE_MIGRATION_BATCH)
+    parser.add_argument('--report', action='store_true', help='solo muestra el tamaño de las tablas')
+    parser.add_argument('--no-analyze', action='store_true', help='no ejecuta ANALYZE TABLE antes del informe')
+    parser.add_argument('--drop-legacy', action='store_true', help='borra las tablas _v1 tras comprobar la copia')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    connection = connect()
+    try:
+        with connection.cursor() as cursor:
+            if args.report:
+                print_report(cursor, not args.no_analyze)
+            elif args.drop_legacy:
+                if not table_exists(cursor, 'datos_completos' + LEGACY_SUFFIX):
+                    print("No hay tablas _v1 que borrar.")
+                elif not copy_complete(cursor):
+                    print("La copia no ha terminado: ejecuta antes la migración.", file=sys.stderr)
+                    return 1
+                else:
+                    drop_legacy_tables(cursor)
+                    print("Tablas _v1 borradas.")
+            else:
+                run_migrations(connection)
+                copy_legacy_pages(connection, cursor, args.batch_size)
+                print_report(cursor, not args.no_analyze)
+    finally:
+        connection.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,19 +3,99 @@ import requests
 import json
 import os
 import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from config import Config
+
+OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+
+PROMPT = "Clasifica este texto como ilícito si incumple las normas o leyes españolas en vigor. Si no puedes clasificarlo como ilícito, entonces clasifícalo como lícito. , añade el porqué de la clasificacion y un resumen del texto: {texto}"
+
+BATCH_PROMPT = ("Clasifica cada uno de los siguientes textos como ilícito si incumple las normas o leyes españolas en vigor. "
+                "Si no puedes clasificarlo como ilícito, entonces clasifícalo como lícito. Para cada texto añade el porqué "
+                "de la clasificacion y un resumen del texto. Responde únicamente con un array JSON que contenga un objeto "
+                "por texto con las claves \"id\" (el número del texto) y \"respuesta\" (la clasificación y el resumen).\n\n{textos}")
+
+
+def estimate_tokens(texto):
+    # Aproximación habitual de ~4 caracteres por token, suficiente para presupuestar
+    return len(texto) // 4 + 1
+
+
+def truncate_to_budget(texto, max_tokens):
+    max_chars = max_tokens * 4
+    if len(texto) <= max_chars:
+        return texto
+    # Se conserva el principio y el final de la página, donde suele estar lo relevante
+    head = max_chars * 3 // 4
+    tail = max_chars - head
+    return texto[:head] + " [...] " + texto[-tail:]
+
+
+class RateLimiter:
+    """Cubo de fichas doble: peticiones por minuto y tokens por minuto."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.request_capacity = requests_per_minute
+        self.token_capacity = tokens_per_minute
+        self.request_allowance = float(requests_per_minute)
+        self.token_allowance = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.request_allowance = min(self.request_capacity, self.request_allowance + elapsed * self.request_capacity / 60)
+        self.token_allowance = min(self.token_capacity, self.token_allowance + elapsed * self.token_capacity / 60)
+
+    def acquire(self, tokens):
+        tokens = min(tokens, self.token_capacity)
+        while True:
+            with self.lock:
+                self.refill()
+                if self.request_allowance >= 1 and self.token_allowance >= tokens:
+                    self.request_allowance -= 1
+                    self.token_allowance -= tokens
+                    return
+                wait = max((1 - self.request_allowance) * 60 / self.request_capacity,
+                           (tokens - self.token_allowance) * 60 / self.token_capacity)
+            time.sleep(max(wait, 0.01))
+
+
+@lru_cache(maxsize=1)
+def get_rate_limiter():
+    # Los límites son por clave de API, así que se comparten entre todos los clasificadores
+    return RateLimiter(Config.LLM_REQUESTS_PER_MINUTE, Config.LLM_TOKENS_PER_MINUTE)
+
 
 class TextClassifier:
-    def __init__(self):
+    # Cambiar al modificar PROMPT o BATCH_PROMPT para invalidar en la caché de
+    # clasificaciones las respuestas obtenidas con ese prompt
+    PROMPT_VERSION = "1"
+    BATCH_PROMPT_VERSION = "1"
+
+    def __init__(self, cache=None, url=None, model=None, rate_limiter=None):
         logging.info("Inicializando el clasificador de texto.")
+        self.url = url or Config.LLM_API_URL
+        self.model = model or Config.LLM_MODEL
         self.api_key = os.getenv('OPENAI_API_KEY')
-        if not self.api_key:
+        if not self.api_key and self.url == OPENAI_URL:
             logging.error("La clave de la API no está configurada en las variables de entorno.")
             raise ValueError("La clave de la API no está configurada en las variables de entorno.")
-        self.url = "https://api.openai.com/v1/chat/completions"
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
+        # Sesión reutilizada: mantiene viva la conexión TLS entre peticiones
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.cache = cache
+        self.rate_limiter = rate_limiter or get_rate_limiter()
         logging.info("Clasificador de texto inicializado.")
 
     def classify_text_response(self, texto_respuesta):
@@ -36,28 +116,133 @@ class TextClassifier:
         logging.debug("No se encontraron indicadores ilícitos. Clasificado como lícito por defecto.")
         return False
 
-    def classify_text_with_chatgpt(self, texto):
-        logging.info(f"Enviando texto a la API de OpenAI: {texto}")
+    def cache_key(self, texto, batch=False):
+        # Las respuestas de cada prompt se guardan con su propia clave
+        version = f"lote-{self.BATCH_PROMPT_VERSION}" if batch else self.PROMPT_VERSION
+        return self.cache.make_key(texto, self.model, version) if self.cache else None
+
+    def cached_classification(self, texto):
+        # Vale la respuesta de cualquiera de los dos prompts; primero la individual
+        if not self.cache:
+            return None
+        return self.cache.get_any([self.cache_key(texto), self.cache_key(texto, batch=True)])
+
+    def request_completion(self, contenido):
         datos = {
-            "model": "gpt-3.5-turbo",
-            "messages": [{"role": "user", "content": f"Clasifica este texto como ilícito si incumple las normas o leyes españolas en vigor. Si no puedes clasificarlo como ilícito, entonces clasifícalo como lícito. , añade el porqué de la clasificacion y un resumen del texto: {texto}"}],
+            "model": self.model,
+            "messages": [{"role": "user", "content": contenido}],
             "temperature": 0.7
         }
+        tokens = estimate_tokens(contenido) + Config.LLM_MAX_OUTPUT_TOKENS
+        for intento in range(Config.LLM_MAX_RETRIES + 1):
+            self.rate_limiter.acquire(tokens)
+            try:
+                respuesta = self.session.post(self.url, data=json.dumps(datos), timeout=Config.LLM_TIMEOUT)
+                if respuesta.status_code == 429 or respuesta.status_code >= 500:
+                    raise requests.HTTPError(f"Código de estado {respuesta.status_code}", response=respuesta)
+                respuesta.raise_for_status()
+                return respuesta.json()['choices'][0]['message']['content'].strip()
+            except requests.RequestException as e:
+                response = getattr(e, 'response', None)
+                retryable = response is None or response.status_code == 429 or response.status_code >= 500
+                if not retryable or intento == Config.LLM_MAX_RETRIES:
+                    raise
+                retry_after = response.headers.get('Retry-After') if response is not None else None
+                espera = float(retry_after) if retry_after and retry_after.isdigit() else \
+                    Config.LLM_BACKOFF_BASE * (2 ** intento) + random.uniform(0, Config.LLM_BACKOFF_BASE)
+                logging.warning(f"Error transitorio de la API ({e}); reintento {intento + 1} en {espera:.1f} s")
+                time.sleep(espera)
+
+    def classify_text_with_chatgpt(self, texto):
+        cached = self.cached_classification(texto)
+        if cached:
+            logging.info("Clasificación obtenida de la caché.")
+            return cached
+
+        return self.request_classification(texto, self.cache_key(texto))
+
+    def request_classification(self, texto, cache_key=None):
+        texto_prompt = truncate_to_budget(texto, Config.LLM_MAX_INPUT_TOKENS)
+        logging.info(f"Enviando texto a la API de OpenAI: {texto_prompt}")
         try:
-            respuesta = requests.post(self.url, headers=self.headers, data=json.dumps(datos))
-            respuesta.raise_for_status()
+            texto_respuesta = self.request_completion(PROMPT.format(texto=texto_prompt))
             logging.info("Respuesta recibida exitosamente de la API de OpenAI.")
-        except requests.RequestException as e:
+        except (requests.RequestException, KeyError, IndexError, ValueError) as e:
             logging.error(f"Error al conectar con la API de OpenAI: {str(e)}")
             return None, None
 
-        texto_respuesta = respuesta.json()['choices'][0]['message']['content'].strip()
         logging.debug(f"Respuesta de la API: {texto_respuesta}")
         es_ilicito = self.classify_text_response(texto_respuesta)
         logging.info(f"El texto ha sido clasificado como {'ilícito' if es_ilicito else 'lícito'}.")
 
+        if cache_key:
+            self.cache.set(cache_key, texto_respuesta, es_ilicito)
         return texto_respuesta, es_ilicito
 
+    def classify_batch(self, textos):
+        """Clasifica varios textos: consulta la caché, agrupa los textos cortos en una
+        sola petición hasta ``LLM_BATCH_TOKEN_BUDGET`` y lanza las peticiones en
+        paralelo respetando el límite de ritmo compartido."""
+        resultados = [None] * len(textos)
+        pendientes = []
+        for indice, texto in enumerate(textos):
+            cached = self.cached_classification(texto)
+            if cached:
+                resultados[indice] = cached
+            else:
+                pendientes.append(indice)
+
+        grupos = []
+        grupo, tokens_grupo = [], 0
+        for indice in pendientes:
+            tokens = estimate_tokens(textos[indice])
+            if tokens > Config.LLM_SHORT_PAGE_TOKENS:
+                grupos.append([indice])
+                continue
+            if grupo and (len(grupo) >= Config.LLM_BATCH_MAX_PAGES or tokens_grupo + tokens > Config.LLM_BATCH_TOKEN_BUDGET):
+                grupos.append(grupo)
+                grupo, tokens_grupo = [], 0
+            grupo.append(indice)
+            tokens_grupo += tokens
+        if grupo:
+            grupos.append(grupo)
+
+        def procesar(grupo):
+            if len(grupo) == 1:
+                return {grupo[0]: self.request_classification(textos[grupo[0]], self.cache_key(textos[grupo[0]]))}
+            return self.classify_group(grupo, textos)
+
+        if grupos:
+            with ThreadPoolExecutor(max_workers=min(Config.LLM_CONCURRENCY, len(grupos))) as executor:
+                for parcial in executor.map(procesar, grupos):
+                    for indice, resultado in parcial.items():
+                        resultados[indice] = resultado
+        return resultados
+
+    def classify_group(self, grupo, textos):
+        secciones = "\n\n".join(f"[TEXTO {numero}]\n{textos[indice]}" for numero, indice in enumerate(grupo, 1))
+        try:
+            contenido = self.request_completion(BATCH_PROMPT.format(textos=secciones))
+            inicio, fin = contenido.index('['), contenido.rindex(']') + 1
+            respuestas = {int(item['id']): str(item['respuesta']).strip() for item in json.loads(contenido[inicio:fin])}
+        except (requests.RequestException, KeyError, IndexError, ValueError, TypeError) as e:
+            logging.warning(f"No se pudo clasificar el lote de {len(grupo)} textos ({e}); se clasifican por separado.")
+            return {indice: self.request_classification(textos[indice], self.cache_key(textos[indice])) for indice in grupo}
+
+        resultados = {}
+        for numero, indice in enumerate(grupo, 1):
+            texto_respuesta = respuestas.get(numero)
+            if not texto_respuesta:
+                resultados[indice] = self.request_classification(textos[indice], self.cache_key(textos[indice]))
+                continue
+            es_ilicito = self.classify_text_response(texto_respuesta)
+            cache_key = self.cache_key(textos[indice], batch=True)
+            if cache_key:
+                self.cache.set(cache_key, texto_respuesta, es_ilicito)
+            resultados[indice] = (texto_respuesta, es_ilicito)
+        logging.info(f"Lote de {len(grupo)} textos clasificado en una sola petición.")
+        return resultados
+
 # Configuración de logging
 logging.basicConfig(level=logging.DEBUG)
 
@@ -0,0 +1,89 @@
+# tiered_classifier.py
+import logging
+import threading
+
+from config import Config
+from .keyword_matcher import get_theme_matcher, INDETERMINADO
+
+
+class TierStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {'local': 0, 'llm': 0, 'shadow_coincide': 0, 'shadow_discrepa': 0}
+
+    def record(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.counters)
+        decided = stats['local'] + stats['llm']
+        stats['porcentaje_local'] = stats['local'] / decided if decided else 0.0
+        shadow = stats['shadow_coincide'] + stats['shadow_discrepa']
+        stats['precision_shadow'] = stats['shadow_coincide'] / shadow if shadow else 0.0
+        return stats
+
+
+# Contadores compartidos por todos los scrapers del proceso
+tier_stats = TierStats()
+
+
+class TieredClassifier:
+    """Clasificación en dos niveles: el emparejador local de palabras clave sobre el
+    texto bruto y el LLM (o su caché).
+
+    En modo ``tiered`` una decisión local clara fija la temática y no se llama al
+    LLM: si la caché ya tiene su respuesta se usan ese resumen y ese veredicto; si no,
+    el resumen indica la temática local y ``es_ilicito`` queda en None (sin evaluar),
+    porque que una página hable mucho de malware o de bitcoin no la hace ilícita.
+    En modo ``shadow`` todas las páginas van al LLM, la temática sale de su resumen y
+    solo se anota si la decisión local habría coincidido, para validar los umbrales
+    antes de activar ``tiered``.
+    """
+
+    def __init__(self, text_classifier, matcher=None, mode=None):
+        self.text_classifier = text_classifier
+        self.matcher = matcher or get_theme_matcher()
+        self.mode = mode or Config.CLASSIFIER_TIER_MODE
+
+    def classify(self, texto):
+        return self.classify_batch([texto])[0]
+
+    def classify_batch(self, textos):
+        decisions = [self.matcher.decide(texto) if self.mode != 'llm' else None for texto in textos]
+        results = [None] * len(textos)
+        pendientes = []
+        for indice, decision in enumerate(decisions):
+            if self.mode == 'tiered' and decision.confident:
+                results[indice] = self.classify_locally(textos[indice], decision)
+            else:
+                pendientes.append(indice)
+
+        if len(pendientes) == 1:
+            responses = [self.text_classifier.classify_text_with_chatgpt(textos[pendientes[0]])]
+        else:
+            responses = self.text_classifier.classify_batch([textos[indice] for indice in pendientes]) if pendientes else []
+        for indice, (resumen, es_ilicito) in zip(pendientes, responses):
+            decision = decisions[indice]
+            tier_stats.record('llm')
+            if resumen is not None:
+                theme = self.matcher.first_theme(resumen)
+            else:
+                theme = decision.theme if decision else INDETERMINADO
+            if self.mode == 'shadow' and decision.confident:
+                tier_stats.record('shadow_coincide' if decision.theme == theme else 'shadow_discrepa')
+            results[indice] = (resumen, es_ilicito, theme)
+        return results
+
+    def classify_locally(self, texto, decision):
+        # Sin petición al LLM: solo se reutiliza su respuesta si ya estaba en la caché
+        tier_stats.record('local')
+        hits = decision.scores[decision.theme]
+        logging.info(f"Temática local: {decision.theme} ({hits} coincidencias); se omite el LLM")
+        cached = self.text_classifier.cached_classification(texto)
+        if cached:
+            return cached[0], cached[1], decision.theme
+        resumen = (f"Clasificación local por palabras clave: {decision.theme} ({hits} coincidencias). "
+                   f"Legalidad no evaluada.")
+        return resumen, None, decision.theme
@@ -0,0 +1,194 @@
+# urls.py
+import re
+import threading
+from urllib.parse import urlparse, urlsplit, urlunsplit, parse_qsl, urlencode
+
+from config import Config
+
+
+def normalize_host(url):
+    # Host en minúsculas, sin puerto, credenciales ni punto final; admite también
+    # un dominio sin esquema ("abc.onion" o "abc.onion/ruta")
+    if not url:
+        return None
+    url = url.strip()
+    if '://' not in url:
+        url = 'http://' + url
+    try:
+        hostname = urlparse(url).hostname
+    except ValueError:
+        return None
+    if not hostname:
+        return None
+    return hostname.rstrip('.') or None
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+PERCENT_ESCAPE = re.compile(r'%[0-9a-fA-F]{2}')
+DIGITS = re.compile(r'\d+')
+
+
+def parse_param_list(value):
+    return [item.strip().lower() for item in value.split(',') if item.strip()]
+
+
+def is_stripped_param(name, patterns):
+    # Admite nombres exactos y prefijos con asterisco ("utm_*")
+    name = name.lower()
+    return any(name.startswith(pattern[:-1]) if pattern.endswith('*') else name == pattern for pattern in patterns)
+
+
+def canonicalize_url(url, strip_params=None, strip_trailing_slash=None):
+    """Forma canónica de una URL y lista de reglas que la cambiaron.
+
+    Esquema y host en minúsculas, sin puerto por defecto ni fragmento, sin parámetros
+    de sesión o seguimiento, parámetros ordenados, escapes en mayúsculas y, de forma
+    opcional, sin barra final.
+    """
+    if strip_params is None:
+        strip_params = parse_param_list(Config.URL_STRIP_PARAMS)
+    if strip_trailing_slash is None:
+        strip_trailing_slash = Config.URL_STRIP_TRAILING_SLASH
+    rules = []
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url, rules
+    scheme = parts.scheme.lower()
+    hostname = (parts.hostname or '').rstrip('.')
+    netloc = hostname
+    if parts.username or parts.password:
+        netloc = parts.netloc.rsplit('@', 1)[0] + '@' + hostname
+    if port is not None:
+        if DEFAULT_PORTS.get(scheme) == port:
+            rules.append('puerto')
+        else:
+            netloc += f':{port}'
+    if parts.fragment or url.endswith('#'):
+        rules.append('fragmento')
+
+    path = parts.path or '/'
+    if ';' in path:
+        # Identificadores de sesión en la ruta: /pagina;jsessionid=...
+        segments = []
+        for segment in path.split('/'):
+            name, _, params = segment.partition(';')
+            if params and is_stripped_param(params.split('=', 1)[0], strip_params):
+                segment = name
+                rules.append('parametros')
+            segments.append(segment)
+        path = '/'.join(segments)
+    path = PERCENT_ESCAPE.sub(lambda match: match.group(0).upper(), path)
+    if strip_trailing_slash and len(path) > 1 and path.endswith('/'):
+        path = path.rstrip('/') or '/'
+        rules.append('barra_final')
+
+    query = parts.query
+    if query:
+        params = parse_qsl(query, keep_blank_values=True)
+        kept = [(name, value) for name, value in params if not is_stripped_param(name, strip_params)]
+        if len(kept) != len(params):
+            rules.append('parametros')
+        ordered = sorted(kept)
+        if ordered != kept:
+            rules.append('orden_query')
+        if ordered != params:
+            # Solo se recodifica la query si ha cambiado
+            query = urlencode(ordered)
+
+    if parts.scheme != scheme or any(char.isupper() for char in parts.netloc):
+        rules.append('mayusculas')
+    return urlunsplit((scheme, netloc, path, query, '')), rules
+
+
+def path_pattern(url):
+    # Patrón de la URL para los presupuestos: números sustituidos y solo los nombres
+    # de los parámetros (/calendario/2024/05?dia=3 -> /calendario/#/#?dia)
+    parts = urlsplit(url)
+    pattern = DIGITS.sub('#', parts.path)
+    if parts.query:
+        pattern += '?' + '&'.join(sorted({name for name, _ in parse_qsl(parts.query, keep_blank_values=True)}))
+    return pattern
+
+
+class UrlFilter:
+    """Canonicaliza las URLs antes de encolarlas y descarta las que parecen trampas
+    (rutas demasiado largas o repetitivas, patrones que superan su presupuesto).
+
+    ``stats`` cuenta cuántas descargas ahorra cada regla: las reglas de
+    canonicalización se anotan cuando la URL reescrita ya estaba en la frontera.
+    """
+
+    def __init__(self, max_url_length=None, max_segments=None, max_repeated_segment=None, pattern_budget=None):
+        self.strip_params = parse_param_list(Config.URL_STRIP_PARAMS)
+        self.max_url_length = max_url_length or Config.CRAWL_MAX_URL_LENGTH
+        self.max_segments = max_segments or Config.CRAWL_MAX_PATH_SEGMENTS
+        self.max_repeated_segment = max_repeated_segment or Config.CRAWL_MAX_REPEATED_SEGMENT
+        self.pattern_budget = Config.CRAWL_PATTERN_BUDGET if pattern_budget is None else pattern_budget
+        self.pattern_counts = {}
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def count(self, rule, amount=1):
+        self.stats[rule] = self.stats.get(rule, 0) + amount
+
+    def canonicalize(self, url):
+        return canonicalize_url(url, self.strip_params)
+
+    def trap_rule(self, url):
+        if len(url) > self.max_url_length:
+            return 'longitud'
+        segments = [segment for segment in urlsplit(url).path.split('/') if segment]
+        if len(segments) > self.max_segments:
+            return 'profundidad_ruta'
+        repeated = {}
+        for segment in segments:
+            repeated[segment] = repeated.get(segment, 0) + 1
+            if repeated[segment] > self.max_repeated_segment:
+                return 'segmentos_repetidos'
+        return None
+
+    def prepare(self, urls, accept=None):
+        # Devuelve las URLs canónicas que pueden encolarse (sin trampas, sin repetir
+        # dentro del lote y dentro del presupuesto de su patrón) con las reglas de
+        # canonicalización aplicadas a cada una
+        prepared = {}
+        batch_patterns = {}
+        with self.lock:
+            for url in urls:
+                canonical, rules = self.canonicalize(url)
+                if accept and not accept(canonical):
+                    continue
+                rule = self.trap_rule(canonical)
+                if rule:
+                    self.count(rule)
+                    continue
+                if canonical in prepared:
+                    self.credit(rules or ['duplicadas'])
+                    continue
+                if self.pattern_budget:
+                    pattern = path_pattern(canonical)
+                    used = self.pattern_counts.get(pattern, 0) + batch_patterns.get(pattern, 0)
+                    if used >= self.pattern_budget:
+                        self.count('presupuesto_patron')
+                        continue
+                    batch_patterns[pattern] = batch_patterns.get(pattern, 0) + 1
+                prepared[canonical] = rules
+        return prepared
+
+    def credit(self, rules):
+        for rule in set(rules):
+            self.count(rule)
+
+    def admit(self, prepared, added):
+        # Tras pasar por la frontera: las rechazadas por estar ya vistas se atribuyen a
+        # sus reglas de canonicalización y las nuevas consumen el presupuesto de su patrón
+        added = set(added)
+        with self.lock:
+            for canonical, rules in prepared.items():
+                if canonical not in added:
+                    self.credit(rules or ['duplicadas'])
+                elif self.pattern_budget:
+                    pattern = path_pattern(canonical)
+                    self.pattern_counts[pattern] = self.pattern_counts.get(pattern, 0) + 1
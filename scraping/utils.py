@@ -1,18 +1,173 @@
-import spacy
-from langdetect import detect, DetectorFactory
 import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from langdetect import detect, DetectorFactory
+
+from config import Config
 
-nlp = spacy.load('en_core_web_sm')
 DetectorFactory.seed = 0
 
-def get_nlp_model(text):
+# Componentes que no intervienen en el reconocimiento de entidades
+DISABLED_PIPES = ['parser', 'tagger', 'attribute_ruler', 'lemmatizer', 'morphologizer', 'senter']
+
+
+def parse_model_map(value):
+    # "en:en_core_web_sm,es:es_core_news_sm" -> {'en': 'en_core_web_sm', 'es': 'es_core_news_sm'}
+    models = {}
+    for item in value.split(','):
+        if ':' in item:
+            lang, name = item.split(':', 1)
+            models[lang.strip()] = name.strip()
+    return models
+
+
+MODELS = parse_model_map(Config.NLP_MODELS)
+
+
+_model_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def load_model(lang):
+    # Cada modelo se carga la primera vez que aparece su idioma y queda en memoria
+    name = MODELS.get(lang)
+    if not name:
+        return None
+    with _model_lock:
+        import spacy
+        try:
+            logging.info(f"Cargando modelo spaCy {name} para el idioma '{lang}'")
+            return spacy.load(name, exclude=DISABLED_PIPES)
+        except OSError as e:
+            logging.error(f"No se pudo cargar el modelo {name}: {e}")
+            return None
+
+
+def language_sample(text, size=None):
+    # Muestra acotada (principio, mitad y final) en lugar del texto completo
+    size = size or Config.NLP_LANG_SAMPLE_CHARS
+    if len(text) <= size:
+        return text
+    part = size // 3
+    middle = len(text) // 2
+    return ' '.join((text[:part], text[middle - part // 2:middle + part // 2], text[-part:]))
+
+
+def detect_language(text):
+    if len(text) <= 20:
+        logging.warning("Texto demasiado corto para detección de idioma fiable. Se asume que el idioma es inglés.")
+        return 'en'
     try:
-        if len(text) > 20:
-            lang = detect(text)
-            return nlp if lang == 'en' else None
-        else:
-            logging.warning("Texto demasiado corto para detección de idioma fiable. Se asume que el idioma es inglés.")
-            return nlp
+        return detect(language_sample(text))
     except Exception as e:
         logging.error(f"Error detectando el idioma: {str(e)}")
         return None
+
+
+def get_nlp_model(text):
+    lang = detect_language(text)
+    return load_model(lang) if lang else None
+
+
+def chunk_text(text, max_chars=None, chunk_chars=None):
+    # Se limita el texto total y se trocea por espacios para no pasar a spaCy
+    # documentos enormes de una sola vez
+    max_chars = max_chars or Config.NLP_MAX_CHARS
+    chunk_chars = chunk_chars or Config.NLP_CHUNK_CHARS
+    text = text[:max_chars]
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_chars, len(text))
+        if end < len(text):
+            space = text.rfind(' ', start, end)
+            if space > start:
+                end = space
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+
+def detect_languages(texts):
+    return [detect_language(text) if text else None for text in texts]
+
+
+def extract_entities_batch(texts, langs=None):
+    # Agrupa los textos por idioma y los procesa con nlp.pipe por lotes
+    entities = [[] for _ in texts]
+    if langs is None:
+        langs = detect_languages(texts)
+    by_lang = {}
+    for index, lang in enumerate(langs):
+        if lang and lang in MODELS:
+            by_lang.setdefault(lang, []).append(index)
+
+    for lang, indexes in by_lang.items():
+        nlp = load_model(lang)
+        if nlp is None:
+            continue
+        owners, chunks = [], []
+        for index in indexes:
+            for chunk in chunk_text(texts[index]):
+                owners.append(index)
+                chunks.append(chunk)
+        for owner, doc in zip(owners, nlp.pipe(chunks, batch_size=Config.NLP_BATCH_SIZE)):
+            entities[owner].extend((ent.text, ent.label_) for ent in doc.ents)
+    return entities
+
+
+class EntityExtractor:
+    """Reparte el reconocimiento de entidades entre ``processes`` procesos (cada uno
+    con sus propios modelos cargados bajo demanda); con 0 se ejecuta en el propio proceso."""
+
+    def __init__(self, processes=None):
+        self.processes = Config.NLP_PROCESSES if processes is None else processes
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                # 'spawn' evita heredar hilos y conexiones del servidor al hacer fork
+                self.executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+            return self.executor
+
+    def extract(self, texts, langs=None):
+        # langs permite detectar el idioma antes (y medirlo por separado) en el propio proceso
+        if not texts:
+            return []
+        if self.processes <= 0 or len(texts) == 1:
+            return extract_entities_batch(texts, langs)
+        if langs is None:
+            langs = detect_languages(texts)
+        # Lotes contiguos, uno por proceso como máximo
+        size = -(-len(texts) // self.processes)
+        starts = range(0, len(texts), size)
+        batches = [texts[start:start + size] for start in starts]
+        lang_batches = [langs[start:start + size] for start in starts]
+        entities = []
+        for batch_entities in self.get_executor().map(extract_entities_batch, batches, lang_batches):
+            entities.extend(batch_entities)
+        return entities
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+
+def get_entity_extractor():
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            _extractor = EntityExtractor()
+    return _extractor
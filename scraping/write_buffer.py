@@ -0,0 +1,146 @@
+# write_buffer.py
+import atexit
+import logging
+import threading
+import time
+import weakref
+
+from config import Config
+
+# Buffers vivos, para vaciarlos si el proceso termina con páginas pendientes
+_active_buffers = weakref.WeakSet()
+
+
+class WriteBehindBuffer:
+    """Acumula páginas y las escribe con DatabaseManager.save_pages en una sola
+    transacción cuando se alcanzan ``max_pages`` o pasan ``flush_interval`` segundos.
+
+    Si la base de datos no da abasto y hay ``max_pending`` páginas sin escribir
+    (en cola o en una transacción en curso), ``add`` bloquea al productor
+    (contrapresión) y lo anota en ``stats``. Si falla la escritura de un lote, sus
+    páginas se guardan de una en una para perder solo las que no se pueden guardar.
+    ``on_saved`` recibe, desde el hilo de escritura, las páginas ya confirmadas.
+    """
+
+    def __init__(self, db_manager, max_pages=None, flush_interval=None, max_pending=None, on_saved=None):
+        self.db_manager = db_manager
+        self.on_saved = on_saved
+        self.max_pages = max_pages or Config.WRITE_BUFFER_MAX_PAGES
+        self.flush_interval = flush_interval or Config.WRITE_BUFFER_FLUSH_INTERVAL
+        self.max_pending = max_pending or Config.WRITE_BUFFER_MAX_PENDING
+        self.pending = []
+        # Páginas sacadas de pending cuya transacción aún no ha terminado
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.closed = False
+        self.last_flush = time.monotonic()
+        self.stats = {'paginas_escritas': 0, 'paginas_fallidas': 0, 'transacciones': 0,
+                      'esperas_contrapresion': 0, 'segundos_contrapresion': 0.0}
+        self.thread = threading.Thread(target=self.run, name='write-behind', daemon=True)
+        self.thread.start()
+        _active_buffers.add(self)
+
+    def add(self, page):
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("El buffer de escritura está cerrado.")
+            if self.unwritten() >= self.max_pending:
+                self.stats['esperas_contrapresion'] += 1
+                logging.warning(f"Buffer de escritura lleno ({self.unwritten()} páginas); esperando a la base de datos.")
+                start_time = time.monotonic()
+                while self.unwritten() >= self.max_pending and not self.closed:
+                    self.condition.wait()
+                self.stats['segundos_contrapresion'] += time.monotonic() - start_time
+            self.pending.append(page)
+            if len(self.pending) >= self.max_pages:
+                self.condition.notify_all()
+
+    def unwritten(self):
+        # Llamar con self.condition adquirida
+        return len(self.pending) + self.in_flight
+
+    def is_saturated(self):
+        with self.condition:
+            return self.unwritten() >= self.max_pending
+
+    def pending_count(self):
+        with self.condition:
+            return self.unwritten()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.closed and len(self.pending) < self.max_pages:
+                    remaining = self.flush_interval - (time.monotonic() - self.last_flush)
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                if self.closed:
+                    return
+            self.flush()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.condition:
+                # Las páginas siguen contando para la contrapresión hasta que se escriben
+                pages, self.pending = self.pending, []
+                self.in_flight += len(pages)
+                self.last_flush = time.monotonic()
+            for start in range(0, len(pages), self.max_pages):
+                batch = pages[start:start + self.max_pages]
+                try:
+                    self.write(batch)
+                finally:
+                    with self.condition:
+                        self.in_flight -= len(batch)
+                        self.condition.notify_all()
+
+    def write(self, pages):
+        saved = self.db_manager.save_pages(pages)
+        with self.condition:
+            self.stats['transacciones'] += 1
+        if saved:
+            written, failed = pages, []
+        else:
+            # Página a página: un fallo transitorio se resuelve al reintentar y una
+            # página que no se puede guardar no arrastra al resto del lote
+            logging.warning(f"No se pudo guardar un lote de {len(pages)} páginas; se reintenta página a página.")
+            written, failed = [], []
+            for page in pages:
+                if self.db_manager.save_pages([page]):
+                    written.append(page)
+                else:
+                    failed.append(page)
+            with self.condition:
+                self.stats['transacciones'] += len(pages)
+        with self.condition:
+            self.stats['paginas_escritas'] += len(written)
+            self.stats['paginas_fallidas'] += len(failed)
+        for page in failed:
+            logging.error(f"Se descarta la página {page['url']}: no se pudo guardar.")
+        if written and self.on_saved:
+            try:
+                self.on_saved(written)
+            except Exception as e:
+                logging.error(f"Error tras guardar {len(written)} páginas: {e}")
+
+    def close(self):
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.flush()
+        _active_buffers.discard(self)
+        logging.info(f"Buffer de escritura cerrado: {self.stats}")
+
+
+@atexit.register
+def flush_all_buffers():
+    for buffer in list(_active_buffers):
+        try:
+            buffer.close()
+        except Exception as e:
+            logging.error(f"Error vaciando el buffer de escritura al salir: {e}")